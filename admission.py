@@ -0,0 +1,150 @@
+"""
+Admission control for POST /api/battle.
+
+Every battle fans out to 8 provider calls, so letting every submission run
+at once only makes all of them slow (thread pool, provider rate limits).
+The controller lets settings.battle_max_concurrent battles run; the others
+wait in a bounded queue, interactive requests (ChatTab) ahead of batch
+ones, and are let in one by one as running battles finish.
+
+A request gets a fast 503 with Retry-After instead of waiting when:
+- the queue already holds settings.battle_queue_size requests, or
+- its expected wait (from the recent battle duration) is over the
+  queue-time SLO, settings.battle_queue_timeout_s
+and it gets one after waiting that long without being let in.
+
+state() is served by /api/metrics: running and queued battles, rejections
+per reason and priority, and quantiles of the time admitted requests
+waited (sketches.py).
+"""
+import math
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+from config import settings
+from sketches import DDSketch
+
+PRIORITIES = ("interactive", "batch")  # Served in this order
+
+SERVICE_TIME_WEIGHT = 0.1  # Weight of the latest battle in the moving average of durations
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout_s: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout_s = queue_timeout_s
+        self.running = 0
+        self.queues: Dict[str, Deque[asyncio.Future]] = {priority: deque() for priority in PRIORITIES}
+        self.service_time: Optional[float] = None  # Moving average of battle durations (seconds)
+        self.queue_time = DDSketch()
+        self.counters = {
+            priority: {"admitted": 0, "queue_full": 0, "over_slo": 0, "timed_out": 0}
+            for priority in PRIORITIES
+        }
+
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    def expected_wait(self, ahead: int) -> Optional[float]:
+        """Seconds until a request with `ahead` requests before it gets a slot, once durations are known"""
+        if self.service_time is None:
+            return None
+        if self.running < self.max_concurrent and not ahead:
+            return 0.0
+        # Each wave of max_concurrent finishing battles lets in as many waiters
+        return (ahead // self.max_concurrent + 1) * self.service_time
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.expected_wait(self.queued()) or 1))
+
+    def reject(self, priority: str, reason: str):
+        self.counters[priority][reason] += 1
+        raise AdmissionRejected(reason, self.retry_after())
+
+    async def acquire(self, priority: str = "interactive"):
+        """Wait for a slot; raises AdmissionRejected instead of waiting too long"""
+        if priority not in self.queues:
+            raise ValueError(f"priority must be one of {', '.join(PRIORITIES)}")
+        ahead = sum(len(self.queues[p]) for p in PRIORITIES[:PRIORITIES.index(priority) + 1])
+        if self.running < self.max_concurrent and not ahead:
+            self.running += 1
+            self.counters[priority]["admitted"] += 1
+            self.queue_time.add(0.0)
+            return
+        if self.queued() >= self.max_queue:
+            self.reject(priority, "queue_full")
+        expected = self.expected_wait(ahead)
+        if expected is not None and expected > self.queue_timeout_s:
+            self.reject(priority, "over_slo")
+
+        queue = self.queues[priority]
+        future = asyncio.get_running_loop().create_future()
+        queue.append(future)
+        started = time.monotonic()
+        try:
+            # release() hands its slot over by resolving the future (running stays the same)
+            await asyncio.wait_for(future, self.queue_timeout_s)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future in queue:
+                queue.remove(future)
+            if future.done() and not future.cancelled():
+                # The slot arrived as the client went away: pass it on
+                self.release()
+            if isinstance(e, asyncio.TimeoutError):
+                self.reject(priority, "timed_out")
+            raise
+        self.counters[priority]["admitted"] += 1
+        self.queue_time.add(time.monotonic() - started)
+
+    def release(self, duration: Optional[float] = None):
+        """Give the slot to the next waiter, or free it"""
+        if duration is not None:
+            self.service_time = duration if self.service_time is None else (
+                SERVICE_TIME_WEIGHT * duration + (1 - SERVICE_TIME_WEIGHT) * self.service_time
+            )
+        for priority in PRIORITIES:
+            queue = self.queues[priority]
+            while queue:
+                future = queue.popleft()
+                if not future.done():
+                    future.set_result(None)
+                    return
+        self.running -= 1
+
+    @asynccontextmanager
+    async def admit(self, priority: str = "interactive"):
+        await self.acquire(priority)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def state(self) -> Dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "queue_timeout_s": self.queue_timeout_s,
+            "running": self.running,
+            "queued": {priority: len(queue) for priority, queue in self.queues.items()},
+            "service_time_s": self.service_time,
+            "expected_wait_s": self.expected_wait(self.queued()),
+            "queue_time": self.queue_time.summary() if self.queue_time.count else None,
+            "counters": self.counters,
+        }
+
+
+admission = AdmissionController(
+    settings.battle_max_concurrent, settings.battle_queue_size, settings.battle_queue_timeout_s
+)
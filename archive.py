@@ -0,0 +1,409 @@
+"""
+Columnar archive of historical battles.
+
+archive_before() streams battles, responses and ratings created before a
+cutoff into Parquet files, one per table per calendar month:
+
+    archive/
+        manifest.json
+        battles/2025-01.parquet
+        responses/2025-01.parquet
+        ratings/2025-01.parquet
+
+The archive always covers one contiguous range: everything created before
+manifest["archived_before"] (a month boundary). Each run extends it, so a
+query over all history reads created_at < archived_before from Parquet
+(with DuckDB) and the rest from SQLite, and never counts a battle twice,
+whether or not the archived rows were pruned.
+
+prune_archived() deletes archived battles from the hot tables. The
+leaderboard (model_stats, total_battles) is all-time, so pruning leaves it
+unchanged; the manifest keeps each month's per-model totals so
+rebuild_model_stats() can add pruned months back. Screenshots stay in the
+blob store, referenced by image_hash from the archive.
+
+pyarrow (writing) and duckdb (querying) are optional: pip install pyarrow duckdb
+"""
+import os
+import json
+import asyncio
+import importlib
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, delete, func, tuple_
+
+from config import settings
+from database import Battle, Response, Rating, WinnerDecision
+from model_stats import STAT_COLUMNS, bump_data_version
+import search
+
+MANIFEST_VERSION = 1
+
+ARCHIVE_TABLES = ("battles", "responses", "ratings")
+
+
+class ArchiveUnavailable(RuntimeError):
+    """An optional dependency needed for the archive is not installed"""
+
+
+def require(module: str):
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        raise ArchiveUnavailable(f"The battle archive needs {module}: pip install pyarrow duckdb")
+
+
+def month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1)
+
+
+def next_month(moment: datetime) -> datetime:
+    return datetime(moment.year + moment.month // 12, moment.month % 12 + 1, 1)
+
+
+def month_key(moment: datetime) -> str:
+    return moment.strftime("%Y-%m")
+
+
+class Archive:
+    """Parquet files and manifest under `root`"""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.manifest_path = self.root / "manifest.json"
+
+    def path_for(self, table: str, month: str) -> Path:
+        return self.root / table / f"{month}.parquet"
+
+    def load_manifest(self) -> Dict:
+        if not self.manifest_path.exists():
+            return {"version": MANIFEST_VERSION, "archived_before": None, "months": {}}
+        return json.loads(self.manifest_path.read_text())
+
+    def save_manifest(self, manifest: Dict):
+        # Write-then-rename so a crash never leaves a half-written manifest
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".manifest-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def archived_before(self) -> Optional[datetime]:
+        boundary = self.load_manifest()["archived_before"]
+        return datetime.fromisoformat(boundary) if boundary else None
+
+    def files(self, table: str) -> List[str]:
+        manifest = self.load_manifest()
+        return [
+            str(self.path_for(table, month))
+            for month, entry in sorted(manifest["months"].items()) if entry["battles"]
+        ]
+
+
+archive = Archive(settings.archive_path)
+
+
+def arrow_schemas():
+    pa = require("pyarrow")
+    return {
+        "battles": pa.schema([
+            ("id", pa.int64()),
+            ("created_at", pa.timestamp("us")),
+            ("prompt", pa.string()),
+            ("image_hash", pa.string()),
+            ("winner_model", pa.string()),
+        ]),
+        "responses": pa.schema([
+            ("id", pa.int64()),
+            ("battle_id", pa.int64()),
+            ("model_name", pa.string()),
+            ("response_text", pa.string()),
+            ("average_score", pa.float64()),
+            ("is_winner", pa.int8()),
+        ]),
+        "ratings": pa.schema([
+            ("id", pa.int64()),
+            ("battle_id", pa.int64()),
+            ("response_id", pa.int64()),
+            ("judge_model", pa.string()),
+            ("score", pa.float64()),
+            ("reasoning", pa.string()),
+        ]),
+    }
+
+
+class MonthWriter:
+    """Streams one month into a temporary Parquet file per table, renamed into place on close"""
+
+    def __init__(self, month: str, schemas: Dict):
+        pq = require("pyarrow.parquet")
+        self.pa = require("pyarrow")
+        self.month = month
+        self.schemas = schemas
+        self.writers = {}
+        self.paths = {}
+        self.counts = {table: 0 for table in ARCHIVE_TABLES}
+        for table in ARCHIVE_TABLES:
+            final = archive.path_for(table, month)
+            final.parent.mkdir(parents=True, exist_ok=True)
+            self.paths[table] = (final.with_suffix(".parquet.tmp"), final)
+            self.writers[table] = pq.ParquetWriter(
+                str(self.paths[table][0]), schemas[table], compression="zstd"
+            )
+
+    def write(self, table: str, rows: List[Dict]):
+        if rows:
+            self.writers[table].write_table(self.pa.Table.from_pylist(rows, schema=self.schemas[table]))
+            self.counts[table] += len(rows)
+
+    def close(self) -> int:
+        """Finish all files and return their total size in bytes"""
+        size = 0
+        for table, writer in self.writers.items():
+            writer.close()
+            tmp_path, final = self.paths[table]
+            os.replace(tmp_path, final)
+            size += final.stat().st_size
+        return size
+
+    def abort(self):
+        for table, writer in self.writers.items():
+            writer.close()
+            self.paths[table][0].unlink(missing_ok=True)
+
+
+def add_model_totals(totals: Dict[str, Dict], model_name: str, average_score: Optional[float], is_winner: int):
+    entry = totals.setdefault(model_name, {column: 0 for column in STAT_COLUMNS})
+    entry["battles"] += 1
+    entry["wins"] += 1 if is_winner else 0
+    if average_score is not None:
+        entry["score_count"] += 1
+        entry["score_sum"] += average_score
+        entry["score_sumsq"] += average_score * average_score
+
+
+async def archive_month(session, start: datetime, end: datetime, schemas: Dict, chunk_size: int) -> Optional[Dict]:
+    """
+    Stream the battles created in [start, end) and their responses and
+    ratings into the month's files, chunk_size battles at a time. Returns the
+    manifest entry, or None if the month has no battles.
+    """
+    writer = None
+    totals: Dict[str, Dict] = {}
+    position = (start, 0)
+    try:
+        while True:
+            battles = (await session.execute(
+                select(Battle.id, Battle.created_at, Battle.prompt, Battle.image_hash, Battle.winner_model)
+                .where(tuple_(Battle.created_at, Battle.id) > tuple_(*position), Battle.created_at < end)
+                .order_by(Battle.created_at, Battle.id)
+                .limit(chunk_size)
+            )).mappings().all()
+            if not battles:
+                break
+            position = (battles[-1]["created_at"], battles[-1]["id"])
+            battle_ids = [battle["id"] for battle in battles]
+
+            responses = (await session.execute(
+                select(Response.id, Response.battle_id, Response.model_name, Response.response_text,
+                       Response.average_score, Response.is_winner)
+                .where(Response.battle_id.in_(battle_ids))
+            )).mappings().all()
+            ratings = (await session.execute(
+                select(Rating.id, Rating.battle_id, Rating.response_id, Rating.judge_model,
+                       Rating.score, Rating.reasoning)
+                .where(Rating.battle_id.in_(battle_ids))
+            )).mappings().all()
+
+            if writer is None:
+                writer = MonthWriter(month_key(start), schemas)
+            writer.write("battles", [dict(row) for row in battles])
+            writer.write("responses", [dict(row) for row in responses])
+            writer.write("ratings", [dict(row) for row in ratings])
+            for row in responses:
+                add_model_totals(totals, row["model_name"], row["average_score"], row["is_winner"])
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+
+    if writer is None:
+        return None
+    size = writer.close()
+    return {
+        **writer.counts,
+        "bytes": size,
+        "archived_at": datetime.utcnow().isoformat(),
+        "pruned": False,
+        "model_totals": totals,
+    }
+
+
+async def archive_before(session, cutoff: datetime, chunk_size: int = 500) -> List[str]:
+    """
+    Archive every whole month before `cutoff` that is not archived yet and
+    move manifest["archived_before"] up to the cutoff's month. Returns the
+    months written. Safe to stop and re-run: the manifest is saved after
+    each month.
+    """
+    schemas = arrow_schemas()
+    cutoff = month_start(cutoff)
+    manifest = archive.load_manifest()
+
+    if manifest["archived_before"]:
+        start = datetime.fromisoformat(manifest["archived_before"])
+    else:
+        oldest = (await session.execute(select(func.min(Battle.created_at)))).scalar()
+        if oldest is None:
+            return []
+        start = month_start(oldest)
+
+    written = []
+    while start < cutoff:
+        end = next_month(start)
+        entry = await archive_month(session, start, end, schemas, chunk_size)
+        if entry:
+            manifest["months"][month_key(start)] = entry
+            written.append(month_key(start))
+            print(f"   {month_key(start)}: {entry['battles']} battles, {entry['responses']} responses, "
+                  f"{entry['ratings']} ratings ({entry['bytes'] / 1024 / 1024:.2f} MB)")
+        manifest["archived_before"] = end.isoformat()
+        archive.save_manifest(manifest)
+        start = end
+    return written
+
+
+async def prune_archived(session, chunk_size: int = 500) -> int:
+    """
+    Delete archived battles from the hot tables, committing every chunk_size
+    battles. A month is only pruned when the hot tables still hold exactly
+    the battles its files do (nothing was added to it after archiving).
+    Returns the number of battles deleted.
+    """
+    manifest = archive.load_manifest()
+    pruned = 0
+    for month, entry in sorted(manifest["months"].items()):
+        if entry["pruned"]:
+            continue
+        start = datetime.strptime(month, "%Y-%m")
+        end = next_month(start)
+        in_month = (Battle.created_at >= start, Battle.created_at < end)
+
+        hot_count = (await session.execute(select(func.count(Battle.id)).where(*in_month))).scalar()
+        if hot_count != entry["battles"]:
+            print(f"   ⚠️  {month}: {hot_count} battles in the database but {entry['battles']} archived, not pruning")
+            continue
+
+        while True:
+            battle_ids = (await session.execute(
+                select(Battle.id).where(*in_month).limit(chunk_size)
+            )).scalars().all()
+            if not battle_ids:
+                break
+            # Leaderboard totals and screenshot references are left as they are (see module docstring)
+            await search.unindex_battles(session, battle_ids)
+            await session.execute(delete(Rating).where(Rating.battle_id.in_(battle_ids)))
+            await session.execute(delete(WinnerDecision).where(WinnerDecision.battle_id.in_(battle_ids)))
+            await session.execute(delete(Response).where(Response.battle_id.in_(battle_ids)))
+            await session.execute(delete(Battle).where(Battle.id.in_(battle_ids)))
+            await bump_data_version(session)
+            await session.commit()
+            pruned += len(battle_ids)
+
+        entry["pruned"] = True
+        archive.save_manifest(manifest)
+        print(f"   {month}: pruned {entry['battles']} battles from the database")
+    return pruned
+
+
+def pruned_model_totals() -> Tuple[Dict[str, Dict], int]:
+    """({model: totals}, battle count) summed over pruned months, for rebuild_model_stats()"""
+    totals: Dict[str, Dict] = {}
+    battles = 0
+    for entry in archive.load_manifest()["months"].values():
+        if not entry["pruned"]:
+            continue
+        battles += entry["battles"]
+        for model_name, model_totals in entry["model_totals"].items():
+            combined = totals.setdefault(model_name, {column: 0 for column in STAT_COLUMNS})
+            for column in STAT_COLUMNS:
+                combined[column] += model_totals[column]
+    return totals, battles
+
+
+def query_archive(sql: str, params: Optional[list] = None) -> List[tuple]:
+    """
+    Run a DuckDB query over the archive. The views battles, responses and
+    ratings read every month's Parquet files. Blocking; call from a thread.
+    """
+    duckdb = require("duckdb")
+    conn = duckdb.connect()
+    try:
+        for table in ARCHIVE_TABLES:
+            files = archive.files(table)
+            if files:
+                conn.execute(f"CREATE VIEW {table} AS SELECT * FROM read_parquet({files!r})")
+            else:
+                # Empty view with the right columns so queries still run
+                schema = arrow_schemas()[table]
+                conn.register(f"{table}_empty", schema.empty_table())
+                conn.execute(f"CREATE VIEW {table} AS SELECT * FROM {table}_empty")
+        return conn.execute(sql, params or []).fetchall()
+    finally:
+        conn.close()
+
+
+MONTHLY_MODEL_STATS_SQL = """
+    SELECT strftime(battles.created_at, '%Y-%m') AS month, responses.model_name,
+           count(*) AS battles, sum(responses.is_winner) AS wins, avg(responses.average_score) AS average_score
+    FROM responses JOIN battles ON battles.id = responses.battle_id
+    WHERE battles.created_at >= ? AND battles.created_at < ?
+    GROUP BY 1, 2
+"""
+
+
+async def monthly_model_stats(session, since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[Dict]:
+    """
+    Per month and model: responses, wins and average score over hot and
+    archived battles together. Months before archived_before come from the
+    Parquet files (DuckDB), later months from SQLite.
+    """
+    since = month_start(since) if since else datetime(1970, 1, 1)
+    until = until or datetime.utcnow() + timedelta(days=1)
+    boundary = archive.archived_before()
+
+    rows = []
+    if boundary and since < boundary:
+        archived = await asyncio.to_thread(
+            query_archive, MONTHLY_MODEL_STATS_SQL, [since, min(until, boundary)]
+        )
+        rows.extend(archived)
+
+    hot_since = max(since, boundary) if boundary else since
+    if hot_since < until:
+        month = func.strftime("%Y-%m", Battle.created_at)
+        hot = await session.execute(
+            select(month, Response.model_name, func.count(Response.id),
+                   func.sum(Response.is_winner), func.avg(Response.average_score))
+            .join(Battle, Battle.id == Response.battle_id)
+            .where(Battle.created_at >= hot_since, Battle.created_at < until)
+            .group_by(month, Response.model_name)
+        )
+        rows.extend(hot.all())
+
+    return sorted(
+        (
+            {
+                "month": month,
+                "model": model_name,
+                "battles": battles,
+                "wins": int(wins or 0),
+                "average_score": average_score or 0.0,
+            }
+            for month, model_name, battles, wins, average_score in rows
+        ),
+        key=lambda row: (row["month"], row["model"])
+    )
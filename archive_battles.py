@@ -0,0 +1,68 @@
+"""
+Move old battles into the columnar archive (see archive.py).
+
+Writes one Parquet file per table per month for every whole month before
+the cutoff, updates archive/manifest.json and, with --prune, deletes the
+archived battles from battles.db. The leaderboard keeps counting pruned
+battles and /api/stats/monthly reads them from the archive.
+
+Requires pyarrow and duckdb (pip install pyarrow duckdb).
+
+Usage:
+    python archive_battles.py --older-than-days 180 [--prune]
+    python archive_battles.py --before 2025-01 [--prune]
+    python archive_battles.py --status
+"""
+import asyncio
+import argparse
+from datetime import datetime, timedelta
+
+from database import init_db, AsyncSessionLocal
+from archive import archive, archive_before, prune_archived, ArchiveUnavailable
+
+
+def print_status():
+    manifest = archive.load_manifest()
+    if not manifest["months"]:
+        print("📦 Archive is empty")
+        return
+    print(f"📦 Archive at {archive.root}, covers battles before {manifest['archived_before']}")
+    for month, entry in sorted(manifest["months"].items()):
+        state = "pruned" if entry["pruned"] else "also in database"
+        print(f"   {month}: {entry['battles']} battles, {entry['bytes'] / 1024 / 1024:.2f} MB ({state})")
+
+
+async def run(cutoff: datetime, prune: bool):
+    await init_db()
+
+    async with AsyncSessionLocal() as db:
+        print(f"📦 Archiving whole months before {cutoff:%Y-%m}...")
+        written = await archive_before(db, cutoff)
+        print(f"✅ Archived {len(written)} months")
+
+        if prune:
+            print("🧹 Pruning archived battles from the database...")
+            pruned = await prune_archived(db)
+            print(f"✅ Pruned {pruned} battles (VACUUM battles.db to return the space to the filesystem)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--older-than-days", type=int, help="Archive months that ended at least this many days ago")
+    group.add_argument("--before", help="Archive months before this one (YYYY-MM)")
+    group.add_argument("--status", action="store_true", help="Show the manifest")
+    parser.add_argument("--prune", action="store_true", help="Delete archived battles from the database")
+    args = parser.parse_args()
+
+    if args.status:
+        print_status()
+    else:
+        if args.before:
+            cutoff = datetime.strptime(args.before, "%Y-%m")
+        else:
+            cutoff = datetime.utcnow() - timedelta(days=args.older_than_days)
+        try:
+            asyncio.run(run(cutoff, args.prune))
+        except ArchiveUnavailable as e:
+            print(f"❌ {e}")
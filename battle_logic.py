@@ -5,12 +5,16 @@ import time
 import statistics
 from typing import List, Dict, Tuple, Optional, Set
 from llm_clients import clients, model_names
+from config import settings
+from judge_input import build_judge_digest
+from provider_health import provider_health
 
 
 def determine_winner(
     average_scores: Dict[str, float],
     parsed_ratings: Dict[str, Dict[str, Dict]],
-    all_models: List[str]
+    all_models: List[str],
+    verbose: bool = True
 ) -> Tuple[str, Dict]:
     """
     Determine winner with multi-level tiebreaker:
@@ -19,6 +23,8 @@ def determine_winner(
     3. Lowest variance (most consistent)
     4. Head-to-head comparison (most pairwise wins)
     5. Declare multiple winners if still tied
+    
+    verbose=False skips the tie progress output (for bulk recomputes).
     """
     tiebreaker_info = {
         "method": "average_score",
@@ -40,7 +46,8 @@ def determine_winner(
     tiebreaker_info["tied_models"] = tied_models.copy()
     tiebreaker_info["tiebreaker_levels_used"].append("average_score")
     
-    print(f"⚔️  Tie detected at {max_avg_score:.2f} average: {', '.join(tied_models)}")
+    if verbose:
+        print(f"⚔️  Tie detected at {max_avg_score:.2f} average: {', '.join(tied_models)}")
     
     # Level 1: Highest maximum score (best single judge rating)
     max_scores = {}
@@ -61,11 +68,13 @@ def determine_winner(
     if len(tied_models) == 1:
         tiebreaker_info["method"] = "max_score"
         tiebreaker_info["tiebreaker_levels_used"].append("max_score")
-        print(f"  ✅ Tiebreaker: Highest max score ({max_max_score:.2f}) - Winner: {tied_models[0]}")
+        if verbose:
+            print(f"  ✅ Tiebreaker: Highest max score ({max_max_score:.2f}) - Winner: {tied_models[0]}")
         return tied_models[0], tiebreaker_info
     
     tiebreaker_info["tiebreaker_levels_used"].append("max_score")
-    print(f"  ⚔️  Still tied after max score ({max_max_score:.2f}): {', '.join(tied_models)}")
+    if verbose:
+        print(f"  ⚔️  Still tied after max score ({max_max_score:.2f}): {', '.join(tied_models)}")
     
     # Level 2: Lowest variance (most consistent)
     variances = {}
@@ -93,11 +102,13 @@ def determine_winner(
     if len(tied_models) == 1:
         tiebreaker_info["method"] = "lowest_variance"
         tiebreaker_info["tiebreaker_levels_used"].append("lowest_variance")
-        print(f"  ✅ Tiebreaker: Lowest variance ({min_variance:.4f}) - Winner: {tied_models[0]}")
+        if verbose:
+            print(f"  ✅ Tiebreaker: Lowest variance ({min_variance:.4f}) - Winner: {tied_models[0]}")
         return tied_models[0], tiebreaker_info
     
     tiebreaker_info["tiebreaker_levels_used"].append("lowest_variance")
-    print(f"  ⚔️  Still tied after variance check: {', '.join(tied_models)}")
+    if verbose:
+        print(f"  ⚔️  Still tied after variance check: {', '.join(tied_models)}")
     
     # Level 3: Head-to-head comparison (count pairwise wins)
     head_to_head_wins = {model: 0 for model in tied_models}
@@ -128,7 +139,8 @@ def determine_winner(
     if len(tied_models) == 1:
         tiebreaker_info["method"] = "head_to_head"
         tiebreaker_info["tiebreaker_levels_used"].append("head_to_head")
-        print(f"  ✅ Tiebreaker: Head-to-head wins ({max_wins:.2f}) - Winner: {tied_models[0]}")
+        if verbose:
+            print(f"  ✅ Tiebreaker: Head-to-head wins ({max_wins:.2f}) - Winner: {tied_models[0]}")
         return tied_models[0], tiebreaker_info
     
     tiebreaker_info["tiebreaker_levels_used"].append("head_to_head")
@@ -136,8 +148,9 @@ def determine_winner(
     # Final: Still tied - return first one alphabetically (or could be "multiple winners")
     # For now, we'll return the first one but mark it as a tie
     tiebreaker_info["method"] = "alphabetical_fallback"
-    print(f"  ⚠️  Still tied after all tiebreakers - using alphabetical order")
-    print(f"     Final winner: {sorted(tied_models)[0]} (tied with {', '.join(sorted(tied_models)[1:])})")
+    if verbose:
+        print(f"  ⚠️  Still tied after all tiebreakers - using alphabetical order")
+        print(f"     Final winner: {sorted(tied_models)[0]} (tied with {', '.join(sorted(tied_models)[1:])})")
     
     return sorted(tied_models)[0], tiebreaker_info
 
@@ -208,6 +221,7 @@ async def run_battle(prompt: str, conversation_history: Optional[list] = None, i
                     print(f"✅ {client_name} response succeeded on retry ({call_duration:.2f}s)")
                 else:
                     print(f"⏱️  {client_name} response: {call_duration:.2f}s")
+                provider_health.record(client_name, "response", call_duration, attempts=attempt + 1)
                 return client_name, response_text, call_duration
             except asyncio.CancelledError:
                 # Re-raise cancelled errors - they indicate task cancellation and should propagate
@@ -222,6 +236,7 @@ async def run_battle(prompt: str, conversation_history: Optional[list] = None, i
                 else:
                     # Final attempt failed
                     print(f"❌ Error getting response from {client_name} after {attempt + 1} attempts ({call_duration:.2f}s): {e}")
+                    provider_health.record(client_name, "response", call_duration, attempts=attempt + 1, failed=True)
                     return client_name, f"Error: {str(e)}", call_duration
     
     # Run all 4 API calls in parallel
@@ -256,14 +271,25 @@ async def run_battle(prompt: str, conversation_history: Optional[list] = None, i
     print(f"📊 Step 1 (Get responses): {step1_duration:.2f}s")
     
     # Step 2: Create rating prompt
+    # Answers are compacted to a token budget once and the digest is shared by all judges
     step2_start = time.time()
+    judge_responses, judge_input_info = build_judge_digest(
+        responses,
+        settings.judge_input_max_tokens,
+        num_judges=len(clients),
+        head_ratio=settings.judge_input_head_ratio
+    )
     responses_list = []
-    for i, (client_name, response_text) in enumerate(responses.items(), 1):
+    for i, (client_name, response_text) in enumerate(judge_responses.items(), 1):
         responses_list.append(f"Response {i} (from {model_names[client_name]}):\n{response_text}")
     
     step2_duration = time.time() - step2_start
     timing_info["step2_create_prompt"] = step2_duration
     print(f"📊 Step 2 (Create rating prompt): {step2_duration:.2f}s")
+    if judge_input_info["truncated_models"]:
+        print(f"✂️  Judge input compacted for {', '.join(judge_input_info['truncated_models'])}: "
+              f"{judge_input_info['original_tokens']} → {judge_input_info['judge_tokens']} tokens per judge, "
+              f"~{judge_input_info['tokens_saved']} tokens saved this battle")
     
     # Build rating prompt with image context if present
     prompt_context = prompt
@@ -306,6 +332,7 @@ Respond with a JSON object in this exact format:
                     print(f"✅ {client_name} rating succeeded on retry ({call_duration:.2f}s)")
                 else:
                     print(f"⏱️  {client_name} rating: {call_duration:.2f}s")
+                provider_health.record(client_name, "rating", call_duration, attempts=attempt + 1)
                 return client_name, rating_response, call_duration
             except asyncio.CancelledError:
                 # Re-raise cancelled errors - they indicate task cancellation and should propagate
@@ -320,6 +347,7 @@ Respond with a JSON object in this exact format:
                 else:
                     # Final attempt failed
                     print(f"❌ Error getting rating from {client_name} after {attempt + 1} attempts ({call_duration:.2f}s): {e}")
+                    provider_health.record(client_name, "rating", call_duration, attempts=attempt + 1, failed=True)
                     return client_name, "", call_duration
     
     # Run all 4 rating calls in parallel
@@ -447,9 +475,11 @@ Respond with a JSON object in this exact format:
     step5_duration = time.time() - step5_start
     timing_info["step5_calculate_scores"] = step5_duration
     
-    # Step 6: Determine winner with multi-level tiebreaker
-    winner, tiebreaker_info = determine_winner(
-        average_scores, parsed_ratings, responses.keys()
+    # Step 6: Determine winner with the live winner policy (multi-level tiebreaker by default)
+    from winner_policies import current_policy
+    policy = current_policy()
+    winner, tiebreaker_info = policy.decide(
+        average_scores, parsed_ratings, list(responses.keys())
     )
     
     total_duration = time.time() - start_time
@@ -463,6 +493,7 @@ Respond with a JSON object in this exact format:
     print(f"Step 1 (Get responses): {timing_info['step1_get_responses']:.2f}s")
     print(f"  - Individual: {', '.join([f'{k}: {v:.2f}s' for k, v in response_timings.items()])}")
     print(f"Step 2 (Create prompt): {timing_info['step2_create_prompt']:.2f}s")
+    print(f"  - Judge input: {judge_input_info['judge_tokens']} tokens per judge ({judge_input_info['tokens_saved']} saved)")
     print(f"Step 3 (Get ratings): {timing_info['step3_get_ratings']:.2f}s")
     print(f"  - Individual: {', '.join([f'{k}: {v:.2f}s' for k, v in rating_timings.items()])}")
     print(f"Step 4 (Parse ratings): {timing_info['step4_parse_ratings']:.2f}s")
@@ -477,7 +508,9 @@ Respond with a JSON object in this exact format:
         "parsed_ratings": parsed_ratings,
         "average_scores": average_scores,
         "winner": winner,
+        "winner_policy": policy.key,
         "tiebreaker_info": tiebreaker_info,
+        "judge_input": judge_input_info,
         "model_names": model_names,
         "timing_info": timing_info
     }
@@ -0,0 +1,81 @@
+"""
+Benchmark GET /api/battles paging: keyset cursors vs LIMIT/OFFSET.
+
+Seeds a database with --battles battles (reused if the file already exists,
+same seed as benchmarks.read_path), then times fetching a 50-row page at
+increasing depths:
+- offset:  SELECT ... ORDER BY created_at DESC LIMIT 50 OFFSET depth
+- keyset:  queries.list_battles with the cursor of the row at that depth
+
+Usage:
+    python -m benchmarks.battle_list [--battles 100000] [--db /tmp/arena-bench-read-path.db]
+"""
+import os
+import time
+import asyncio
+import argparse
+
+
+async def timed(call, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await call()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--battles", type=int, default=100_000)
+    parser.add_argument("--db", default="/tmp/arena-bench-read-path.db")
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    # The app modules read their database location from settings at import time
+    os.environ["DATABASE_PATH"] = args.db
+    if not os.path.exists(args.db):
+        from benchmarks.read_path import seed
+        print(f"Seeding {args.db}")
+        await seed(args.db, args.battles)
+
+    from sqlalchemy import select
+    import database
+    from database import Battle, init_db
+    from queries import BATTLE_LIST_COLUMNS, list_battles, encode_cursor
+
+    # Older benchmark databases predate the listing columns
+    await init_db()
+
+    print(f"\n{args.battles} battles, {args.page_size}-row pages, mean of {args.repeat} runs\n")
+    print(f"  {'depth':>10} {'offset ms':>10} {'keyset ms':>10}")
+    async with database.ReadSessionLocal() as session:
+        depth = 0
+        while depth < args.battles:
+            async def offset_page(depth=depth):
+                await session.execute(
+                    select(*BATTLE_LIST_COLUMNS)
+                    .order_by(Battle.created_at.desc(), Battle.id.desc())
+                    .offset(depth).limit(args.page_size)
+                )
+
+            # Cursor of the row just before this depth, as a client that paged there would hold
+            cursor = None
+            if depth:
+                row = (await session.execute(
+                    select(Battle.created_at, Battle.id)
+                    .order_by(Battle.created_at.desc(), Battle.id.desc())
+                    .offset(depth - 1).limit(1)
+                )).one()
+                cursor = encode_cursor(row.created_at, row.id)
+
+            async def keyset_page(cursor=cursor):
+                await list_battles(session, limit=args.page_size, cursor=cursor)
+
+            offset_ms = await timed(offset_page, args.repeat)
+            keyset_ms = await timed(keyset_page, args.repeat)
+            print(f"  {depth:>10} {offset_ms:>10.2f} {keyset_ms:>10.2f}")
+            depth = depth * 10 if depth else 100
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+"""
+Benchmark bulk import (importer.py) against saving the same battles one
+transaction each with persist_battle.
+
+The battles (4 responses, 16 ratings with reasoning) are encoded as NDJSON
+in the /api/export format up front; the import path includes parsing and
+validating every line. A second import of the same lines measures the
+duplicate check alone.
+
+Usage:
+    python -m benchmarks.bulk_import [--battles 20000] [--response-words 300] [--batch-size 5000]
+"""
+import json
+import time
+import asyncio
+import argparse
+from typing import AsyncIterator, Dict, List
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from persistence import persist_battle
+from importer import import_lines
+from storage import create_write_engine
+from benchmarks.common import make_results, temp_database_path, create_schema
+
+
+def export_line(results: Dict) -> bytes:
+    return json.dumps({
+        "prompt": results["prompt"],
+        "responses": [
+            {
+                "model": model,
+                "text": text,
+                "average_score": results["average_scores"][model],
+                "latency_s": results["timing_info"]["response_timings"][model],
+                "ratings": [
+                    {"judge": judge, **ratings[model]} for judge, ratings in results["parsed_ratings"].items()
+                ],
+            }
+            for model, text in results["responses"].items()
+        ],
+    }).encode()
+
+
+async def lines_of(lines: List[bytes]) -> AsyncIterator[bytes]:
+    for line in lines:
+        yield line
+
+
+async def time_persist(battles: List[Dict]) -> float:
+    engine = create_write_engine(temp_database_path("persist"))
+    await create_schema(engine)
+    sessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    start = time.perf_counter()
+    for results in battles:
+        async with sessions() as session:
+            await persist_battle(session, results["prompt"], results)
+            await session.commit()
+    elapsed = time.perf_counter() - start
+    await engine.dispose()
+    return elapsed
+
+
+async def time_import(lines: List[bytes], batch_size: int) -> List[float]:
+    engine = create_write_engine(temp_database_path("import"))
+    await create_schema(engine)
+    sessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def submit(job):
+        async with sessions() as session:
+            result = await job(session)
+            await session.commit()
+            return result
+
+    elapsed = []
+    for _ in range(2):  # Second pass: every line is a duplicate
+        start = time.perf_counter()
+        await import_lines(lines_of(lines), submit, batch_size)
+        elapsed.append(time.perf_counter() - start)
+    await engine.dispose()
+    return elapsed
+
+
+def report(name: str, count: int, elapsed: float) -> float:
+    rate = count / elapsed
+    print(f"  {name:<32} {rate:9.0f} battles/s   ({elapsed:.2f}s)")
+    return rate
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--battles", type=int, default=20000)
+    parser.add_argument("--response-words", type=int, default=300)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    battles = [make_results(args.response_words) for _ in range(args.battles)]
+    lines = [export_line(results) for results in battles]
+    print(f"Writing {args.battles} battles ({sum(map(len, lines)) / 1024 / 1024:.1f} MB of NDJSON)\n")
+
+    persist_rate = report("persist_battle (1 per txn)", args.battles, await time_persist(battles))
+    first, second = await time_import(lines, args.batch_size)
+    import_rate = report(f"bulk import ({args.batch_size} per txn)", args.battles, first)
+    report("re-import (all duplicates)", args.battles, second)
+    print(f"\n  Speedup: {import_rate / persist_rate:.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
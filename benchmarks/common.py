@@ -0,0 +1,93 @@
+"""
+Shared helpers for the benchmark scripts: synthetic battle results and
+throwaway databases built with the same models as the app.
+"""
+import random
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Dict
+
+MODELS = ["openai", "anthropic", "google", "grok"]
+
+WORDS = (
+    "the model answer explains function return value error async database query "
+    "performance cache index battle judge score response prompt python code example"
+).split()
+
+
+def random_text(min_words: int, max_words: int) -> str:
+    return " ".join(random.choices(WORDS, k=random.randint(min_words, max_words)))
+
+
+def make_results(response_words: int = 300) -> Dict:
+    """A run_battle() result with random answers and ratings (dict rating format)"""
+    responses = {m: random_text(response_words // 2, response_words) for m in MODELS}
+    parsed_ratings = {
+        judge: {
+            m: {"score": float(random.randint(30, 100)) / 10, "reasoning": random_text(10, 40)}
+            for m in MODELS
+        }
+        for judge in MODELS
+    }
+    average_scores = {
+        m: sum(parsed_ratings[j][m]["score"] for j in MODELS) / len(MODELS)
+        for m in MODELS
+    }
+    winner = max(average_scores, key=average_scores.get)
+    return {
+        "prompt": random_text(10, 60),
+        "responses": responses,
+        "parsed_ratings": parsed_ratings,
+        "average_scores": average_scores,
+        "winner": winner,
+        "tiebreaker_info": {},
+        "timing_info": {
+            "response_timings": {m: random.uniform(1, 20) for m in MODELS},
+            "rating_timings": {m: random.uniform(1, 20) for m in MODELS}
+        }
+    }
+
+
+def temp_database_path(name: str) -> str:
+    directory = Path(tempfile.mkdtemp(prefix="arena-bench-"))
+    return str(directory / f"{name}.db")
+
+
+async def create_schema(engine):
+    """Same schema as init_db(), including tables created by migrations (e.g. the search index)"""
+    from database import Base
+    from migrations import run_migrations
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await run_migrations(conn)
+
+
+async def save_battle_orm(session, results: Dict) -> int:
+    """The ORM unit-of-work writes create_battle used before persistence.py"""
+    from database import Battle, Response, Rating
+    battle = Battle(prompt=results["prompt"], created_at=datetime.utcnow())
+    session.add(battle)
+    await session.flush()
+    response_ids = {}
+    for model_name, text in results["responses"].items():
+        response = Response(
+            battle_id=battle.id,
+            model_name=model_name,
+            response_text=text,
+            average_score=results["average_scores"][model_name],
+            is_winner=1 if model_name == results["winner"] else 0
+        )
+        session.add(response)
+        await session.flush()
+        response_ids[model_name] = response.id
+    for judge, ratings in results["parsed_ratings"].items():
+        for model_name, rating in ratings.items():
+            session.add(Rating(
+                battle_id=battle.id,
+                response_id=response_ids[model_name],
+                judge_model=judge,
+                score=rating["score"],
+                reasoning=rating["reasoning"]
+            ))
+    return battle.id
@@ -0,0 +1,69 @@
+"""
+Benchmark battle persistence: ORM unit of work vs persistence.persist_battle.
+
+Each battle (1 battle row, 4 responses, 16 ratings) is written and committed in
+its own transaction, the way create_battle does, against a fresh temporary
+database per path.
+
+Usage:
+    python -m benchmarks.persistence [--battles 2000] [--response-words 300]
+"""
+import time
+import asyncio
+import argparse
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database import Battle
+from persistence import persist_battle
+from storage import create_write_engine
+from benchmarks.common import make_results, temp_database_path, create_schema, save_battle_orm
+
+
+async def save_bulk(session, results) -> int:
+    battle_id, _ = await persist_battle(session, results["prompt"], results)
+    return battle_id
+
+
+async def save_orm_with_refresh(session, results) -> int:
+    battle_id = await save_battle_orm(session, results)
+    await session.commit()
+    battle = await session.get(Battle, battle_id)
+    await session.refresh(battle)
+    return battle_id
+
+
+async def run_path(name: str, save, battles: list) -> float:
+    path = temp_database_path(name)
+    engine = create_write_engine(path)
+    await create_schema(engine)
+    sessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    start = time.perf_counter()
+    for results in battles:
+        async with sessions() as session:
+            await save(session, results)
+            await session.commit()
+    elapsed = time.perf_counter() - start
+
+    await engine.dispose()
+    rate = len(battles) / elapsed
+    print(f"  {name:<22} {rate:9.1f} battles/s   ({elapsed * 1000 / len(battles):.3f} ms per battle)")
+    return rate
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--battles", type=int, default=2000)
+    parser.add_argument("--response-words", type=int, default=300)
+    args = parser.parse_args()
+
+    battles = [make_results(args.response_words) for _ in range(args.battles)]
+    print(f"Persisting {args.battles} battles, one transaction each\n")
+    orm_rate = await run_path("orm (flush + refresh)", save_orm_with_refresh, battles)
+    bulk_rate = await run_path("bulk (persist_battle)", save_bulk, battles)
+    print(f"\n  Speedup: {bulk_rate / orm_rate:.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
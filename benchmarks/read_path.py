@@ -0,0 +1,112 @@
+"""
+Benchmark GET /api/battle/{id}: the old N+1 read path vs queries.load_battle.
+
+Seeds a database with --battles battles (100k by default, reused if the file
+already exists), then issues random battle reads from --concurrency tasks:
+- n+1:     battle query, responses query, one ratings query per response
+- eager:   queries.load_battle (joined responses + selectin ratings)
+- http:    the real endpoint through the ASGI app, full and compact formats
+
+Usage:
+    python -m benchmarks.read_path [--battles 100000] [--db /tmp/arena-100k.db] [--seconds 5]
+"""
+import os
+import time
+import random
+import asyncio
+import argparse
+
+
+async def seed(path: str, battles: int):
+    from storage import create_write_engine
+    from persistence import persist_battle
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+    from benchmarks.common import make_results, create_schema
+
+    engine = create_write_engine(path)
+    await create_schema(engine)
+    sessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    templates = [make_results(response_words=80) for _ in range(200)]
+    chunk = 1000
+    start = time.perf_counter()
+    for offset in range(0, battles, chunk):
+        async with sessions() as session:
+            for i in range(offset, min(offset + chunk, battles)):
+                results = templates[i % len(templates)]
+                await persist_battle(session, results["prompt"], results)
+            await session.commit()
+        print(f"\r  seeded {min(offset + chunk, battles)}/{battles}", end="", flush=True)
+    print(f"  ({time.perf_counter() - start:.1f}s)")
+    await engine.dispose()
+
+
+async def read_n_plus_one(session, battle_id: int):
+    """The pre-load_battle get_battle queries"""
+    from sqlalchemy import select
+    from database import Battle, Response, Rating
+
+    battle = (await session.execute(select(Battle).where(Battle.id == battle_id))).scalar_one_or_none()
+    responses = (await session.execute(
+        select(Response).where(Response.battle_id == battle_id).order_by(Response.average_score.desc())
+    )).scalars().all()
+    for response in responses:
+        (await session.execute(select(Rating).where(Rating.response_id == response.id))).scalars().all()
+    return battle
+
+
+async def measure(name: str, call, max_id: int, seconds: float, concurrency: int):
+    done = 0
+    deadline = time.monotonic() + seconds
+
+    async def loop():
+        nonlocal done
+        while time.monotonic() < deadline:
+            await call(random.randint(1, max_id))
+            done += 1
+
+    await asyncio.gather(*[loop() for _ in range(concurrency)])
+    print(f"  {name:<16} {done / seconds:9.1f} req/s")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--battles", type=int, default=100_000)
+    parser.add_argument("--db", default="/tmp/arena-bench-read-path.db")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    # The app modules read their database location from settings at import time
+    os.environ["DATABASE_PATH"] = args.db
+    if not os.path.exists(args.db):
+        print(f"Seeding {args.db}")
+        await seed(args.db, args.battles)
+
+    import httpx
+    import database
+    from main import app
+    from queries import load_battle
+
+    async def n_plus_one(battle_id):
+        async with database.ReadSessionLocal() as session:
+            await read_n_plus_one(session, battle_id)
+
+    async def eager(battle_id):
+        async with database.ReadSessionLocal() as session:
+            await load_battle(session, battle_id)
+
+    print(f"\n{args.battles} battles, {args.concurrency} concurrent readers, {args.seconds}s each\n")
+    await measure("n+1", n_plus_one, args.battles, args.seconds, args.concurrency)
+    await measure("eager", eager, args.battles, args.seconds, args.concurrency)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for format in ("full", "compact"):
+            async def http_get(battle_id, format=format):
+                response = await client.get(f"/api/battle/{battle_id}", params={"format": format})
+                response.raise_for_status()
+            await measure(f"http ({format})", http_get, args.battles, args.seconds, args.concurrency)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+"""
+Benchmark winner recompute: the old per-battle loop vs recompute.py.
+
+Seeds a database with --battles battles (reused if the file already exists,
+same seed as benchmarks.read_path; the benchmark writes to it), clears
+winner_model on every 10th battle so there is something to write, then
+times:
+- per-battle: the pre-recompute.py loop (three queries per battle, linear
+  rating -> response lookup), on the first --legacy-battles battles only
+- streaming:  recompute_winners in-process and with --workers processes
+- stale-only: recompute_winners(stale_only=True) after marking 1% of the
+  battles stale, as a changed rating would
+
+Usage:
+    python -m benchmarks.recompute [--battles 100000] [--db /tmp/arena-bench-read-path.db] [--workers N]
+"""
+import os
+import time
+import asyncio
+import argparse
+
+
+async def per_battle_loop(session, limit: int):
+    """The old update_all_battles reads and winner logic, without the writes"""
+    from sqlalchemy import select
+    from database import Battle, Response, Rating
+    from battle_logic import determine_winner
+
+    battles = (await session.execute(select(Battle).order_by(Battle.id).limit(limit))).scalars().all()
+    for battle in battles:
+        responses = (await session.execute(
+            select(Response).where(Response.battle_id == battle.id)
+        )).scalars().all()
+        ratings = (await session.execute(
+            select(Rating).where(Rating.battle_id == battle.id)
+        )).scalars().all()
+        average_scores = {response.model_name: response.average_score or 0.0 for response in responses}
+        parsed_ratings = {}
+        for rating in ratings:
+            response_model = next((r.model_name for r in responses if r.id == rating.response_id), None)
+            parsed_ratings.setdefault(rating.judge_model, {})[response_model] = {
+                "score": rating.score, "reasoning": rating.reasoning or ""
+            }
+        determine_winner(average_scores, parsed_ratings, list(average_scores), verbose=False)
+    return len(battles)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--battles", type=int, default=100_000)
+    parser.add_argument("--db", default="/tmp/arena-bench-read-path.db")
+    parser.add_argument("--legacy-battles", type=int, default=5000)
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    # The app modules read their database location from settings at import time
+    os.environ["DATABASE_PATH"] = args.db
+    if not os.path.exists(args.db):
+        from benchmarks.read_path import seed
+        print(f"Seeding {args.db}")
+        await seed(args.db, args.battles)
+
+    from sqlalchemy import text
+    from database import init_db, AsyncSessionLocal
+    from recompute import recompute_winners
+
+    await init_db()
+
+    async with AsyncSessionLocal() as session:
+        total = (await session.execute(text("SELECT COUNT(*) FROM battles"))).scalar()
+    print(f"\n{total} battles, {args.chunk_size}-battle chunks\n")
+
+    async with AsyncSessionLocal() as session:
+        start = time.perf_counter()
+        done = await per_battle_loop(session, args.legacy_battles)
+        elapsed = time.perf_counter() - start
+    print(f"  {'per-battle':<22} {done / elapsed:9.0f} battles/s  "
+          f"(1M battles ≈ {1_000_000 / (done / elapsed) / 60:.1f} min, reads only)")
+
+    for workers in (0, args.workers):
+        async with AsyncSessionLocal() as session:
+            await session.execute(text("UPDATE battles SET winner_model = NULL WHERE id % 10 = 0"))
+            await session.commit()
+            start = time.perf_counter()
+            totals = await recompute_winners(session, chunk_size=args.chunk_size, workers=workers)
+            elapsed = time.perf_counter() - start
+        name = f"streaming, {workers} workers" if workers else "streaming, in-process"
+        print(f"  {name:<22} {totals['battles'] / elapsed:9.0f} battles/s  "
+              f"(1M battles ≈ {1_000_000 / (totals['battles'] / elapsed) / 60:.1f} min, "
+              f"{totals['changed']} winners written)")
+
+    async with AsyncSessionLocal() as session:
+        await session.execute(text("UPDATE battles SET winner_policy = NULL WHERE id % 100 = 0"))
+        await session.commit()
+        start = time.perf_counter()
+        totals = await recompute_winners(session, stale_only=True, chunk_size=args.chunk_size)
+        elapsed = time.perf_counter() - start
+    print(f"  {'stale-only (1%)':<22} {elapsed * 1000:9.0f} ms        ({totals['battles']} battles re-scored)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
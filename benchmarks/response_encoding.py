@@ -0,0 +1,78 @@
+"""
+Benchmark response encoding and compression for the battle, battle list and
+stats payloads.
+
+Encode: FastAPI's default (jsonable_encoder + json.dumps) vs fast_json.dumps
+(orjson when installed). Wire: bytes sent by the app for Accept-Encoding
+identity, gzip and br (br only with the brotli package), and how long each
+encoding takes.
+
+Uses the read_path benchmark database (seeded there if missing).
+
+Usage:
+    python -m benchmarks.response_encoding [--db /tmp/arena-bench-read-path.db] [--battles 100000]
+"""
+import os
+import time
+import asyncio
+import argparse
+
+
+def per_call_us(call, payload, seconds: float = 0.5) -> float:
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        call(payload)
+        calls += 1
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--battles", type=int, default=100_000)
+    parser.add_argument("--db", default="/tmp/arena-bench-read-path.db")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_PATH"] = args.db
+    if not os.path.exists(args.db):
+        from benchmarks.read_path import seed
+        print(f"Seeding {args.db}")
+        await seed(args.db, args.battles)
+
+    import httpx
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from fast_json import dumps, orjson
+    from http_compression import brotli, compress
+    from main import app
+
+    paths = {
+        "battle (full)": "/api/battle/5",
+        "battle (compact)": "/api/battle/5?format=compact",
+        "battle list (50)": "/api/battles?limit=50",
+        "stats": "/api/stats",
+    }
+    encodings = ["identity", "gzip"] + (["br"] if brotli is not None else [])
+    print(f"JSON encoder: {'orjson' if orjson is not None else 'stdlib (orjson not installed)'}, "
+          f"brotli: {'yes' if brotli is not None else 'not installed'}\n")
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"  {'payload':<18} {'default':>10} {'fast_json':>10}   " + "  ".join(f"{e:>16}" for e in encodings))
+        for name, path in paths.items():
+            payload = (await client.get(path, headers={"Accept-Encoding": "identity"})).json()
+            default_us = per_call_us(lambda p: JSONResponse(content=jsonable_encoder(p)).body, payload)
+            fast_us = per_call_us(dumps, payload)
+            body = dumps(payload)
+            wire = []
+            for encoding in encodings:
+                response = await client.get(path, headers={"Accept-Encoding": encoding})
+                size = len(response.read()) if encoding == "identity" else int(response.headers["content-length"])
+                cost = 0.0 if encoding == "identity" else per_call_us(lambda b: compress(b, encoding), body, 0.2)
+                wire.append(f"{size:>7} B {cost:>5.0f}us")
+            print(f"  {name:<18} {default_us:>8.0f}us {fast_us:>8.0f}us   " + "  ".join(wire))
+    print("\n  Encode times are per payload; compression times are for one uncached compress() call")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
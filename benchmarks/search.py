@@ -0,0 +1,76 @@
+"""
+Benchmark /api/search: FTS5 (search.search_battles) vs a LIKE scan.
+
+Seeds a database with --battles battles (reused if the file already exists,
+same seed as benchmarks.read_path) and times each query term both ways:
+- like:  battles whose prompt or any response contains the term (LIKE '%term%')
+- fts5:  search.search_battles, ranked with snippets
+
+Usage:
+    python -m benchmarks.search [--battles 100000] [--db /tmp/arena-bench-read-path.db]
+"""
+import os
+import time
+import asyncio
+import argparse
+
+TERMS = ["python", "database index", "recursion", "zebra"]
+
+
+async def timed(call, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await call()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--battles", type=int, default=100_000)
+    parser.add_argument("--db", default="/tmp/arena-bench-read-path.db")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # The app modules read their database location from settings at import time
+    os.environ["DATABASE_PATH"] = args.db
+    if not os.path.exists(args.db):
+        from benchmarks.read_path import seed
+        print(f"Seeding {args.db}")
+        await seed(args.db, args.battles)
+
+    from sqlalchemy import text
+    import database
+    from database import init_db
+    from search import search_battles
+
+    # Older benchmark databases predate the search index
+    await init_db()
+
+    print(f"\n{args.battles} battles, top 20 results, mean of {args.repeat} runs\n")
+    print(f"  {'term':<16} {'like ms':>10} {'fts5 ms':>10} {'matches':>8}")
+    async with database.ReadSessionLocal() as session:
+        for term in TERMS:
+            pattern = "%" + "%".join(term.split()) + "%"
+
+            async def like():
+                await session.execute(text("""
+                    SELECT id FROM battles WHERE text_decompress(prompt) LIKE :p OR EXISTS (
+                        SELECT 1 FROM responses WHERE responses.battle_id = battles.id
+                        AND text_decompress(response_text) LIKE :p
+                    ) ORDER BY created_at DESC LIMIT 20
+                """), {"p": pattern})
+
+            async def fts():
+                await search_battles(session, term, limit=20)
+
+            matches = (await session.execute(
+                text("SELECT count(*) FROM battle_search WHERE battle_search MATCH :q"),
+                {"q": " ".join(f'"{word}"' for word in term.split())}
+            )).scalar()
+            like_ms = await timed(like, args.repeat)
+            fts_ms = await timed(fts, args.repeat)
+            print(f"  {term:<16} {like_ms:>10.2f} {fts_ms:>10.2f} {matches:>8}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,138 @@
+"""
+Benchmark concurrent battle writes and reads against the SQLite storage profiles.
+
+Runs the same workload against a fresh temporary database twice:
+- default: rollback journal, one connection per session, every writer commits on its own
+- tuned:   WAL + pragmas, writes through DatabaseWriter, reads through the read-only pool
+
+Usage:
+    python -m benchmarks.sqlite_concurrency [--seconds 10] [--writers 8] [--readers 32] [--seed 500]
+"""
+import time
+import random
+import asyncio
+import argparse
+import statistics
+
+from sqlalchemy import select, func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database import Battle, Response, Rating
+from persistence import persist_battle
+from storage import create_write_engine, create_read_engine, DatabaseWriter
+from benchmarks.common import make_results, temp_database_path, create_schema
+
+
+async def save_battle(session: AsyncSession, results: dict) -> int:
+    battle_id, _ = await persist_battle(session, results["prompt"], results)
+    return battle_id
+
+
+async def read_battle(session: AsyncSession, max_id: int):
+    battle_id = random.randint(1, max(max_id, 1))
+    await session.execute(select(Battle).where(Battle.id == battle_id))
+    responses = (await session.execute(
+        select(Response).where(Response.battle_id == battle_id)
+    )).scalars().all()
+    for response in responses:
+        await session.execute(select(Rating).where(Rating.response_id == response.id))
+
+
+async def read_stats(session: AsyncSession):
+    await session.execute(select(func.count(Battle.id)))
+    await session.execute(
+        select(Response.model_name, func.count(Response.id))
+        .where(Response.is_winner == 1)
+        .group_by(Response.model_name)
+    )
+
+
+def summarize(name: str, latencies: list, errors: int, seconds: float) -> str:
+    if not latencies:
+        return f"  {name:<7} 0 ops, {errors} errors"
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    return (f"  {name:<7} {len(latencies) / seconds:8.1f} ops/s   "
+            f"p50 {p50:7.2f} ms   p99 {p99:8.2f} ms   errors {errors}")
+
+
+async def run_profile(profile: str, args) -> None:
+    path = temp_database_path(profile)
+    write_engine = create_write_engine(path, profile=profile)
+    await create_schema(write_engine)
+    read_engine = create_read_engine(path, profile=profile)
+    write_sessions = async_sessionmaker(write_engine, class_=AsyncSession, expire_on_commit=False)
+    read_sessions = async_sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+
+    writer = DatabaseWriter(write_sessions)
+    if profile == "tuned":
+        await writer.start()
+
+    # Seed so readers have something to read
+    for _ in range(args.seed):
+        await writer.submit(lambda session: save_battle(session, make_results()))
+    max_id = args.seed
+
+    write_latencies, read_latencies = [], []
+    errors = {"write": 0, "read": 0}
+    deadline = time.monotonic() + args.seconds
+
+    async def write_loop():
+        nonlocal max_id
+        while time.monotonic() < deadline:
+            results = make_results()
+            start = time.perf_counter()
+            try:
+                battle_id = await writer.submit(lambda session: save_battle(session, results))
+                max_id = max(max_id, battle_id)
+                write_latencies.append(time.perf_counter() - start)
+            except OperationalError:
+                errors["write"] += 1
+
+    async def read_loop(i: int):
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                async with read_sessions() as session:
+                    if i % 4 == 0:
+                        await read_stats(session)
+                    else:
+                        await read_battle(session, max_id)
+                read_latencies.append(time.perf_counter() - start)
+            except OperationalError:
+                errors["read"] += 1
+
+    await asyncio.gather(
+        *[write_loop() for _ in range(args.writers)],
+        *[read_loop(i) for i in range(args.readers)]
+    )
+
+    await writer.stop()
+    print(f"Profile: {profile}  ({path})")
+    print(summarize("writes", write_latencies, errors["write"], args.seconds))
+    print(summarize("reads", read_latencies, errors["read"], args.seconds))
+    if profile == "tuned":
+        print(f"  writer  {writer.stats['jobs']} jobs in {writer.stats['batches']} commits")
+    print()
+
+    await write_engine.dispose()
+    await read_engine.dispose()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=500, help="Battles inserted before timing starts")
+    args = parser.parse_args()
+
+    print(f"{args.writers} writers, {args.readers} readers, {args.seconds}s per profile\n")
+    for profile in ("default", "tuned"):
+        await run_profile(profile, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
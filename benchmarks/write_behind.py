@@ -0,0 +1,116 @@
+"""
+Benchmark POST /api/battle latency with and without write-behind.
+
+run_battle is replaced by a stub returning a ready-made result, so the
+measured time is only the API's own work: saving the battle (write-through)
+or journaling it (write-behind). A background task keeps the database busy
+with --background-writers concurrent battle inserts, like other API
+requests would.
+
+Each mode runs in its own process against a fresh temporary database.
+
+Usage:
+    python -m benchmarks.write_behind [--battles 300] [--concurrency 8] [--background-writers 4]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+import subprocess
+
+
+async def run_mode(battles: int, concurrency: int, background_writers: int):
+    import httpx
+    import main
+    from persistence import persist_battle
+    from benchmarks.common import make_results
+
+    templates = [make_results(response_words=150) for _ in range(50)]
+    for results in templates:
+        results["model_names"] = {model: model for model in results["responses"]}
+
+    async def stub_run_battle(prompt, conversation_history=None, image_data=None):
+        return templates[hash(prompt) % len(templates)]
+
+    main.run_battle = stub_run_battle
+    await main.startup()
+
+    stop = asyncio.Event()
+
+    async def background_writer():
+        while not stop.is_set():
+            results = templates[0]
+            await main.database.writer.submit(
+                lambda session: persist_battle(session, results["prompt"], results)
+            )
+
+    background = [asyncio.create_task(background_writer()) for _ in range(background_writers)]
+    latencies = []
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        queue = asyncio.Queue()
+        for i in range(battles):
+            queue.put_nowait(i)
+
+        async def worker():
+            while not queue.empty():
+                i = queue.get_nowait()
+                start = time.perf_counter()
+                response = await client.post("/api/battle", json={"prompt": f"benchmark prompt {i}"})
+                response.raise_for_status()
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+    stop.set()
+    await asyncio.gather(*background)
+    drain_start = time.perf_counter()
+    await main.shutdown()
+    drain = time.perf_counter() - drain_start
+
+    latencies.sort()
+    mode = "write-behind" if main.settings.write_behind else "write-through"
+    print(f"  {mode:<14} mean {statistics.mean(latencies):7.2f} ms  "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1]:7.2f} ms  "
+          f"{battles / elapsed:7.1f} battles/s  (shutdown drain {drain * 1000:.0f} ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--battles", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--background-writers", type=int, default=4)
+    parser.add_argument("--mode", choices=["write-through", "write-behind"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        asyncio.run(run_mode(args.battles, args.concurrency, args.background_writers))
+        return
+
+    from benchmarks.common import temp_database_path
+    print(f"\n{args.battles} battles, {args.concurrency} concurrent clients, "
+          f"{args.background_writers} background writers\n")
+    for mode in ("write-through", "write-behind"):
+        path = temp_database_path(mode)
+        env = {
+            **os.environ,
+            # The app modules read their settings at import time
+            "DATABASE_PATH": path,
+            "BLOB_STORE_PATH": path + ".blobs",
+            "WRITE_BEHIND": "true" if mode == "write-behind" else "false",
+            "WRITE_BEHIND_JOURNAL_PATH": path + ".journal",
+        }
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.write_behind", "--mode", mode,
+             "--battles", str(args.battles), "--concurrency", str(args.concurrency),
+             "--background-writers", str(args.background_writers)],
+            env=env, check=True
+        )
+
+
+if __name__ == "__main__":
+    main()
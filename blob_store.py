@@ -0,0 +1,265 @@
+"""
+Content-addressed blob store for battle screenshots.
+
+Image bytes are stored once per SHA-256 digest under blob_store_path
+(./blobs/ab/abcdef...). The `blobs` table tracks the mime type, size and the
+number of battles referencing each digest, so duplicate screenshots share one
+file and the file is removed when the last battle referencing it is deleted.
+Battle rows only keep the digest in `image_hash`.
+
+References are added by writer jobs, and an orphaned file is removed by a
+later writer job (remove_if_unreferenced) that checks the row again first:
+a battle saved with the same screenshot after the delete committed found
+the file still on disk and did not write it again. Write-behind battles
+(journal.py) write their file long before the reference is committed;
+they hold() the digest until then, and held files are never removed.
+
+Thumbnails are generated on first request and cached next to the original as
+<digest>.<width>, so they are removed together with it.
+"""
+import os
+import base64
+import binascii
+import hashlib
+import shutil
+import tempfile
+from io import BytesIO
+from collections import Counter
+from pathlib import Path
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from PIL import Image
+
+from config import settings
+from database import Blob
+
+
+def decode_data_uri(image_data: str) -> Tuple[bytes, str]:
+    """
+    Decode a screenshot sent by the frontend.
+
+    Accepts a data URI ("data:image/png;base64,...") or bare base64 (assumed
+    PNG, like the LLM clients do). Raises ValueError on malformed input.
+    """
+    mime_type = "image/png"
+    base64_data = image_data
+    if image_data.startswith("data:"):
+        header, sep, base64_data = image_data.partition(",")
+        if not sep:
+            raise ValueError("Malformed data URI: missing ',' separator")
+        mime_type = header[5:].split(";")[0] or mime_type
+    try:
+        return base64.b64decode(base64_data, validate=True), mime_type
+    except (binascii.Error, ValueError) as e:
+        raise ValueError(f"Invalid base64 image data: {e}")
+
+
+class BlobStore:
+    """SHA-256 keyed files on disk plus reference counts in the blobs table"""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.held: Counter = Counter()  # Digest -> journaled battles whose reference is not committed yet
+
+    def path_for(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    def thumbnail_path_for(self, digest: str, width: int) -> Path:
+        return self.root / digest[:2] / f"{digest}.{width}"
+
+    def _write_file(self, path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def write(self, data: bytes) -> str:
+        """Store bytes (idempotent) and return their digest"""
+        digest = self.digest(data)
+        path = self.path_for(digest)
+        if not path.exists():
+            self._write_file(path, data)
+        return digest
+
+    def thumbnail(self, digest: str, width: int, mime_type: str) -> Tuple[Path, str]:
+        """
+        Return the path and mime type of a thumbnail at most `width` pixels wide.
+
+        Generated from the original on first use and cached on disk; images
+        already narrower than `width`, and files PIL cannot read, are served
+        as the original. Decodes with PIL: call it in a thread.
+        """
+        path = self.thumbnail_path_for(digest, width)
+        original = self.path_for(digest)
+        try:
+            if path.exists():
+                # Only the cached file's header is read, for its format
+                with Image.open(path) as cached:
+                    return path, Image.MIME[cached.format]
+            with Image.open(original) as image:
+                if image.width <= width:
+                    return original, mime_type
+                image_format = image.format if image.format in ("PNG", "JPEG", "WEBP") else "PNG"
+                height = max(1, round(image.height * width / image.width))
+                resized = image.convert("RGBA" if image_format != "JPEG" else "RGB")
+                resized = resized.resize((width, height), Image.LANCZOS)
+                buffer = BytesIO()
+                resized.save(buffer, format=image_format)
+            self._write_file(path, buffer.getvalue())
+            return path, Image.MIME[image_format]
+        except (OSError, Image.DecompressionBombError) as e:
+            # UnidentifiedImageError and truncated files are OSErrors
+            print(f"⚠️  Serving original screenshot {digest[:12]}, no thumbnail: {e}")
+            return original, mime_type
+
+    def read(self, digest: str) -> bytes:
+        return self.path_for(digest).read_bytes()
+
+    def remove(self, digest: str):
+        """Delete a blob file and its cached thumbnails"""
+        directory = self.root / digest[:2]
+        for path in [self.path_for(digest), *directory.glob(f"{digest}.*")]:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def hold(self, digest: str):
+        """Keep a file written for a reference that is not committed yet"""
+        self.held[digest] += 1
+
+    def unhold(self, digest: str):
+        self.held[digest] -= 1
+        if self.held[digest] <= 0:
+            del self.held[digest]
+
+    async def remove_if_unreferenced(self, db, digest: str) -> bool:
+        """
+        Delete a blob file (a writer job, after the transaction that released
+        its last reference) unless a reference was added since or a
+        journaled battle holds it; returns whether it was deleted
+        """
+        referenced = (await db.execute(
+            text("SELECT 1 FROM blobs WHERE hash = :hash AND ref_count > 0"),
+            {"hash": digest}
+        )).scalar()
+        if referenced or digest in self.held:
+            return False
+        self.remove(digest)
+        return True
+
+    def clear(self):
+        if self.root.exists():
+            shutil.rmtree(self.root)
+
+    async def acquire(self, db, data: bytes, mime_type: str) -> str:
+        """
+        Store bytes and add one reference to them.
+
+        The reference count is updated through `db` (a session or connection),
+        so it commits or rolls back with the battle that owns the reference.
+        """
+        digest = self.write(data)
+        await self.add_reference(db, digest, mime_type, len(data))
+        return digest
+
+    async def add_reference(self, db, digest: str, mime_type: str, size: int):
+        """The reference-count half of acquire(), for bytes already written with write()"""
+        stmt = sqlite_insert(Blob.__table__).values(
+            hash=digest,
+            mime_type=mime_type,
+            size=size,
+            ref_count=1,
+            created_at=datetime.utcnow()
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["hash"],
+            set_={"ref_count": Blob.__table__.c.ref_count + 1}
+        )
+        await db.execute(stmt)
+
+    async def release(self, db, digest: Optional[str]) -> bool:
+        """
+        Drop one reference to a blob.
+
+        Returns True if that was the last reference; the row is deleted and the
+        caller should submit remove_if_unreferenced(digest) once its
+        transaction has committed.
+        """
+        if not digest:
+            return False
+        await db.execute(
+            text("UPDATE blobs SET ref_count = ref_count - 1 WHERE hash = :hash"),
+            {"hash": digest}
+        )
+        result = await db.execute(
+            text("DELETE FROM blobs WHERE hash = :hash AND ref_count <= 0"),
+            {"hash": digest}
+        )
+        return result.rowcount > 0
+
+    async def get_mime_type(self, db, digest: str) -> Optional[str]:
+        result = await db.execute(
+            text("SELECT mime_type FROM blobs WHERE hash = :hash"),
+            {"hash": digest}
+        )
+        return result.scalar_one_or_none()
+
+
+async def migrate_inline_images(conn, chunk_size: int = 100) -> int:
+    """
+    Move base64 images still stored in battles.image_data into the blob store.
+
+    Runs in chunks so a large database never holds more than chunk_size
+    images in memory. Returns the number of battles migrated.
+    """
+    migrated = 0
+    while True:
+        result = await conn.execute(
+            text(
+                "SELECT id, image_data FROM battles "
+                "WHERE image_data IS NOT NULL AND image_hash IS NULL "
+                "ORDER BY id LIMIT :limit"
+            ),
+            {"limit": chunk_size}
+        )
+        rows = result.fetchall()
+        if not rows:
+            break
+
+        for battle_id, image_data in rows:
+            try:
+                data, mime_type = decode_data_uri(image_data)
+            except ValueError as e:
+                # Keep unreadable legacy images out of the blob store but don't block the migration
+                print(f"⚠️  Battle {battle_id}: dropping undecodable image ({e})")
+                await conn.execute(
+                    text("UPDATE battles SET image_data = NULL WHERE id = :id"),
+                    {"id": battle_id}
+                )
+                continue
+            digest = await blob_store.acquire(conn, data, mime_type)
+            await conn.execute(
+                text("UPDATE battles SET image_hash = :hash, image_data = NULL WHERE id = :id"),
+                {"hash": digest, "id": battle_id}
+            )
+            migrated += 1
+
+    return migrated
+
+
+blob_store = BlobStore(settings.blob_store_path)
@@ -0,0 +1,111 @@
+"""
+Compress prompts, responses and judge reasoning in battles.db and report the
+effect on database size and read latency.
+
+The server compresses existing rows on startup (migration 7); running this
+script instead measures the database before and after and VACUUMs it so the
+freed pages are returned to the filesystem. With --retrain it trains new
+dictionaries from the current data and recompresses every row with them
+(useful once a fresh database has collected some battles).
+
+Usage:
+    python compress_text.py [--retrain] [--samples 200]
+"""
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+
+from sqlalchemy import select, text
+
+import database
+from database import Battle
+from compression import registry, compress_existing_rows
+from migrations import run_migrations
+from queries import load_battle
+
+COMPRESSION_MIGRATION = 7
+
+
+async def measure_reads(samples: int) -> dict:
+    """Mean and p95 milliseconds of load_battle on random battles, starting from a cold pool"""
+    await database.read_engine.dispose()
+    async with database.ReadSessionLocal() as session:
+        ids = (await session.execute(select(Battle.id))).scalars().all()
+    if not ids:
+        return {"mean_ms": 0.0, "p95_ms": 0.0}
+    timings = []
+    for battle_id in random.sample(ids, min(samples, len(ids))):
+        async with database.ReadSessionLocal() as session:
+            start = time.perf_counter()
+            await load_battle(session, battle_id)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "mean_ms": statistics.mean(timings),
+        "p95_ms": timings[int(len(timings) * 0.95) - 1 if len(timings) > 1 else 0],
+    }
+
+
+async def vacuum():
+    """VACUUM and fold the WAL back into the database file so its size is accurate"""
+    async with database.engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("VACUUM"))
+        await conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+
+
+def report(label: str, size: int, reads: dict):
+    print(f"   {label:<7} {size / 1024 / 1024:9.2f} MB   load_battle mean {reads['mean_ms']:.2f} ms, p95 {reads['p95_ms']:.2f} ms")
+
+
+async def compress_database(retrain: bool, samples: int):
+    db_path = Path(database.settings.database_path)
+
+    if not db_path.exists():
+        print(f"❌ Database file not found at {db_path}")
+        print("💡 The database will be created automatically when you start the server.")
+        return
+
+    # Bring the schema up to just before compression so the "before" numbers are comparable
+    async with database.engine.begin() as conn:
+        await conn.run_sync(database.Base.metadata.create_all)
+        await run_migrations(conn, target=COMPRESSION_MIGRATION - 1)
+
+    # Compact first too, so free pages left by earlier deletes don't count as savings
+    print(f"📏 Measuring {db_path}...")
+    await vacuum()
+    size_before = db_path.stat().st_size
+    reads_before = await measure_reads(samples)
+
+    print("🗜️  Compressing text columns...")
+    async with database.engine.begin() as conn:
+        await run_migrations(conn)
+        await registry.load(conn)
+        if retrain:
+            await compress_existing_rows(conn, retrain=True)
+
+    print("🧹 Reclaiming free pages (VACUUM)...")
+    await vacuum()
+
+    size_after = db_path.stat().st_size
+    reads_after = await measure_reads(samples)
+
+    print("✅ Done.")
+    report("before", size_before, reads_before)
+    report("after", size_after, reads_after)
+    if size_after:
+        print(f"   Ratio   {size_before / size_after:9.2f}x")
+
+    await database.engine.dispose()
+    await database.read_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--retrain", action="store_true", help="Train new dictionaries and recompress every row")
+    parser.add_argument("--samples", type=int, default=200, help="Battles read for the latency measurement")
+    args = parser.parse_args()
+    asyncio.run(compress_database(args.retrain, args.samples))
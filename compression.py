@@ -0,0 +1,256 @@
+"""
+Transparent compression for the large text columns.
+
+Battle.prompt, Response.response_text and Rating.reasoning use CompressedText.
+Values are deflated on write with a preset dictionary trained on existing
+rows of the same column (zlib's zdict: common words, phrases and markdown
+lines the compressor can refer back to from the first byte), and inflated
+when the column is loaded. Listing and stats queries never select these
+columns, so they never pay for decompression.
+
+Storage format (the SQLite value type tells the two apart):
+- TEXT: stored as is (short values, or values that did not compress)
+- BLOB: 1-byte format tag, 2-byte dictionary id (0 = no dictionary), raw deflate stream
+
+Dictionaries live in the compression_dicts table and are never changed or
+deleted, so any row can always be decompressed. New writes use the newest
+dictionary of their column. The SQL function text_decompress() is registered
+on every connection so views (e.g. the search index source) can read the
+columns too.
+"""
+import re
+import sqlite3
+import struct
+import threading
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.types import TypeDecorator, Text
+
+from config import settings
+
+FORMAT_DEFLATE = 1
+HEADER = struct.Struct(">BH")
+
+# Deflate can only refer back 32 KiB, so a longer dictionary is wasted
+MAX_DICTIONARY_SIZE = 32768
+
+# Tables and columns stored with CompressedText, for the migration and compress_text.py
+COMPRESSED_COLUMNS = [
+    ("battles", "prompt"),
+    ("responses", "response_text"),
+    ("ratings", "reasoning"),
+]
+
+WORD_RE = re.compile(r"\S+")
+
+
+class DictionaryRegistry:
+    """
+    In-memory copy of compression_dicts.
+
+    init_db() loads it; a dictionary id it has not seen (a row written by
+    another process after startup) is read straight from the database file.
+    """
+
+    def __init__(self):
+        self.dictionaries: Dict[int, bytes] = {}
+        self.current: Dict[str, int] = {}  # column name -> newest dictionary id
+        self.lock = threading.Lock()
+
+    def add(self, dict_id: int, column: str, data: bytes):
+        with self.lock:
+            self.dictionaries[dict_id] = data
+            if dict_id > self.current.get(column, 0):
+                self.current[column] = dict_id
+
+    def get(self, dict_id: int) -> bytes:
+        if dict_id == 0:
+            return b""
+        if dict_id not in self.dictionaries:
+            self.load_from_file(settings.database_path)
+        try:
+            return self.dictionaries[dict_id]
+        except KeyError:
+            raise ValueError(f"Unknown compression dictionary {dict_id}")
+
+    def load_from_file(self, path: str):
+        try:
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                rows = conn.execute("SELECT id, column_name, data FROM compression_dicts").fetchall()
+            finally:
+                conn.close()
+        except sqlite3.OperationalError:
+            rows = []  # No database or table yet
+        for dict_id, column, data in rows:
+            self.add(dict_id, column, data)
+
+    async def load(self, conn):
+        result = await conn.execute(text("SELECT id, column_name, data FROM compression_dicts"))
+        for dict_id, column, data in result.all():
+            self.add(dict_id, column, data)
+
+
+registry = DictionaryRegistry()
+
+
+def compress_text(value: str, column: str) -> object:
+    """Return the value to store: the str itself, or the compressed bytes if smaller"""
+    raw = value.encode("utf-8")
+    if not settings.text_compression or len(raw) < settings.text_compression_min_bytes:
+        return value
+    dict_id = registry.current.get(column, 0)
+    dictionary = registry.get(dict_id)
+    if dictionary:
+        compressor = zlib.compressobj(settings.text_compression_level, zlib.DEFLATED, -15, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(settings.text_compression_level, zlib.DEFLATED, -15)
+    compressed = HEADER.pack(FORMAT_DEFLATE, dict_id) + compressor.compress(raw) + compressor.flush()
+    return compressed if len(compressed) < len(raw) else value
+
+
+def decompress_text(value):
+    """Inverse of compress_text; TEXT values and NULL pass through"""
+    if not isinstance(value, (bytes, memoryview)):
+        return value
+    value = bytes(value)
+    tag, dict_id = HEADER.unpack_from(value)
+    if tag != FORMAT_DEFLATE:
+        raise ValueError(f"Unknown compressed text format {tag}")
+    dictionary = registry.get(dict_id)
+    decompressor = (
+        zlib.decompressobj(-15, zdict=dictionary) if dictionary else zlib.decompressobj(-15)
+    )
+    return (decompressor.decompress(value[HEADER.size:]) + decompressor.flush()).decode("utf-8")
+
+
+class CompressedText(TypeDecorator):
+    """Text column compressed with the dictionary trained for `column`"""
+    impl = Text
+    cache_ok = True
+
+    def __init__(self, column: str, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.column = column
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return compress_text(value, self.column)
+
+    def process_result_value(self, value, dialect):
+        return decompress_text(value)
+
+
+def install_sql_functions(dbapi_connection):
+    """Register text_decompress(value) on a new DB-API connection"""
+    dbapi_connection.create_function("text_decompress", 1, decompress_text, deterministic=True)
+
+
+def train_dictionary(samples: Iterable[str], size: int = MAX_DICTIONARY_SIZE) -> bytes:
+    """
+    Build a zlib preset dictionary from sample values.
+
+    Counts whole lines and runs of 1-4 words across the samples and keeps
+    the ones that save the most bytes (occurrences x length). Deflate codes
+    nearer matches more cheaply, so the most valuable strings go last.
+    """
+    counts = Counter()
+    for sample in samples:
+        sample = sample[:8192]
+        for line in sample.splitlines():
+            line = line.strip()
+            if 3 < len(line) < 200:
+                counts[line + "\n"] += 1
+        words = WORD_RE.findall(sample)
+        for n in range(1, 5):
+            for i in range(len(words) - n + 1):
+                counts[" ".join(words[i:i + n]) + " "] += 1
+
+    scored = sorted(
+        ((count - 1) * len(segment.encode("utf-8")), segment)
+        for segment, count in counts.items() if count >= 3
+    )
+    chosen: List[bytes] = []
+    total = 0
+    for _, segment in reversed(scored):
+        data = segment.encode("utf-8")
+        if total + len(data) > size:
+            continue
+        chosen.append(data)
+        total += len(data)
+    return b"".join(reversed(chosen))
+
+
+async def sample_column(conn, table: str, column: str, limit: int) -> List[str]:
+    result = await conn.execute(text(
+        f"SELECT text_decompress({column}) FROM {table} WHERE {column} IS NOT NULL "
+        f"ORDER BY random() LIMIT :limit"
+    ), {"limit": limit})
+    return [row[0] for row in result.all()]
+
+
+async def train_column_dictionary(conn, table: str, column: str, min_samples: int = 50) -> Optional[int]:
+    """Train and store a new dictionary for a column; None if there is too little data"""
+    samples = await sample_column(conn, table, column, settings.text_compression_train_samples)
+    if len(samples) < min_samples:
+        return None
+    data = train_dictionary(samples)
+    if not data:
+        return None
+    dict_id = (await conn.execute(
+        text("INSERT INTO compression_dicts (column_name, data, created_at) "
+             "VALUES (:column, :data, CURRENT_TIMESTAMP) RETURNING id"),
+        {"column": column, "data": data}
+    )).scalar_one()
+    registry.add(dict_id, column, data)
+    return dict_id
+
+
+async def compress_column(conn, table: str, column: str, chunk_size: int = 500) -> Tuple[int, int]:
+    """
+    (Re)compress a column in id order, chunk_size rows at a time, with the
+    column's current dictionary. Rewrites TEXT values and values compressed
+    with an older dictionary. Returns (rows rewritten, bytes saved).
+    """
+    dict_id = registry.current.get(column, 0)
+    header = HEADER.pack(FORMAT_DEFLATE, dict_id)
+    rewritten = saved = 0
+    last_id = 0
+    while True:
+        rows = (await conn.execute(text(
+            f"SELECT id, {column} FROM {table} WHERE id > :last_id AND {column} IS NOT NULL "
+            f"ORDER BY id LIMIT :limit"
+        ), {"last_id": last_id, "limit": chunk_size})).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        updates = []
+        for row_id, value in rows:
+            if isinstance(value, bytes) and value[:HEADER.size] == header:
+                continue
+            plain = decompress_text(value)
+            stored = compress_text(plain, column)
+            if stored == value:
+                continue
+            old_size = len(value) if isinstance(value, bytes) else len(value.encode("utf-8"))
+            new_size = len(stored) if isinstance(stored, bytes) else len(stored.encode("utf-8"))
+            saved += old_size - new_size
+            updates.append({"id": row_id, "value": stored})
+        if updates:
+            await conn.execute(text(f"UPDATE {table} SET {column} = :value WHERE id = :id"), updates)
+            rewritten += len(updates)
+    return rewritten, saved
+
+
+async def compress_existing_rows(conn, retrain: bool = False):
+    """Train dictionaries where needed, then compress every compressed column"""
+    for table, column in COMPRESSED_COLUMNS:
+        if retrain or column not in registry.current:
+            await train_column_dictionary(conn, table, column)
+        rewritten, saved = await compress_column(conn, table, column)
+        if rewritten:
+            print(f"   {table}.{column}: compressed {rewritten} rows, saved {saved / 1024 / 1024:.2f} MB")
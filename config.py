@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Literal
+from typing import List, Literal
 
 
 class Settings(BaseSettings):
@@ -20,6 +20,62 @@ class Settings(BaseSettings):
     num_judges: int = 2  # Number of LLMs to use as judges (2 = faster, 4 = more accurate)
     api_timeout: int = 20  # Timeout in seconds for API calls
     
+    # Judge input compaction - each answer is trimmed to this many tokens before rating (0 = disabled)
+    judge_input_max_tokens: int = 2000
+    judge_input_head_ratio: float = 0.6  # Share of the kept text taken from the start of the answer
+    
+    # Winner policy used for new battles and update_all_winners.py (a key of winner_policies.POLICIES)
+    winner_policy: str = "tiebreaker/v1"
+    
+    # Statistical leaderboard (see leaderboard.py)
+    elo_k: float = 4.0  # Elo step per pairwise comparison
+    elo_initial_rating: float = 1000.0
+    rating_refit_interval_s: float = 300.0  # Background Bradley-Terry refit, skipped when no battle changed
+    rating_bootstrap_rounds: int = 200  # Bootstrap resamples for the confidence intervals
+    judge_stats_refresh_s: float = 60.0  # Background judge analytics refresh, only reads new battles
+    provider_health_checkpoint_s: float = 60.0  # Write the in-memory provider latency sketches this often
+    provider_health_retention_days: int = 90  # Hourly provider health rows older than this are dropped
+    response_cache_entries: int = 1024  # Serialized GET responses kept in memory (see response_cache.py)
+    import_batch_size: int = 5000  # Battles per transaction in bulk imports (see importer.py)
+    battle_max_concurrent: int = 4  # Battles running at once; more wait in the admission queue (see admission.py)
+    battle_queue_size: int = 32  # Waiting battles before new ones get 503
+    battle_queue_timeout_s: float = 30.0  # Queue-time SLO: longer (or expected longer) waits get 503
+    idempotency_ttl_s: int = 86400  # How long POST /api/battle results are replayed for a repeated Idempotency-Key
+    response_compression: bool = True  # gzip/brotli for clients that accept it (see http_compression.py)
+    response_compression_min_bytes: int = 1024  # Smaller responses are sent as is
+    response_gzip_level: int = 6  # zlib level 1-9
+    response_brotli_quality: int = 4  # 0-11; used when the brotli package is installed
+    
+    # Storage
+    database_path: str = "./battles.db"
+    blob_store_path: str = "./blobs"  # Content-addressed screenshot files (SHA-256 keyed)
+    image_thumbnail_widths: List[int] = [128, 256, 512]  # Allowed ?width= values for /api/battle/{id}/image
+    archive_path: str = "./archive"  # Monthly Parquet files of old battles (archive_battles.py)
+    
+    # SQLite performance profile ("tuned" = WAL + pragmas + single writer + read pool, "default" = plain SQLite)
+    sqlite_profile: Literal["tuned", "default"] = "tuned"
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"  # Durable with WAL; FULL also syncs on every commit
+    sqlite_cache_size_kb: int = 65536  # Page cache per connection (64 MB)
+    sqlite_mmap_size: int = 268435456  # Memory-mapped I/O window (256 MB)
+    sqlite_busy_timeout_ms: int = 5000  # Wait this long for locks held by other processes
+    sqlite_read_pool_size: int = 8  # Read-only connections for GET endpoints
+    sqlite_write_batch_size: int = 64  # Max write jobs committed together
+    sqlite_write_batch_ms: float = 5.0  # How long the writer waits to fill a batch
+    
+    # Write-behind: POST /api/battle answers once the battle is journaled, before it is committed (see journal.py)
+    write_behind: bool = False
+    write_behind_journal_path: str = "./battles.journal"  # Append-only segments (<path>.0, <path>.1, ...), replayed on startup
+    write_behind_max_pending: int = 1000  # Battles waiting for their commit before new battles get 503
+    write_behind_fsync: bool = True  # fsync every journal append (off = faster, may lose battles on power loss)
+    write_behind_segment_size: int = 1000  # Journal entries per segment file; a segment is deleted once all are committed
+    
+    # Text compression for prompts, responses and judge reasoning (see compression.py)
+    text_compression: bool = True  # False stores new values uncompressed (existing rows stay readable)
+    text_compression_level: int = 6  # zlib level 1-9
+    text_compression_min_bytes: int = 64  # Shorter values are stored as plain text
+    text_compression_train_samples: int = 2000  # Rows sampled per column to train a dictionary
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
@@ -1,80 +1,210 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy.orm import declarative_base, relationship
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, JSON
-from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import declarative_base, relationship, deferred
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, JSON, Index, LargeBinary
 from datetime import datetime
 
+from config import settings
+from storage import create_write_engine, create_read_engine, DatabaseWriter
+from compression import CompressedText, registry as compression_dictionaries
+
 Base = declarative_base()
 
-engine = create_async_engine(
-    "sqlite+aiosqlite:///./battles.db",
-    echo=False,
-)
+PROMPT_PREVIEW_LENGTH = 100
+
+engine = create_write_engine(settings.database_path)
 
 AsyncSessionLocal = async_sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
 
+# Read-only connection pool for GET endpoints
+read_engine = create_read_engine(settings.database_path)
+
+ReadSessionLocal = async_sessionmaker(
+    read_engine, class_=AsyncSession, expire_on_commit=False
+)
+
+# All API writes go through this single task (see storage.DatabaseWriter)
+writer = DatabaseWriter(
+    AsyncSessionLocal,
+    batch_size=settings.sqlite_write_batch_size,
+    batch_window_ms=settings.sqlite_write_batch_ms
+)
+
 
 class Battle(Base):
     __tablename__ = "battles"
     
     id = Column(Integer, primary_key=True, index=True)
-    prompt = Column(Text, nullable=False)
-    image_data = Column(Text, nullable=True)  # Base64 encoded screenshot (PNG/JPEG)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    prompt = Column(CompressedText("prompt"), nullable=False)
+    image_hash = Column(String(64), ForeignKey("blobs.hash"), nullable=True)  # SHA-256 of the screenshot in the blob store
+    image_data = deferred(Column(Text, nullable=True))  # Legacy inline base64 screenshot, moved to the blob store on startup
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    # Listing columns, written with the battle so /api/battles never reads prompt or image
+    prompt_preview = Column(String(PROMPT_PREVIEW_LENGTH + 3), nullable=True)  # First 100 characters of the prompt
+    has_image = Column(Integer, default=0)  # 0 or 1
+    winner_model = Column(String, nullable=True)  # Copy of the winning response's model_name
+    winner_policy = Column(String, nullable=True, index=True)  # Policy key that picked winner_model; NULL = stale (see winner_policies.py)
+    content_hash = Column(String(64), nullable=True, index=True)  # persistence.content_hash() of prompt, image and responses, for import dedupe
     
     responses = relationship("Response", back_populates="battle", cascade="all, delete-orphan")
     ratings = relationship("Rating", back_populates="battle", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # Keyset pagination filtered by winner; created_at alone is covered by ix_battles_created_at
+        # (SQLite appends the rowid id to every index, so both serve ORDER BY created_at, id)
+        Index("ix_battles_winner_model_created_at", "winner_model", "created_at"),
+    )
+
+
+class Blob(Base):
+    __tablename__ = "blobs"
+    
+    hash = Column(String(64), primary_key=True)  # SHA-256 hex digest of the content
+    mime_type = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)  # Number of battles referencing this blob
+    created_at = Column(DateTime, default=datetime.utcnow)
 
 
 class Response(Base):
     __tablename__ = "responses"
     
     id = Column(Integer, primary_key=True, index=True)
-    battle_id = Column(Integer, ForeignKey("battles.id"), nullable=False)
+    battle_id = Column(Integer, ForeignKey("battles.id"), nullable=False, index=True)
     model_name = Column(String, nullable=False)
-    response_text = Column(Text, nullable=False)
+    response_text = Column(CompressedText("response_text"), nullable=False)
     average_score = Column(Float, nullable=True)
     is_winner = Column(Integer, default=0)  # 0 or 1
+    latency_s = Column(Float, nullable=True)  # Seconds to get the response; NULL for battles saved before it was recorded
     
     battle = relationship("Battle", back_populates="responses")
     ratings = relationship("Rating", back_populates="response", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        Index("ix_responses_model_name_is_winner", "model_name", "is_winner"),
+        # "Battles with model X" listing filter: one index probe per candidate battle
+        Index("ix_responses_battle_id_model_name", "battle_id", "model_name"),
+    )
 
 
 class Rating(Base):
     __tablename__ = "ratings"
     
     id = Column(Integer, primary_key=True, index=True)
-    battle_id = Column(Integer, ForeignKey("battles.id"), nullable=False)
-    response_id = Column(Integer, ForeignKey("responses.id"), nullable=False)
+    battle_id = Column(Integer, ForeignKey("battles.id"), nullable=False, index=True)
+    response_id = Column(Integer, ForeignKey("responses.id"), nullable=False, index=True)
     judge_model = Column(String, nullable=False)  # Which model did the rating
     score = Column(Float, nullable=False)
-    reasoning = Column(Text, nullable=True)
+    reasoning = Column(CompressedText("reasoning"), nullable=True)
     
     battle = relationship("Battle", back_populates="ratings")
     response = relationship("Response", back_populates="ratings")
 
 
+class ModelStats(Base):
+    """Per-model leaderboard totals, kept in step with battle writes and deletes"""
+    __tablename__ = "model_stats"
+    
+    model_name = Column(String, primary_key=True)
+    battles = Column(Integer, nullable=False, default=0)  # Responses from this model
+    wins = Column(Integer, nullable=False, default=0)
+    score_count = Column(Integer, nullable=False, default=0)  # Responses with a non-NULL average_score
+    score_sum = Column(Float, nullable=False, default=0.0)
+    score_sumsq = Column(Float, nullable=False, default=0.0)
+
+
+class CompressionDict(Base):
+    """Trained zlib dictionaries for the compressed text columns; rows are never changed"""
+    __tablename__ = "compression_dicts"
+    
+    id = Column(Integer, primary_key=True)  # Stored in the header of every value compressed with it
+    column_name = Column(String, nullable=False)  # prompt, response_text or reasoning
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class WinnerDecision(Base):
+    """The winner each policy picked for a battle, kept for A/B comparison when the live policy changes"""
+    __tablename__ = "winner_decisions"
+    
+    battle_id = Column(Integer, ForeignKey("battles.id"), primary_key=True)
+    policy = Column(String, primary_key=True)  # e.g. "tiebreaker/v1"
+    winner_model = Column(String, nullable=True)
+    method = Column(String, nullable=True)  # Tiebreaker level that decided
+    decided_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # Policy comparisons join two policies' decisions by battle
+        Index("ix_winner_decisions_policy_battle_id", "policy", "battle_id"),
+    )
+
+
+class EloRating(Base):
+    """Per-model Elo rating, updated with every saved battle (see leaderboard.py)"""
+    __tablename__ = "elo_ratings"
+    
+    model_name = Column(String, primary_key=True)
+    rating = Column(Float, nullable=False)
+    comparisons = Column(Integer, nullable=False, default=0)  # Pairwise comparisons counted
+
+
+class ModelDailyStats(Base):
+    """Per-model, per-day totals for /api/stats/timeseries (see rollups.py)"""
+    __tablename__ = "model_daily_stats"
+    
+    day = Column(String(10), primary_key=True)  # UTC date of the battle, YYYY-MM-DD
+    model_name = Column(String, primary_key=True)
+    battles = Column(Integer, nullable=False, default=0)
+    wins = Column(Integer, nullable=False, default=0)
+    score_count = Column(Integer, nullable=False, default=0)
+    score_sum = Column(Float, nullable=False, default=0.0)
+    score_sumsq = Column(Float, nullable=False, default=0.0)
+    latency_sketch = Column(LargeBinary, nullable=True)  # Serialized sketches.DDSketch of response latencies
+
+
+class ProviderHealthStats(Base):
+    """Per-hour API call health per provider and battle stage, checkpointed by provider_health.py"""
+    __tablename__ = "provider_health"
+    
+    hour = Column(String(13), primary_key=True)  # UTC hour, YYYY-MM-DDTHH
+    provider = Column(String, primary_key=True)
+    stage = Column(String, primary_key=True)  # "response" or "rating"
+    calls = Column(Integer, nullable=False, default=0)
+    errors = Column(Integer, nullable=False, default=0)  # Calls that failed after all attempts
+    retries = Column(Integer, nullable=False, default=0)  # Calls that needed more than one attempt
+    latency_sketch = Column(LargeBinary, nullable=True)  # sketches.DDSketch of successful call durations
+
+
+class IdempotencyKey(Base):
+    """Result of a POST /api/battle sent with an Idempotency-Key header, kept for settings.idempotency_ttl_s (see idempotency.py)"""
+    __tablename__ = "idempotency_keys"
+    
+    key = Column(String(255), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)  # SHA-256 of the request body; a reused key must match it
+    battle_id = Column(Integer, nullable=False, index=True)  # Keys are deleted with their battle
+    response = Column(CompressedText("idempotency_response"), nullable=False)  # JSON sent to the first request
+    created_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class Counter(Base):
+    """Named global counters (e.g. total_battles)"""
+    __tablename__ = "counters"
+    
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
         
-        # Migration: Add image_data column if it doesn't exist
-        try:
-            # Check if column exists by trying to query it
-            result = await conn.execute(text("PRAGMA table_info(battles)"))
-            columns = [row[1] for row in result.fetchall()]
-            
-            if 'image_data' not in columns:
-                print("🔧 Adding image_data column to battles table (migration)...")
-                await conn.execute(text("ALTER TABLE battles ADD COLUMN image_data TEXT"))
-                print("✅ Successfully migrated database: added image_data column")
-        except Exception as e:
-            # If column already exists or table doesn't exist yet, that's okay
-            error_msg = str(e).lower()
-            if 'duplicate column name' not in error_msg and 'no such table' not in error_msg:
-                print(f"⚠️  Migration note: {e}")
+        # Bring existing databases up to the current schema version
+        from migrations import run_migrations
+        await run_migrations(conn)
+        
+        await compression_dictionaries.load(conn)
 
 
 async def get_db():
@@ -84,3 +214,11 @@ async def get_db():
         finally:
             await session.close()
 
+
+async def get_read_db():
+    async with ReadSessionLocal() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
@@ -0,0 +1,178 @@
+"""
+Streaming export of battles with their responses and ratings.
+
+export_chunks() walks the battles in keyset chunks (by id, or by
+(created_at, id) when filtering by date, so the created_at index bounds
+the range) and reads each chunk's responses and ratings with one query
+each. Every chunk uses its own short read session: a long export never
+holds one read transaction open (which would stop WAL checkpoints), and
+only one chunk is in memory at a time, whatever the size of the database.
+Battles written during an export show up if their keys are still ahead of
+the cursor.
+
+Two formats:
+- ndjson: one battle per line, responses and ratings nested
+- csv: one row per rating (responses without ratings get one row with
+  empty judge columns)
+
+With gzip the encoded chunks go through one streaming zlib compressor.
+"""
+import io
+import csv
+import json
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, tuple_
+
+from database import Battle, Response, Rating
+
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+}
+
+CSV_COLUMNS = (
+    "battle_id", "created_at", "prompt", "image_hash", "winner_model", "winner_policy",
+    "model_name", "response_text", "average_score", "is_winner", "latency_s",
+    "judge_model", "score", "reasoning",
+)
+
+
+async def read_chunk(session, position: tuple, chunk_size: int, since_id: Optional[int],
+                     since: Optional[datetime], until: Optional[datetime],
+                     include_reasoning: bool) -> Tuple[List[Dict], tuple]:
+    """The next chunk_size battles after the keyset position as nested dicts, and the new position"""
+    by_date = since is not None or until is not None
+    key = (Battle.created_at, Battle.id) if by_date else (Battle.id,)
+    query = select(
+        Battle.id, Battle.created_at, Battle.prompt, Battle.image_hash, Battle.winner_model, Battle.winner_policy
+    )
+    if position:
+        query = query.where(tuple_(*key) > tuple_(*position) if by_date else Battle.id > position[0])
+    if since_id is not None:
+        query = query.where(Battle.id > since_id)
+    if since is not None:
+        query = query.where(Battle.created_at >= since)
+    if until is not None:
+        query = query.where(Battle.created_at < until)
+    battles = (await session.execute(query.order_by(*key).limit(chunk_size))).mappings().all()
+    if not battles:
+        return [], position
+
+    battle_ids = [battle["id"] for battle in battles]
+    responses: Dict[int, List[Dict]] = {}
+    by_response: Dict[int, Dict] = {}
+    result = await session.execute(
+        select(Response.id, Response.battle_id, Response.model_name, Response.response_text,
+               Response.average_score, Response.is_winner, Response.latency_s)
+        .where(Response.battle_id.in_(battle_ids))
+        .order_by(Response.battle_id, Response.id)
+    )
+    for response_id, battle_id, model_name, text, average_score, is_winner, latency in result:
+        response = {
+            "model": model_name, "text": text, "average_score": average_score,
+            "is_winner": bool(is_winner), "latency_s": latency, "ratings": [],
+        }
+        responses.setdefault(battle_id, []).append(response)
+        by_response[response_id] = response
+
+    rating_columns = [Rating.response_id, Rating.judge_model, Rating.score]
+    if include_reasoning:
+        rating_columns.append(Rating.reasoning)
+    result = await session.execute(
+        select(*rating_columns).where(Rating.battle_id.in_(battle_ids)).order_by(Rating.battle_id, Rating.id)
+    )
+    for row in result:
+        rating = {"judge": row[1], "score": row[2]}
+        if include_reasoning:
+            rating["reasoning"] = row[3] or ""
+        if row[0] in by_response:
+            by_response[row[0]]["ratings"].append(rating)
+
+    last = battles[-1]
+    return [
+        {
+            "id": battle["id"],
+            "created_at": battle["created_at"].isoformat() if battle["created_at"] else None,
+            "prompt": battle["prompt"],
+            "image_hash": battle["image_hash"],
+            "winner_model": battle["winner_model"],
+            "winner_policy": battle["winner_policy"],
+            "responses": responses.get(battle["id"], []),
+        }
+        for battle in battles
+    ], tuple(last[column.key] for column in key)
+
+
+async def export_chunks(
+    session_factory,
+    chunk_size: int = 500,
+    since_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    include_reasoning: bool = True
+) -> AsyncIterator[List[Dict]]:
+    """Yield the matching battles chunk by chunk, each chunk read in its own session"""
+    position: tuple = ()
+    while True:
+        async with session_factory() as session:
+            battles, position = await read_chunk(
+                session, position, chunk_size, since_id, since, until, include_reasoning
+            )
+        if not battles:
+            return
+        yield battles
+
+
+def encode_ndjson(battles: List[Dict]) -> bytes:
+    return "".join(json.dumps(battle, ensure_ascii=False) + "\n" for battle in battles).encode()
+
+
+def csv_columns(include_reasoning: bool) -> List[str]:
+    return [column for column in CSV_COLUMNS if include_reasoning or column != "reasoning"]
+
+
+def encode_csv(battles: List[Dict], include_reasoning: bool, header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(csv_columns(include_reasoning))
+    for battle in battles:
+        battle_columns = [battle["id"], battle["created_at"], battle["prompt"], battle["image_hash"],
+                          battle["winner_model"], battle["winner_policy"]]
+        for response in battle["responses"]:
+            response_columns = [response["model"], response["text"], response["average_score"],
+                                int(response["is_winner"]), response["latency_s"]]
+            for rating in response["ratings"] or [{}]:
+                rating_columns = [rating.get("judge"), rating.get("score")]
+                if include_reasoning:
+                    rating_columns.append(rating.get("reasoning"))
+                writer.writerow(battle_columns + response_columns + rating_columns)
+    return buffer.getvalue().encode()
+
+
+async def stream_export(chunks: AsyncIterator[List[Dict]], format: str, gzip: bool = False,
+                        include_reasoning: bool = True) -> AsyncIterator[bytes]:
+    """Encoded (and optionally gzipped) bytes of each chunk, for a StreamingResponse"""
+    if format not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None  # wbits 31: gzip container
+    first = True
+    async for battles in chunks:
+        if format == "ndjson":
+            data = encode_ndjson(battles)
+        else:
+            data = encode_csv(battles, include_reasoning, header=first)
+        first = False
+        if compressor is not None:
+            data = compressor.compress(data)
+        if data:
+            yield data
+    if first and format == "csv":
+        # An empty export still gets its header row
+        data = encode_csv([], include_reasoning, header=True)
+        yield compressor.compress(data) if compressor is not None else data
+    if compressor is not None:
+        yield compressor.flush()
@@ -0,0 +1,54 @@
+"""
+JSON encoding for API responses.
+
+The payloads the endpoints build are dicts and lists of JSON types, plus
+numpy scalars from the statistics modules (judge_stats.py, leaderboard.py),
+so they need no schema or conversion step: orjson encodes them directly,
+about 50x faster than FastAPI's jsonable_encoder + json.dumps for a full
+battle (benchmarks/response_encoding.py). Anything orjson does not know
+(pydantic models, sets, ...) falls back to jsonable_encoder for that value
+only.
+
+orjson is optional (pip install orjson); without it the bytes come from
+the stdlib encoder, as before.
+"""
+import json
+from typing import Any
+
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def encode_default(value: Any) -> Any:
+    """A JSON-encodable stand-in for a value the encoder does not know"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    # jsonable_encoder cannot convert numpy values: anything nested in its
+    # result comes back through this function
+    return jsonable_encoder(value)
+
+
+def dumps(content: Any) -> bytes:
+    """Compact UTF-8 JSON, the same bytes for both encoders"""
+    if orjson is not None:
+        return orjson.dumps(
+            content, default=encode_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        )
+    return json.dumps(
+        content, default=encode_default, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with dumps(); the app's default response class"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -10,6 +10,7 @@ import './BattleResultsTab.css'
 function BattleResultsTab({ battle, battles, activeChatId, onAddToChat, onBattleDeleted }) {
   const [selectedBattle, setSelectedBattle] = useState(battle)
   const [allBattles, setAllBattles] = useState([])
+  const [nextCursor, setNextCursor] = useState(null)
   const [loading, setLoading] = useState(false)
   const [deleting, setDeleting] = useState(false)
   
@@ -134,14 +135,26 @@ function BattleResultsTab({ battle, battles, activeChatId, onAddToChat, onBattle
   const loadBattles = async () => {
     try {
       const response = await axios.get('/api/battles')
-      setAllBattles(response.data)
-      return response.data
+      setAllBattles(response.data.battles)
+      setNextCursor(response.data.next_cursor)
+      return response.data.battles
     } catch (err) {
       console.error('Failed to load battles:', err)
       return []
     }
   }
 
+  const loadMoreBattles = async () => {
+    if (!nextCursor) return
+    try {
+      const response = await axios.get('/api/battles', { params: { cursor: nextCursor } })
+      setAllBattles((battles) => [...battles, ...response.data.battles])
+      setNextCursor(response.data.next_cursor)
+    } catch (err) {
+      console.error('Failed to load more battles:', err)
+    }
+  }
+
   const handleBattleSelect = async (battleId) => {
     if (battleId === selectedBattle?.id) return
     
@@ -196,9 +209,7 @@ function BattleResultsTab({ battle, battles, activeChatId, onAddToChat, onBattle
       await axios.delete(`/api/battle/${battleId}`)
       
       // Reload battles list to get the updated list
-      const updatedBattlesResponse = await axios.get('/api/battles')
-      const updatedBattles = updatedBattlesResponse.data
-      setAllBattles(updatedBattles)
+      const updatedBattles = await loadBattles()
       
       // If we deleted the currently selected battle, clear it or select another
       if (selectedBattle?.id === battleId) {
@@ -281,6 +292,16 @@ function BattleResultsTab({ battle, battles, activeChatId, onAddToChat, onBattle
               </option>
             ))}
           </select>
+          {nextCursor && (
+            <button
+              className="load-more-button"
+              onClick={loadMoreBattles}
+              disabled={loading}
+              title="Load older battles"
+            >
+              Load older
+            </button>
+          )}
           {selectedBattle && (
             <>
               {onAddToChat && !isBattleInChat(selectedBattle.id) && (
@@ -312,9 +333,9 @@ function BattleResultsTab({ battle, battles, activeChatId, onAddToChat, onBattle
         <>
           <div className="prompt-section">
             <h3>Original Prompt:</h3>
-            {selectedBattle.image_data && (
+            {selectedBattle.image_url && (
               <div className="battle-screenshot">
-                <img src={selectedBattle.image_data} alt="Screenshot" />
+                <img src={selectedBattle.image_url} alt="Screenshot" />
               </div>
             )}
             <p className="prompt-text">{selectedBattle.prompt}</p>
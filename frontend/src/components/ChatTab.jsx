@@ -266,7 +266,19 @@ function ChatTab({
       }
       
       console.log('🚀 Sending battle request to /api/battle')
-      const battleResponse = await axios.post('/api/battle', requestPayload)
+      // One key per submission: a retry replays this battle instead of paying for another one
+      const idempotencyKey = crypto.randomUUID()
+      const postBattle = () => axios.post('/api/battle', requestPayload, {
+        headers: { 'Idempotency-Key': idempotencyKey }
+      })
+      let battleResponse
+      try {
+        battleResponse = await postBattle()
+      } catch (err) {
+        if (err.response) throw err  // The server answered; only lost requests are retried
+        console.warn('⚠️ Battle request lost, retrying with the same Idempotency-Key')
+        battleResponse = await postBattle()
+      }
       console.log('✅ Received battle response:', battleResponse.data)
       const battleData = battleResponse.data
       
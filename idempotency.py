@@ -0,0 +1,138 @@
+"""
+Idempotency keys for POST /api/battle.
+
+A client that sends an Idempotency-Key header can retry (after a timeout,
+a dropped connection, a double click) without paying for a second battle:
+- while the first request is still running, the retry waits for it and
+  gets the same result (or the same error)
+- once it has finished, the retry gets the stored response at once, with
+  an Idempotent-Replayed: true header
+- a failed battle stores nothing, so a retry runs it again
+
+Running requests are tracked in memory (one process serves the app, like
+the single writer). Finished ones are kept in the `idempotency_keys` table
+for settings.idempotency_ttl_s: key, a fingerprint of the request body,
+the battle id and the response, saved in the same transaction as the
+battle (in write-behind mode the key travels in the journal entry, and
+stays in memory until it is committed). Expired rows are deleted when new
+keys are saved. Reusing a key with a different request body is an error (422).
+"""
+import json
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+from typing import Awaitable, Dict, Optional, Set, Tuple
+
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config import settings
+from database import IdempotencyKey
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different request"""
+
+
+def fingerprint(body: str) -> str:
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self, ttl_s: int):
+        self.ttl_s = ttl_s
+        self.in_flight: Dict[str, Tuple[str, asyncio.Future]] = {}  # key -> (fingerprint, response future)
+        self.saving: Set[asyncio.Task] = set()  # Waits for write-behind commits, referenced so they are not garbage collected
+
+    async def begin(self, session, key: str, request_fingerprint: str) -> Optional[Dict]:
+        """
+        The response for a key seen before (waiting for it while its first
+        request runs), or None when the caller owns the key and must run the
+        battle, then call finish() or fail().
+        """
+        entry = self.in_flight.get(key)
+        if entry is not None:
+            if entry[0] != request_fingerprint:
+                raise IdempotencyConflict(key)
+            # Shielded: a retry that goes away must not cancel the first request's result
+            return await asyncio.shield(entry[1])
+
+        # Claim the key before reading, so a retry arriving meanwhile waits for us
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = (request_fingerprint, future)
+        try:
+            stored = (await session.execute(
+                select(IdempotencyKey.fingerprint, IdempotencyKey.response)
+                .where(IdempotencyKey.key == key, IdempotencyKey.expires_at > datetime.utcnow())
+            )).one_or_none()
+        except BaseException as e:
+            self.fail(key, e)
+            raise
+        if stored is None:
+            return None
+        self.in_flight.pop(key, None)
+        if stored.fingerprint != request_fingerprint:
+            future.set_exception(IdempotencyConflict(key))
+            future.exception()  # Retrieved here: nobody may be waiting
+            raise IdempotencyConflict(key)
+        response = json.loads(stored.response)
+        future.set_result(response)
+        return response
+
+    def finish(self, key: str, response: Dict, saved: Optional[Awaitable] = None):
+        """
+        Hand the response to the retries waiting for it. `saved` completes
+        once the key is committed (write-behind); until then retries are
+        still answered from memory.
+        """
+        entry = self.in_flight.get(key)
+        if entry is None:
+            return
+        if not entry[1].done():
+            entry[1].set_result(response)
+        if saved is None:
+            self.in_flight.pop(key, None)
+            return
+
+        def forget(task: asyncio.Task):
+            self.saving.discard(task)
+            if self.in_flight.get(key) is entry:
+                del self.in_flight[key]
+
+        task = asyncio.ensure_future(saved)
+        self.saving.add(task)
+        task.add_done_callback(forget)
+
+    def fail(self, key: str, error: BaseException):
+        """Pass the error on to waiting retries; the key is free again"""
+        entry = self.in_flight.pop(key, None)
+        if entry is None or entry[1].done():
+            return
+        if isinstance(error, asyncio.CancelledError):
+            entry[1].cancel()
+        else:
+            entry[1].set_exception(error)
+            entry[1].exception()  # Retrieved here: nobody may be waiting
+
+    async def save(self, session, key: str, request_fingerprint: str, battle_id: int, response: Dict):
+        """Store a finished response in the caller's (write) transaction and drop expired keys"""
+        now = datetime.utcnow()
+        table = IdempotencyKey.__table__
+        await session.execute(delete(table).where(table.c.expires_at <= now))
+        stmt = sqlite_insert(table).values(
+            key=key,
+            fingerprint=request_fingerprint,
+            battle_id=battle_id,
+            response=json.dumps(response, ensure_ascii=False),
+            created_at=now,
+            expires_at=now + timedelta(seconds=self.ttl_s),
+        )
+        # begin() found no live row; replace one another process may have written since
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=["key"],
+            set_={column: stmt.excluded[column] for column in
+                  ("fingerprint", "battle_id", "response", "created_at", "expires_at")}
+        ))
+
+
+idempotency = IdempotencyStore(settings.idempotency_ttl_s)
@@ -0,0 +1,68 @@
+"""
+Bulk import battles from NDJSON (see importer.py).
+
+Reads the format written by /api/export (one battle per line), skips
+battles already in the database and invalid lines, and updates the
+leaderboard, Elo ratings, daily rollups and search index as it goes.
+Files ending in .gz are decompressed on the fly; "-" reads stdin.
+
+Usage:
+    python import_battles.py battles.ndjson
+    python import_battles.py battles.ndjson.gz --batch-size 10000
+    cat battles.ndjson | python import_battles.py -
+"""
+import sys
+import time
+import asyncio
+import argparse
+from typing import AsyncIterator
+
+from database import init_db, AsyncSessionLocal
+from importer import import_lines, iter_lines
+from config import settings
+
+READ_SIZE = 1 << 20
+
+
+async def read_file(path: str) -> AsyncIterator[bytes]:
+    stream = sys.stdin.buffer if path == "-" else open(path, "rb")
+    try:
+        while chunk := stream.read(READ_SIZE):
+            yield chunk
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+
+
+async def submit(job):
+    """Run one import batch in its own transaction (no server writer here)"""
+    async with AsyncSessionLocal() as session:
+        result = await job(session)
+        await session.commit()
+        return result
+
+
+async def run(path: str, batch_size: int):
+    await init_db()
+    started = time.perf_counter()
+
+    def progress(summary):
+        elapsed = time.perf_counter() - started
+        print(f"   {summary['lines']} lines, {summary['imported']} imported "
+              f"({summary['imported'] / elapsed:.0f}/s), {summary['duplicates']} duplicates, {summary['invalid']} invalid")
+
+    print(f"📥 Importing {'stdin' if path == '-' else path} in batches of {batch_size}...")
+    summary = await import_lines(iter_lines(read_file(path), gzip=path.endswith(".gz")), submit, batch_size, progress)
+    for error in summary["errors"]:
+        print(f"⚠️  Line {error['line']}: {error['error']}")
+    elapsed = time.perf_counter() - started
+    print(f"✅ Imported {summary['imported']} battles in {elapsed:.1f}s "
+          f"({summary['duplicates']} duplicates, {summary['invalid']} invalid lines)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="NDJSON file (.gz for gzipped), or - for stdin")
+    parser.add_argument("--batch-size", type=int, default=settings.import_batch_size, help="Battles per transaction")
+    args = parser.parse_args()
+    asyncio.run(run(args.path, args.batch_size))
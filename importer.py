@@ -0,0 +1,339 @@
+"""
+Bulk import of battles from NDJSON (python import_battles.py, POST /api/import).
+
+Each line is one battle in the format written by /api/export
+(export.py): prompt, created_at, responses with their ratings, and
+optionally the screenshot as `image` (a data URI) or `image_hash` (a blob
+already in the blob store). Exported ids, winners and policies are ignored:
+imported battles get new ids and the live winner policy decides them from
+their ratings (battles without ratings keep the exported is_winner, with a
+stale winner).
+
+Lines are validated one at a time as they stream in; invalid lines are
+counted and skipped. Valid battles are inserted in batches of
+settings.import_batch_size, one transaction each, with executemany Core
+INSERTs and explicit ids (journal.reserve_ids keeps them clear of
+write-behind ids), so nothing goes through the ORM identity map. Battles
+whose content hash (persistence.content_hash) is already stored, or seen
+earlier in the batch, are skipped. The leaderboard totals, Elo ratings,
+daily rollups and search index are updated per batch, like persist_battle
+does per battle.
+
+Battles created before the archive boundary (archive.py) are rejected:
+pruned battles are no longer in the database to dedupe against, their
+totals are already in the archive manifest, and those months are read
+only from Parquet.
+"""
+import zlib
+from datetime import datetime, timezone
+from functools import partial
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy import select, insert
+
+from database import Battle, Response, Rating, Blob
+from archive import archive
+from blob_store import blob_store, decode_data_uri
+from journal import reserve_ids
+from persistence import content_hash, make_prompt_preview, record_decisions
+from recompute import BattleRows, resolve_battle
+from winner_policies import WinnerPolicy, current_policy
+import model_stats
+import leaderboard
+import rollups
+import search
+
+MAX_ERRORS = 20  # Invalid lines reported back with their error; the rest are only counted
+
+
+class ImportRating(BaseModel):
+    judge: str = Field(min_length=1)
+    score: float = Field(ge=0, le=10)
+    reasoning: Optional[str] = ""
+
+
+class ImportResponse(BaseModel):
+    model: str = Field(min_length=1)
+    text: str
+    average_score: Optional[float] = None  # Mean of the ratings when missing
+    is_winner: bool = False  # Only used when there are no ratings
+    latency_s: Optional[float] = Field(None, ge=0)
+    ratings: List[ImportRating] = []
+
+
+class ImportRecord(BaseModel):
+    prompt: str = Field(min_length=1)
+    created_at: Optional[datetime] = None  # Import time when missing
+    image: Optional[str] = None  # Data URI or bare base64, like POST /api/battle
+    image_hash: Optional[str] = Field(None, pattern="^[0-9a-f]{64}$")
+    responses: List[ImportResponse] = Field(min_length=1)
+
+
+class ImportedBattle(NamedTuple):
+    """A validated line, ready to insert"""
+    line: int
+    content_hash: str
+    prompt: str
+    created_at: datetime
+    image: Optional[Tuple[bytes, str]]  # (bytes, mime type) to store
+    image_hash: Optional[str]
+    winner: Optional[str]
+    decided: bool  # Picked by the live policy (the battle has ratings)
+    method: Optional[str]  # Tiebreaker level that decided
+    responses: List[Dict]  # Response rows without ids
+    ratings: List[Tuple[str, str, float, str]]  # (model_name, judge_model, score, reasoning)
+
+
+def prepare_battle(
+    line: int, record: ImportRecord, policy: WinnerPolicy, archived_before: Optional[datetime] = None
+) -> ImportedBattle:
+    """Decide the winner and build the rows of one record; raises ValueError for unusable ones"""
+    models = [response.model for response in record.responses]
+    if len(set(models)) != len(models):
+        raise ValueError("responses: the same model appears twice")
+    if record.image and record.image_hash:
+        raise ValueError("give either image or image_hash, not both")
+
+    image, image_hash = None, record.image_hash
+    if record.image:
+        image = decode_data_uri(record.image)
+        image_hash = blob_store.digest(image[0])
+
+    created_at = record.created_at or datetime.utcnow()
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+    if archived_before is not None and created_at < archived_before:
+        raise ValueError(f"created_at: before {archived_before:%Y-%m-%d}, already archived")
+
+    average_scores = {}
+    ratings = []
+    for response in record.responses:
+        scores = [rating.score for rating in response.ratings]
+        average_score = response.average_score
+        if average_score is None and scores:
+            average_score = sum(scores) / len(scores)
+        average_scores[response.model] = average_score
+        ratings.extend(
+            (response.model, rating.judge, rating.score, rating.reasoning or "") for rating in response.ratings
+        )
+
+    if ratings:
+        winner, info = resolve_battle(BattleRows(
+            0, None, None,
+            [(model, score, 0) for model, score in average_scores.items()],
+            [(judge, model, score) for model, judge, score, _ in ratings]
+        ), policy)
+        method = info.get("method")
+    else:
+        winners = [response.model for response in record.responses if response.is_winner]
+        winner = winners[0] if len(winners) == 1 else None
+        method = None
+
+    return ImportedBattle(
+        line=line,
+        content_hash=content_hash(record.prompt, image_hash, {r.model: r.text for r in record.responses}),
+        prompt=record.prompt,
+        created_at=created_at,
+        image=image,
+        image_hash=image_hash,
+        winner=winner,
+        decided=bool(ratings),
+        method=method,
+        responses=[
+            {
+                "model_name": response.model,
+                "response_text": response.text,
+                "average_score": average_scores[response.model],
+                "is_winner": 1 if response.model == winner else 0,
+                "latency_s": response.latency_s,
+            }
+            for response in record.responses
+        ],
+        ratings=ratings,
+    )
+
+
+async def import_battles(session, battles: List[ImportedBattle], policy_key: str) -> Dict:
+    """
+    Insert the battles that are not stored yet, in the caller's transaction.
+
+    Safe to retry (everything but the idempotent blob writes rolls back).
+    Returns {"imported", "duplicates", "unknown_images": [line, ...]}.
+    """
+    unique: Dict[str, ImportedBattle] = {}
+    for battle in battles:
+        unique.setdefault(battle.content_hash, battle)
+    stored = set((await session.execute(
+        select(Battle.content_hash).where(Battle.content_hash.in_(list(unique)))
+    )).scalars())
+    new = [battle for digest, battle in unique.items() if digest not in stored]
+
+    # image_hash without the image only works for blobs the store already has
+    referenced = {battle.image_hash for battle in new if battle.image_hash and battle.image is None}
+    known_blobs = {}
+    if referenced:
+        known_blobs = {
+            digest: (mime_type, size)
+            for digest, mime_type, size in (await session.execute(
+                select(Blob.hash, Blob.mime_type, Blob.size).where(Blob.hash.in_(referenced))
+            )).all()
+        }
+    unknown_images = [
+        battle.line for battle in new
+        if battle.image_hash and battle.image is None and battle.image_hash not in known_blobs
+    ]
+    new = [battle for battle in new if battle.line not in unknown_images]
+    summary = {
+        "imported": len(new),
+        "duplicates": len(battles) - len(unique) + len(stored),
+        "unknown_images": unknown_images,
+    }
+    if not new:
+        return summary
+
+    first_id = await reserve_ids(session, len(new))
+    battle_rows, response_rows, ratings, decisions = [], [], [], []
+    response_stats: List[List[model_stats.ResponseStats]] = []
+    rollup_battles = []
+    for battle_id, battle in enumerate(new, start=first_id):
+        if battle.image is not None:
+            data, mime_type = battle.image
+            await blob_store.add_reference(session, blob_store.write(data), mime_type, len(data))
+        elif battle.image_hash:
+            await blob_store.add_reference(session, battle.image_hash, *known_blobs[battle.image_hash])
+        battle_rows.append({
+            "id": battle_id,
+            "prompt": battle.prompt,
+            "image_hash": battle.image_hash,
+            "created_at": battle.created_at,
+            "prompt_preview": make_prompt_preview(battle.prompt),
+            "has_image": 1 if battle.image_hash else 0,
+            "winner_model": battle.winner,
+            "winner_policy": policy_key if battle.decided else None,
+            "content_hash": battle.content_hash,
+        })
+        response_rows.extend({"battle_id": battle_id, **row} for row in battle.responses)
+        ratings.extend((battle_id, *rating) for rating in battle.ratings)
+        if battle.decided:
+            decisions.append((battle_id, battle.winner, battle.method))
+        stats = [(row["model_name"], row["average_score"], row["is_winner"]) for row in battle.responses]
+        response_stats.append(stats)
+        rollup_battles.append((
+            rollups.day_of(battle.created_at),
+            [(*response, row["latency_s"]) for response, row in zip(stats, battle.responses)]
+        ))
+
+    await session.execute(insert(Battle.__table__), battle_rows)
+    # SQLite assigns the response ids, like persist_battle: a max(id) + 1 read
+    # here could collide with a battle committed by another process
+    response_table = Response.__table__
+    returned = await session.execute(
+        insert(response_table).returning(
+            response_table.c.id, response_table.c.battle_id, response_table.c.model_name,
+            sort_by_parameter_order=True
+        ),
+        response_rows
+    )
+    response_ids = {
+        (battle_id, model_name): response_id for response_id, battle_id, model_name in returned.all()
+    }
+    rating_rows = [
+        {
+            "battle_id": battle_id,
+            "response_id": response_ids[battle_id, model_name],
+            "judge_model": judge_model,
+            "score": score,
+            "reasoning": reasoning,
+        }
+        for battle_id, model_name, judge_model, score, reasoning in ratings
+    ]
+    if rating_rows:
+        await session.execute(insert(Rating.__table__), rating_rows)
+    # After the ratings, as in persist_battle
+    await record_decisions(session, policy_key, decisions)
+
+    await model_stats.apply_battles(session, response_stats)
+    await leaderboard.apply_elo_battles(session, response_stats)
+    await rollups.apply_battles(session, rollup_battles)
+    # Through the view, like index_battle: removing a battle later re-reads the text the same way
+    await search.index_battles(session, [row["id"] for row in battle_rows])
+    await model_stats.bump_data_version(session)
+    return summary
+
+
+def describe_error(error: ValueError) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(part) for part in detail['loc']) or 'line'}: {detail['msg']}"
+            for detail in error.errors()[:3]
+        )
+    return str(error)
+
+
+async def iter_lines(chunks: AsyncIterator[bytes], gzip: bool = False) -> AsyncIterator[bytes]:
+    """Split a stream of (optionally gzipped) bytes into lines"""
+    decompressor = zlib.decompressobj(31) if gzip else None  # wbits 31: gzip container
+    buffer = b""
+    async for chunk in chunks:
+        if decompressor is not None:
+            try:
+                chunk = decompressor.decompress(chunk)
+            except zlib.error as e:
+                raise ValueError(f"Invalid gzip data: {e}")
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+
+async def import_lines(
+    lines: AsyncIterator[bytes],
+    submit: Callable[[Callable], Awaitable[Dict]],
+    batch_size: int,
+    on_batch: Optional[Callable[[Dict], None]] = None
+) -> Dict:
+    """
+    Validate NDJSON lines and import them in batches through submit(job)
+    (database.writer.submit, or a plain session for scripts). on_batch gets
+    the running summary after each batch.
+    """
+    policy = current_policy()
+    archived_before = archive.archived_before()
+    summary = {"lines": 0, "imported": 0, "duplicates": 0, "invalid": 0, "errors": []}
+
+    def reject(line: int, error: str):
+        summary["invalid"] += 1
+        if len(summary["errors"]) < MAX_ERRORS:
+            summary["errors"].append({"line": line, "error": error})
+
+    async def flush(batch: List[ImportedBattle]):
+        result = await submit(partial(import_battles, battles=batch, policy_key=policy.key))
+        summary["imported"] += result["imported"]
+        summary["duplicates"] += result["duplicates"]
+        for line in result["unknown_images"]:
+            reject(line, "image_hash: not in the blob store")
+        if on_batch is not None:
+            on_batch(summary)
+
+    batch: List[ImportedBattle] = []
+    async for line in lines:
+        summary["lines"] += 1
+        if not line.strip():
+            continue
+        try:
+            battle = prepare_battle(
+                summary["lines"], ImportRecord.model_validate_json(line), policy, archived_before
+            )
+        except ValueError as e:  # Includes pydantic's ValidationError
+            reject(summary["lines"], describe_error(e))
+            continue
+        batch.append(battle)
+        if len(batch) >= batch_size:
+            await flush(batch)
+            batch = []
+    if batch:
+        await flush(batch)
+    return summary
@@ -0,0 +1,348 @@
+"""
+Write-behind persistence for new battles (settings.write_behind).
+
+POST /api/battle normally waits until its battle is committed. In
+write-behind mode it instead:
+1. takes a battle id from BattleIdAllocator (blocks of ids reserved in the
+   counters table, so ids are known before the row exists),
+2. appends the battle to an append-only journal file and fsyncs it,
+3. hands the insert to the DatabaseWriter, which batches commits, and
+4. answers without waiting for the commit.
+
+The journal is the crash safety net: on startup every entry in it is
+replayed (battles already in the database are skipped). It is written in
+segments of segment_size entries (<path>.0, <path>.1, ...); a segment file
+is deleted as soon as all of its battles are committed, so the journal
+stays small under steady load. A segment with a failed commit is kept for
+the next startup's replay. Deleted battles are removed from the segments
+still on disk (forget()), so a replay cannot bring them back.
+
+At most max_pending battles can be waiting for their commit; has_capacity()
+lets the API refuse new battles (503) before spending LLM calls on them,
+and append() blocks while the limit is reached.
+"""
+import os
+import json
+import asyncio
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import select, func
+
+from config import settings
+from database import Battle, Counter, writer
+from blob_store import blob_store
+from persistence import persist_battle
+from idempotency import idempotency
+
+RESERVED_IDS = "battle_ids_reserved"
+
+# The parts of run_battle's results that persist_battle reads (the last two are optional)
+PERSISTED_RESULT_KEYS = (
+    "responses", "average_scores", "winner", "parsed_ratings", "winner_policy", "tiebreaker_info", "timing_info"
+)
+
+
+async def reserve_ids(session, count: int) -> int:
+    """
+    Reserve `count` consecutive battle ids above every stored or reserved
+    one, in the caller's (write) transaction; returns the first.
+    """
+    highest = (await session.execute(select(func.max(Battle.id)))).scalar() or 0
+    reserved = (await session.execute(
+        select(Counter.value).where(Counter.name == RESERVED_IDS)
+    )).scalar() or 0
+    start = max(highest, reserved) + 1
+    end = start + count - 1
+    if reserved:
+        await session.execute(
+            Counter.__table__.update().where(Counter.name == RESERVED_IDS).values(value=end)
+        )
+    else:
+        await session.execute(Counter.__table__.insert().values(name=RESERVED_IDS, value=end))
+    return start
+
+
+class BattleIdAllocator:
+    """
+    Hands out battle ids from blocks reserved in the counters table.
+
+    Reserving a block is one small write job per block_size battles; ids of
+    a block that was not used up before a restart are skipped, never
+    reused. While write-behind is on, every new battle id must come from
+    here: SQLite would otherwise assign max(id) + 1, which may be an id
+    already handed out but not yet committed.
+    """
+
+    def __init__(self, writer, block_size: int = 100):
+        self.writer = writer
+        self.block_size = block_size
+        self.next_id = 0
+        self.block_end = 0  # Last id of the current block
+        self.next_block: Optional[asyncio.Task] = None
+        self.lock = asyncio.Lock()
+
+    async def _reserve_block(self, session) -> int:
+        return await reserve_ids(session, self.block_size)
+
+    async def allocate(self) -> int:
+        async with self.lock:
+            if self.next_id == 0 or self.next_id > self.block_end:
+                task, self.next_block = self.next_block, None
+                self.next_id = await (task or self.writer.submit(self._reserve_block))
+                self.block_end = self.next_id + self.block_size - 1
+            battle_id = self.next_id
+            self.next_id += 1
+            # Reserve the next block once this one is half used, so no request
+            # waits for a reservation queued behind other writes
+            if self.next_block is None and self.block_end - battle_id < self.block_size // 2:
+                self.next_block = asyncio.create_task(self.writer.submit(self._reserve_block))
+            return battle_id
+
+
+def make_entry(battle_id: int, prompt: str, results: Dict, created_at: datetime,
+               image: Optional[Tuple[str, str, int]],
+               idempotency_key: Optional[Tuple[str, str, Dict]] = None) -> Dict:
+    """
+    Journal record for one battle; `image` is (hash, mime_type, size) of a
+    blob already written, `idempotency_key` is (key, request fingerprint,
+    response) when the request sent an Idempotency-Key
+    """
+    return {
+        "id": battle_id,
+        "prompt": prompt,
+        "results": {key: results[key] for key in PERSISTED_RESULT_KEYS if key in results},
+        "created_at": created_at.isoformat(),
+        "image": list(image) if image else None,
+        "idempotency_key": list(idempotency_key) if idempotency_key else None,
+    }
+
+
+def make_job(entry: Dict):
+    """Write job inserting a journaled battle; a no-op if it is already in the database"""
+    async def save_journaled_battle(session):
+        exists = (await session.execute(select(Battle.id).where(Battle.id == entry["id"]))).scalar()
+        if exists:
+            return False
+        image_hash = None
+        if entry["image"]:
+            image_hash, mime_type, size = entry["image"]
+            await blob_store.add_reference(session, image_hash, mime_type, size)
+        await persist_battle(
+            session,
+            entry["prompt"],
+            entry["results"],
+            image_hash=image_hash,
+            created_at=datetime.fromisoformat(entry["created_at"]),
+            battle_id=entry["id"]
+        )
+        if entry.get("idempotency_key"):
+            # Same transaction: a saved battle always has its key
+            key, request_fingerprint, response = entry["idempotency_key"]
+            await idempotency.save(session, key, request_fingerprint, entry["id"], response)
+        return True
+    return save_journaled_battle
+
+
+class WriteBehindJournal:
+    def __init__(self, path: str, writer, max_pending: int = 1000, fsync: bool = True, segment_size: int = 1000):
+        self.path = Path(path)
+        self.writer = writer
+        self.max_pending = max_pending
+        self.fsync = fsync
+        self.segment_size = segment_size
+        self.allocator = BattleIdAllocator(writer)
+        self.slots = asyncio.Semaphore(max_pending)
+        self.file_lock = asyncio.Lock()
+        self.pending: Dict[int, asyncio.Future] = {}  # battle id -> resolved once committed
+        self.tasks: Set[asyncio.Task] = set()  # Commit tasks, referenced so they are not garbage collected
+        self.segment = 0  # Segment new entries are appended to
+        self.segment_entries = 0  # Entries appended to it
+        self.outstanding: Dict[int, int] = {}  # Segment -> entries whose commit has not finished
+        self.failed_segments: Set[int] = set()  # Kept on disk for the next replay
+        self.stats = {"journaled": 0, "committed": 0, "replayed": 0, "failed": 0}
+
+    def has_capacity(self) -> bool:
+        return len(self.pending) < self.max_pending
+
+    def segment_path(self, segment: int) -> Path:
+        return self.path.with_name(f"{self.path.name}.{segment}")
+
+    def segment_files(self) -> List[Tuple[int, Path]]:
+        """(segment, path) of the journal files on disk, oldest first"""
+        segments = []
+        for path in self.path.parent.glob(f"{self.path.name}.*"):
+            suffix = path.name[len(self.path.name) + 1:]
+            if suffix.isdigit():
+                segments.append((int(suffix), path))
+        return sorted(segments)
+
+    def _append_line(self, path: Path, line: str):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def _rewrite(self, path: Path, keep: Callable[[Dict], bool]) -> int:
+        """Rewrite a journal file with only the entries `keep` accepts; returns how many are left"""
+        entries = self.read_entries(path)
+        kept = [entry for entry in entries if keep(entry)]
+        if len(kept) == len(entries):
+            return len(kept)
+        temporary = path.with_name(path.name + ".tmp")
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in kept)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(temporary, path)
+        return len(kept)
+
+    @staticmethod
+    def read_entries(path: Path) -> List[Dict]:
+        """Journal entries in order; a torn last line (crash mid-write) is ignored"""
+        if not path.exists():
+            return []
+        entries = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    print(f"⚠️  Skipping unreadable journal line in {path}")
+        return entries
+
+    async def replay(self) -> int:
+        """Commit every journaled battle not yet in the database, then delete the journal files"""
+        # The single, unsegmented journal file of older versions goes first
+        files = ([self.path] if self.path.exists() else []) + [path for _, path in self.segment_files()]
+        entries = [entry for path in files for entry in self.read_entries(path)]
+        # Their screenshots are not referenced until each commit
+        for entry in entries:
+            if entry["image"]:
+                blob_store.hold(entry["image"][0])
+        replayed = 0
+        for entry in entries:
+            if await self.writer.submit(make_job(entry)):
+                replayed += 1
+            self._unhold(entry)
+        async with self.file_lock:
+            for path in files:
+                path.unlink(missing_ok=True)
+        self.stats["replayed"] += replayed
+        return replayed
+
+    async def allocate_id(self) -> int:
+        return await self.allocator.allocate()
+
+    async def append(self, entry: Dict):
+        """Journal a battle and queue its insert; returns once the journal is on disk"""
+        # Before the first await: the caller has just written the screenshot,
+        # and a delete must not remove it until the reference is committed
+        if entry["image"]:
+            blob_store.hold(entry["image"][0])
+        try:
+            await self.slots.acquire()
+        except BaseException:
+            self._unhold(entry)
+            raise
+        battle_id = entry["id"]
+        self.pending[battle_id] = asyncio.get_running_loop().create_future()
+        try:
+            async with self.file_lock:
+                if self.segment_entries >= self.segment_size:
+                    self._next_segment()
+                segment = self.segment
+                await asyncio.to_thread(self._append_line, self.segment_path(segment), json.dumps(entry) + "\n")
+                self.segment_entries += 1
+                self.outstanding[segment] = self.outstanding.get(segment, 0) + 1
+        except BaseException:
+            self._finish(battle_id)
+            self._unhold(entry)
+            raise
+        self.stats["journaled"] += 1
+        task = asyncio.create_task(self._commit(entry, segment))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    @staticmethod
+    def _unhold(entry: Dict):
+        if entry["image"]:
+            blob_store.unhold(entry["image"][0])
+
+    def _next_segment(self):
+        self.segment += 1
+        self.segment_entries = 0
+
+    async def _commit(self, entry: Dict, segment: int):
+        battle_id = entry["id"]
+        try:
+            await self.writer.submit(make_job(entry))
+            self.stats["committed"] += 1
+            self._unhold(entry)
+        except Exception as e:
+            # Stays in the journal (and its screenshot held) for the next startup's replay
+            self.failed_segments.add(segment)
+            self.stats["failed"] += 1
+            print(f"❌ Write-behind commit of battle {battle_id} failed: {e}")
+        finally:
+            self._finish(battle_id)
+        async with self.file_lock:
+            self.outstanding[segment] -= 1
+            if segment == self.segment and segment in self.failed_segments:
+                # Keep new battles out of a segment that has to stay on disk
+                self._next_segment()
+            if self.outstanding[segment]:
+                return
+            del self.outstanding[segment]
+            if segment in self.failed_segments:
+                return
+            if segment == self.segment:
+                self._next_segment()
+            await asyncio.to_thread(self.segment_path(segment).unlink, True)
+
+    async def forget(self, battle_ids: Optional[Set[int]] = None):
+        """
+        Remove deleted battles (with None: every battle whose commit is not
+        pending) from the journal files, so a replay cannot bring them back
+        """
+        async with self.file_lock:
+            for segment, path in self.segment_files():
+                if battle_ids is None:
+                    keep = lambda entry: entry["id"] in self.pending
+                else:
+                    keep = lambda entry: entry["id"] not in battle_ids
+                left = await asyncio.to_thread(self._rewrite, path, keep)
+                if not left and not self.outstanding.get(segment):
+                    self.failed_segments.discard(segment)
+                    if segment == self.segment:
+                        self._next_segment()
+                    await asyncio.to_thread(path.unlink, True)
+
+    def _finish(self, battle_id: int):
+        future = self.pending.pop(battle_id, None)
+        if future is not None and not future.done():
+            future.set_result(None)
+        self.slots.release()
+
+    async def wait_for(self, battle_id: int):
+        """Wait until a write-behind battle is committed (returns at once if it is not pending)"""
+        future = self.pending.get(battle_id)
+        if future is not None:
+            await asyncio.shield(future)
+
+    async def drain(self):
+        """Wait for every pending battle to be committed"""
+        while self.pending:
+            await asyncio.gather(*[asyncio.shield(future) for future in list(self.pending.values())])
+
+
+write_behind = WriteBehindJournal(
+    settings.write_behind_journal_path,
+    writer,
+    max_pending=settings.write_behind_max_pending,
+    fsync=settings.write_behind_fsync,
+    segment_size=settings.write_behind_segment_size
+)
@@ -0,0 +1,152 @@
+"""
+Judge input compaction.
+
+The rating prompt pastes every contestant answer into every judge request, so
+judge input grows with the most verbose contestant. This module trims each
+answer to a token budget before it reaches the judges: the head and tail of the
+answer are kept verbatim and the omitted middle is replaced by an outline of
+its headings and code blocks.
+"""
+import re
+from typing import Dict, List, Tuple
+
+# Rough chars-per-token ratio for English prose and code across the providers
+CHARS_PER_TOKEN = 4
+
+HEADING_RE = re.compile(r'^\s{0,3}(#{1,6})\s+(.+?)\s*#*\s*$')
+FENCE_RE = re.compile(r'^\s*(```|~~~)\s*([\w+#.-]*)')
+OUTLINE_MARKER = "[... {tokens} tokens omitted for judging. Outline of the omitted section:\n{outline}\n...]"
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count of a text without a provider tokenizer"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def build_outline(text: str) -> List[str]:
+    """List the markdown headings and fenced code blocks of a text, in order"""
+    outline = []
+    in_code = False
+    code_lang = ""
+    code_lines = 0
+    for line in text.splitlines():
+        fence = FENCE_RE.match(line)
+        if fence:
+            if in_code:
+                outline.append(f"code block ({code_lang or 'text'}, {code_lines} lines)")
+                in_code = False
+            else:
+                in_code = True
+                code_lang = fence.group(2)
+                code_lines = 0
+            continue
+        if in_code:
+            code_lines += 1
+            continue
+        heading = HEADING_RE.match(line)
+        if heading:
+            outline.append(f"{'  ' * (len(heading.group(1)) - 1)}{heading.group(2)}")
+
+    if in_code:
+        # Unterminated fence at the end of the section
+        outline.append(f"code block ({code_lang or 'text'}, {code_lines}+ lines)")
+    return outline
+
+
+def _cut_head(text: str, max_chars: int) -> str:
+    """Take up to max_chars from the start, ending on a line break when possible"""
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind("\n", 0, max_chars)
+    return text[:cut if cut > max_chars // 2 else max_chars]
+
+
+def _cut_tail(text: str, max_chars: int) -> str:
+    """Take up to max_chars from the end, starting on a line break when possible"""
+    if len(text) <= max_chars:
+        return text
+    start = len(text) - max_chars
+    cut = text.find("\n", start)
+    return text[cut + 1 if 0 <= cut < start + max_chars // 2 else start:]
+
+
+def compact_response(text: str, max_tokens: int, head_ratio: float = 0.6) -> str:
+    """
+    Trim a response to roughly max_tokens tokens.
+
+    Keeps the head and tail verbatim and summarizes the omitted middle as an
+    outline of headings and code blocks, so judges still see the structure of
+    the full answer. The marker and outline count towards the budget.
+    Responses within budget (or max_tokens <= 0) are returned unchanged;
+    whitespace-only ones over budget become empty, there is nothing to keep.
+    """
+    if max_tokens <= 0 or estimate_tokens(text) <= max_tokens:
+        return text
+    if not text.strip():
+        return ""
+
+    budget_chars = max_tokens * CHARS_PER_TOKEN
+    # The outline may use at most a quarter of the budget
+    outline_budget = budget_chars // 4
+    # Longest marker around the outline: the omitted count is at most the whole text's
+    marker_chars = len(OUTLINE_MARKER.format(tokens=estimate_tokens(text), outline="")) + len("\n\n") * 2
+
+    keep_chars = max(budget_chars - outline_budget - marker_chars, 0)
+    head = _cut_head(text, int(keep_chars * head_ratio))
+    tail = _cut_tail(text[len(head):], keep_chars - len(head))
+    middle = text[len(head):len(text) - len(tail)]
+
+    outline_lines = []
+    used = 0
+    for entry in build_outline(middle):
+        line = f"- {entry}"
+        # Leave room for the "- ..." line
+        if used + len(line) + 1 > outline_budget - len("- ...\n"):
+            outline_lines.append("- ...")
+            break
+        outline_lines.append(line)
+        used += len(line) + 1
+
+    if outline_lines:
+        marker = OUTLINE_MARKER.format(tokens=estimate_tokens(middle), outline="\n".join(outline_lines))
+    else:
+        marker = f"[... {estimate_tokens(middle)} tokens omitted for judging ...]"
+
+    return f"{head.rstrip()}\n\n{marker}\n\n{tail.lstrip()}"
+
+
+def build_judge_digest(
+    responses: Dict[str, str],
+    max_tokens: int,
+    num_judges: int,
+    head_ratio: float = 0.6
+) -> Tuple[Dict[str, str], Dict]:
+    """
+    Compact every response once for all judges.
+
+    Returns the compacted texts keyed like `responses` and a stats dict with
+    the per-judge and per-battle token savings.
+    """
+    digest = {}
+    original_tokens = 0
+    judge_tokens = 0
+    truncated = []
+    for model_name, response_text in responses.items():
+        compacted = compact_response(response_text, max_tokens, head_ratio)
+        digest[model_name] = compacted
+        original_tokens += estimate_tokens(response_text)
+        judge_tokens += estimate_tokens(compacted)
+        if compacted is not response_text:
+            truncated.append(model_name)
+
+    saved_per_judge = max(original_tokens - judge_tokens, 0)
+    stats = {
+        "max_tokens_per_response": max_tokens,
+        "original_tokens": original_tokens,
+        "judge_tokens": judge_tokens,
+        "tokens_saved_per_judge": saved_per_judge,
+        "tokens_saved": saved_per_judge * num_judges,
+        "num_judges": num_judges,
+        "truncated_models": truncated
+    }
+    return digest, stats
@@ -0,0 +1,309 @@
+"""
+Judge analytics: how far judges agree, whether they favour their own answers,
+and how each one uses the score scale.
+
+Judges and answering models share the provider keys (openai, anthropic, ...),
+so every battle is a judge x model score matrix. Ratings are read in one
+columnar pass (ratings joined to responses, in battle id chunks) into a
+NumPy tensor T[battle, judge, model], and folded into sums that only grow:
+
+- calibration: per judge and per (judge, model) score count, sum and sum
+  of squares (mean, spread, leniency against the all-judge mean)
+- self-preference: each score minus the mean of the other judges' scores
+  for the same answer; a judge's self-preference is that delta on its own
+  answers minus the delta on everyone else's
+- Kendall tau-b between every pair of judges, per battle over the models
+  both scored, averaged over battles
+- Krippendorff's alpha (interval metric) with every answer as a unit,
+  from the sufficient statistics of observed and expected disagreement
+
+Because everything is a sum, JudgeStatsCache refreshes incrementally in the
+background: it only reads battles with ids above the last one folded in,
+and starts over when battles were deleted. Rating edits are only picked up
+by that full rebuild or a restart.
+"""
+import time
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import create_engine, select, func
+
+from config import settings
+from database import Battle, Response, Rating
+
+
+def plain_float(value) -> Optional[float]:
+    """A NumPy (or Python) number as a JSON-safe float; None for missing or NaN"""
+    if value is None:
+        return None
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+class JudgeStats:
+    """Additive judge statistics over a growing set of provider names"""
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.battles = 0  # Battles folded in, with or without ratings
+        self.rated_battles = 0
+        self.max_battle_id = 0
+        size = (0, 0)
+        self.score_count = np.zeros(size)  # [judge, model]
+        self.score_sum = np.zeros(size)
+        self.score_sumsq = np.zeros(size)
+        self.delta_sum = np.zeros(size)  # Score minus the other judges' mean, [judge, model]
+        self.delta_count = np.zeros(size)
+        self.tau_sum = np.zeros(size)  # Per-battle Kendall tau-b, [judge, judge]
+        self.tau_count = np.zeros(size)
+        # Krippendorff's alpha: pairable values, their sum and sum of squares, observed disagreement
+        self.alpha_n = 0.0
+        self.alpha_sum = 0.0
+        self.alpha_sumsq = 0.0
+        self.alpha_observed = 0.0
+
+    def index(self, names: List[str]) -> np.ndarray:
+        """Indexes of names, growing every matrix for names seen for the first time"""
+        for name in names:
+            if name not in self.names:
+                self.names.append(name)
+        size = len(self.names)
+        for attribute in ("score_count", "score_sum", "score_sumsq", "delta_sum", "delta_count",
+                          "tau_sum", "tau_count"):
+            matrix = getattr(self, attribute)
+            if matrix.shape[0] < size:
+                grown = np.zeros((size, size))
+                grown[:matrix.shape[0], :matrix.shape[1]] = matrix
+                setattr(self, attribute, grown)
+        lookup = {name: i for i, name in enumerate(self.names)}
+        return np.array([lookup[name] for name in names], dtype=np.int64)
+
+    def add_ratings(self, battle_ids, judges, models, scores):
+        """Fold in the ratings of whole battles (parallel sequences, any order)"""
+        if not len(battle_ids):
+            return
+        battle_ids = np.asarray(battle_ids, dtype=np.int64)
+        unique_names = sorted(set(judges) | set(models))
+        name_index = dict(zip(unique_names, self.index(unique_names)))
+        judge = np.array([name_index[name] for name in judges], dtype=np.int64)
+        model = np.array([name_index[name] for name in models], dtype=np.int64)
+        score = np.asarray(scores, dtype=np.float64)
+        battle_keys, battle = np.unique(battle_ids, return_inverse=True)
+        self.rated_battles += len(battle_keys)
+
+        size = len(self.names)
+        tensor = np.full((len(battle_keys), size, size), np.nan)
+        tensor[battle, judge, model] = score
+        rated = ~np.isnan(tensor)
+        values = np.where(rated, tensor, 0.0)
+
+        # Calibration
+        self.score_count += rated.sum(axis=0)
+        self.score_sum += values.sum(axis=0)
+        self.score_sumsq += (values ** 2).sum(axis=0)
+
+        # Self-preference: leave-one-out mean of the other judges for the same answer
+        judges_per_answer = rated.sum(axis=1, keepdims=True)  # [battle, 1, model]
+        answer_sum = values.sum(axis=1, keepdims=True)
+        others = judges_per_answer - 1
+        with np.errstate(invalid="ignore", divide="ignore"):
+            others_mean = (answer_sum - values) / others
+        comparable = rated & (others > 0)
+        delta = np.where(comparable, values - others_mean, 0.0)
+        self.delta_sum += delta.sum(axis=0)
+        self.delta_count += comparable.sum(axis=0)
+
+        # Kendall tau-b per judge pair over model pairs both judges scored
+        first, second = np.triu_indices(size, k=1)
+        signs = np.sign(values[:, :, first] - values[:, :, second])  # [battle, judge, model pair]
+        valid = rated[:, :, first] & rated[:, :, second]
+        signs = np.where(valid, signs, 0.0)
+        both = valid[:, :, None, :] & valid[:, None, :, :]  # [battle, judge, judge, model pair]
+        norm_i = np.einsum("bip,bijp->bij", signs ** 2, both)
+        norm_j = np.einsum("bjp,bijp->bij", signs ** 2, both)
+        concordance = np.einsum("bip,bjp,bijp->bij", signs, signs, both)
+        denominator = np.sqrt(norm_i * norm_j)
+        defined = denominator > 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            tau = np.where(defined, concordance / denominator, 0.0)
+        off_diagonal = ~np.eye(size, dtype=bool)
+        self.tau_sum += np.where(off_diagonal, tau.sum(axis=0), 0.0)
+        self.tau_count += np.where(off_diagonal, defined.sum(axis=0), 0)
+
+        # Krippendorff's alpha (interval): units are answers with at least two judges
+        units = judges_per_answer[:, 0, :]  # [battle, model]
+        pairable = units >= 2
+        unit_sum = answer_sum[:, 0, :]
+        unit_sumsq = (values ** 2).sum(axis=1)
+        self.alpha_n += units[pairable].sum()
+        self.alpha_sum += unit_sum[pairable].sum()
+        self.alpha_sumsq += unit_sumsq[pairable].sum()
+        # Sum over ordered value pairs within a unit of (a - b)^2 = 2 m sum(v^2) - 2 (sum v)^2
+        self.alpha_observed += (
+            (2 * units[pairable] * unit_sumsq[pairable] - 2 * unit_sum[pairable] ** 2) / (units[pairable] - 1)
+        ).sum()
+
+    def krippendorff_alpha(self) -> Optional[float]:
+        n = self.alpha_n
+        if n < 2:
+            return None
+        observed = self.alpha_observed / n
+        expected = (2 * n * self.alpha_sumsq - 2 * self.alpha_sum ** 2) / (n * (n - 1))
+        return plain_float(1 - observed / expected) if expected > 0 else None
+
+    def summary(self) -> Dict:
+        count = self.score_count
+        judge_count = count.sum(axis=1)
+        judge_sum = self.score_sum.sum(axis=1)
+        judge_sumsq = self.score_sumsq.sum(axis=1)
+        overall_mean = judge_sum.sum() / judge_count.sum() if judge_count.sum() else 0.0
+
+        judges = {}
+        for i, name in enumerate(self.names):
+            if not judge_count[i]:
+                continue
+            mean = judge_sum[i] / judge_count[i]
+            other_models = [m for m in range(len(self.names)) if m != i]
+            own_delta = self.delta_sum[i, i] / self.delta_count[i, i] if self.delta_count[i, i] else None
+            others_count = self.delta_count[i, other_models].sum()
+            others_delta = self.delta_sum[i, other_models].sum() / others_count if others_count else None
+            judges[name] = {
+                "ratings": int(judge_count[i]),
+                "mean_score": plain_float(mean),
+                "score_stddev": plain_float(max(judge_sumsq[i] / judge_count[i] - mean ** 2, 0.0) ** 0.5),
+                "leniency": plain_float(mean - overall_mean),
+                "mean_score_by_model": {
+                    model: plain_float(self.score_sum[i, m] / count[i, m])
+                    for m, model in enumerate(self.names) if count[i, m]
+                },
+                "own_answers_delta": plain_float(own_delta),
+                "other_answers_delta": plain_float(others_delta),
+                "self_preference": (
+                    plain_float(own_delta - others_delta)
+                    if own_delta is not None and others_delta is not None else None
+                ),
+                "self_ratings": int(self.delta_count[i, i]),
+            }
+
+        pairs = {}
+        for i, a in enumerate(self.names):
+            for j in range(i + 1, len(self.names)):
+                if self.tau_count[i, j]:
+                    pairs[f"{a}|{self.names[j]}"] = {
+                        "kendall_tau": plain_float(self.tau_sum[i, j] / self.tau_count[i, j]),
+                        "battles": int(self.tau_count[i, j]),
+                    }
+        tau_total = self.tau_count[np.triu_indices(len(self.names), k=1)].sum() if self.names else 0
+        mean_tau = (
+            self.tau_sum[np.triu_indices(len(self.names), k=1)].sum() / tau_total if tau_total else None
+        )
+        return {
+            "battles": int(self.battles),
+            "rated_battles": int(self.rated_battles),
+            "judges": judges,
+            "agreement": {
+                "krippendorff_alpha": self.krippendorff_alpha(),
+                "mean_kendall_tau": plain_float(mean_tau),
+                "judge_pairs": pairs,
+            },
+        }
+
+
+def fold_battles(stats: JudgeStats, conn, after_id: int, chunk_size: int = 20000):
+    """Read the ratings of battles with id > after_id in id chunks and fold them into stats"""
+    while True:
+        upper = conn.execute(
+            select(Battle.id).where(Battle.id > after_id).order_by(Battle.id).offset(chunk_size - 1).limit(1)
+        ).scalar()
+        battle_bounds = (Battle.id > after_id,) + ((Battle.id <= upper,) if upper else ())
+        covered, last_id = conn.execute(select(func.count(Battle.id), func.max(Battle.id)).where(*battle_bounds)).one()
+        bounds = (Rating.battle_id > after_id,) + ((Rating.battle_id <= upper,) if upper else ())
+        rows = conn.execute(
+            select(Rating.battle_id, Rating.judge_model, Response.model_name, Rating.score)
+            .join(Response, Response.id == Rating.response_id)
+            .where(*bounds)
+        ).all()
+        if rows:
+            stats.add_ratings(*zip(*rows))
+        # Counted from battles, not ratings, so the deletion check also covers battles without ratings
+        stats.battles += covered
+        stats.max_battle_id = max(stats.max_battle_id, last_id or 0)
+        if upper is None:
+            return
+        after_id = upper
+
+
+def refresh_stats(database_path: str, stats: Optional[JudgeStats]) -> JudgeStats:
+    """Fold new battles into stats, or rebuild from scratch when stats is None; blocking"""
+    engine = create_engine(f"sqlite:///file:{database_path}?mode=ro&uri=true")
+    try:
+        with engine.connect() as conn:
+            if stats is not None:
+                # Deleted battles can't be subtracted: rebuild when some are gone
+                still_there = conn.execute(
+                    select(func.count(Battle.id)).where(Battle.id <= stats.max_battle_id)
+                ).scalar()
+                if still_there != stats.battles:
+                    stats = None
+            if stats is None:
+                stats = JudgeStats()
+            fold_battles(stats, conn, stats.max_battle_id)
+    finally:
+        engine.dispose()
+    return stats
+
+
+class JudgeStatsCache:
+    """Background task keeping the judge statistics of all battles up to date"""
+
+    def __init__(self, database_path: str, interval_s: float):
+        self.database_path = database_path
+        self.interval_s = interval_s
+        self.stats: Optional[JudgeStats] = None
+        self.summary: Optional[Dict] = None
+        self.task: Optional[asyncio.Task] = None
+
+    async def refresh(self):
+        start = time.perf_counter()
+        # Work on a copy so a failed refresh leaves the cached stats intact
+        previous = self.stats
+        stats = await asyncio.to_thread(refresh_stats, self.database_path, copy_stats(previous))
+        summary = stats.summary()
+        summary["refreshed_at"] = datetime.utcnow().isoformat()
+        summary["refresh_seconds"] = round(time.perf_counter() - start, 3)
+        self.stats, self.summary = stats, summary
+
+    async def run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"❌ Judge statistics refresh failed: {e}")
+            await asyncio.sleep(self.interval_s)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+def copy_stats(stats: Optional[JudgeStats]) -> Optional[JudgeStats]:
+    if stats is None:
+        return None
+    copy = JudgeStats()
+    for attribute, value in vars(stats).items():
+        setattr(copy, attribute, value.copy() if isinstance(value, (np.ndarray, list)) else value)
+    return copy
+
+
+judge_stats = JudgeStatsCache(settings.database_path, settings.judge_stats_refresh_s)
@@ -0,0 +1,349 @@
+"""
+Statistical leaderboard: Elo and Bradley-Terry ratings with confidence intervals.
+
+Every battle is read as pairwise comparisons between its responses: the
+winner beats every other response, the rest are ordered by average_score
+(within 0.001 is a tie, worth half a win to each side).
+
+- Elo is updated incrementally: persist_battle applies a battle's
+  comparisons to the elo_ratings table in the battle's own transaction.
+  Deleting a battle or re-scoring winners does not rewind it;
+  rebuild_elo() replays every battle in id order (rebuild_stats.py).
+  Deletes are counted (elo_stale_battles, reported by /api/leaderboard)
+  until the next rebuild, so the drift is visible.
+- Bradley-Terry strengths are refitted from all battles by RatingRefitter,
+  a background task that reruns the fit with NumPy in a thread whenever
+  battles were added or deleted since the last fit, every
+  settings.rating_refit_interval_s. Confidence intervals come from a
+  Poisson bootstrap over battles (the comparisons of one battle are
+  resampled together). The latest fit is cached in memory for
+  /api/leaderboard.
+
+Both are reported on the Elo scale (400 points = 10:1 odds, 1000 average).
+Battles pruned into the archive are only in Elo, not in rebuilds or fits.
+"""
+import time
+import asyncio
+from datetime import datetime
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import create_engine, select, delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config import settings
+from database import Response, EloRating, Counter
+from model_stats import add_to_counter, read_data_version
+
+ELO_STALE_BATTLES = "elo_stale_battles"  # Battles deleted since Elo was last rebuilt
+
+TIE_TOLERANCE = 0.001  # Same float tolerance as the winner policies
+
+# (model_name, average_score, is_winner) for one response
+ResponseStats = Tuple[str, Optional[float], int]
+
+
+def pairwise_outcomes(responses: List[ResponseStats]) -> List[Tuple[str, str, float]]:
+    """(model_a, model_b, score of a) for every pair of responses in a battle"""
+    outcomes = []
+    for (model_a, score_a, winner_a), (model_b, score_b, winner_b) in combinations(responses, 2):
+        if winner_a and not winner_b:
+            outcome = 1.0
+        elif winner_b and not winner_a:
+            outcome = 0.0
+        else:
+            diff = (score_a or 0.0) - (score_b or 0.0)
+            outcome = 0.5 if abs(diff) < TIE_TOLERANCE else float(diff > 0)
+        outcomes.append((model_a, model_b, outcome))
+    return outcomes
+
+
+def elo_update(ratings: Dict[str, float], counts: Dict[str, int], responses: List[ResponseStats]):
+    """Apply one battle to ratings/counts in place; all pairs are scored against the pre-battle ratings"""
+    deltas: Dict[str, float] = {}
+    for model_a, model_b, outcome in pairwise_outcomes(responses):
+        rating_a = ratings.setdefault(model_a, settings.elo_initial_rating)
+        rating_b = ratings.setdefault(model_b, settings.elo_initial_rating)
+        expected_a = 1.0 / (1.0 + 10 ** ((rating_b - rating_a) / 400))
+        step = settings.elo_k * (outcome - expected_a)
+        deltas[model_a] = deltas.get(model_a, 0.0) + step
+        deltas[model_b] = deltas.get(model_b, 0.0) - step
+        counts[model_a] = counts.get(model_a, 0) + 1
+        counts[model_b] = counts.get(model_b, 0) + 1
+    for model_name, delta in deltas.items():
+        ratings[model_name] += delta
+
+
+async def apply_elo(session, responses: List[ResponseStats]):
+    """Update elo_ratings with one new battle, in the caller's transaction"""
+    await apply_elo_battles(session, [responses])
+
+
+async def apply_elo_battles(session, battles: List[List[ResponseStats]]):
+    """Update elo_ratings with new battles in order: one read and one write for all of them"""
+    battles = [responses for responses in battles if len(responses) >= 2]
+    if not battles:
+        return
+    models = {model_name for responses in battles for model_name, _, _ in responses}
+    rows = (await session.execute(
+        select(EloRating.model_name, EloRating.rating, EloRating.comparisons)
+        .where(EloRating.model_name.in_(models))
+    )).all()
+    ratings = {model_name: rating for model_name, rating, _ in rows}
+    counts = {model_name: comparisons for model_name, _, comparisons in rows}
+    for responses in battles:
+        elo_update(ratings, counts, responses)
+    await write_elo(session, ratings, counts)
+
+
+async def write_elo(session, ratings: Dict[str, float], counts: Dict[str, int]):
+    table = EloRating.__table__
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["model_name"],
+        set_={"rating": stmt.excluded.rating, "comparisons": stmt.excluded.comparisons}
+    )
+    await session.execute(stmt, [
+        {"model_name": model_name, "rating": rating, "comparisons": counts.get(model_name, 0)}
+        for model_name, rating in ratings.items()
+    ])
+
+
+async def rebuild_elo(session):
+    """Recompute elo_ratings by replaying every battle in id order"""
+    ratings: Dict[str, float] = {}
+    counts: Dict[str, int] = {}
+    result = await session.stream(
+        select(Response.battle_id, Response.model_name, Response.average_score, Response.is_winner)
+        .order_by(Response.battle_id, Response.id)
+    )
+    current_battle, responses = None, []
+    async for battle_id, model_name, average_score, is_winner in result:
+        if battle_id != current_battle and responses:
+            elo_update(ratings, counts, responses)
+            responses = []
+        current_battle = battle_id
+        responses.append((model_name, average_score, is_winner))
+    if responses:
+        elo_update(ratings, counts, responses)
+    await reset_elo(session)
+    if ratings:
+        await write_elo(session, ratings, counts)
+
+
+async def reset_elo(session):
+    await session.execute(delete(EloRating))
+    await session.execute(delete(Counter).where(Counter.name == ELO_STALE_BATTLES))
+
+
+async def mark_elo_stale(session, battles: int = 1):
+    """Count deleted battles whose comparisons are still in elo_ratings"""
+    await add_to_counter(session, ELO_STALE_BATTLES, battles)
+
+
+async def read_elo_stale(session) -> int:
+    return (await session.execute(
+        select(Counter.value).where(Counter.name == ELO_STALE_BATTLES)
+    )).scalar() or 0
+
+
+async def read_elo(session) -> Dict[str, Dict]:
+    result = await session.execute(select(EloRating))
+    return {
+        row.model_name: {"rating": row.rating, "comparisons": row.comparisons}
+        for row in result.scalars().all()
+    }
+
+
+# --- Bradley-Terry fit (blocking; run in a thread) ---
+
+def load_comparisons(conn) -> Dict:
+    """
+    Every battle's pairwise comparisons as NumPy arrays: model indexes a and
+    b, outcome (score of a), and the battle each comparison came from.
+    """
+    rows = conn.execute(
+        select(Response.battle_id, Response.model_name, Response.average_score, Response.is_winner)
+    ).all()
+    models: Dict[str, int] = {}
+    if not rows:
+        return {"models": [], "a": np.zeros(0, np.int64), "b": np.zeros(0, np.int64),
+                "outcome": np.zeros(0), "battle": np.zeros(0, np.int64), "battles": 0}
+    battle_ids, names, scores, winners = zip(*rows)
+    battle = np.array(battle_ids, dtype=np.int64)
+    model = np.array([models.setdefault(name, len(models)) for name in names], dtype=np.int64)
+    score = np.array([s or 0.0 for s in scores], dtype=np.float64)
+    winner = np.array(winners, dtype=bool)
+
+    order = np.argsort(battle, kind="stable")
+    battle, model, score, winner = battle[order], model[order], score[order], winner[order]
+    battle_ids, battle = np.unique(battle, return_inverse=True)
+
+    # Rows are grouped by battle, so the pairs of a battle are the rows d apart within its group
+    a, b, outcome, source = [], [], [], []
+    d = 1
+    while d < len(battle):
+        i = np.nonzero(battle[:-d] == battle[d:])[0]
+        if not len(i):
+            break
+        j = i + d
+        diff = score[i] - score[j]
+        outcome.append(np.select(
+            [winner[i] & ~winner[j], winner[j] & ~winner[i], np.abs(diff) < TIE_TOLERANCE, diff > 0],
+            [1.0, 0.0, 0.5, 1.0],
+            default=0.0
+        ))
+        a.append(model[i])
+        b.append(model[j])
+        source.append(battle[i])
+        d += 1
+    return {
+        "models": list(models),
+        "a": np.concatenate(a) if a else np.zeros(0, np.int64),
+        "b": np.concatenate(b) if b else np.zeros(0, np.int64),
+        "outcome": np.concatenate(outcome) if outcome else np.zeros(0),
+        "battle": np.concatenate(source) if source else np.zeros(0, np.int64),
+        "battles": len(battle_ids),
+    }
+
+
+def win_matrix(n_models: int, a, b, outcome, weights) -> np.ndarray:
+    """W[i, j] = (weighted) wins of model i over model j, ties split"""
+    size = n_models * n_models
+    wins = np.bincount(a * n_models + b, weights=weights * outcome, minlength=size)
+    wins += np.bincount(b * n_models + a, weights=weights * (1.0 - outcome), minlength=size)
+    return wins.reshape(n_models, n_models)
+
+
+def bradley_terry(wins: np.ndarray, iterations: int = 200, prior: float = 0.5) -> np.ndarray:
+    """
+    Fit strengths for a stack of win matrices (..., M, M) with the MM
+    algorithm; returns Elo-scale ratings (..., M). `prior` adds that many
+    virtual ties to every pair so models without wins stay finite.
+    """
+    n_models = wins.shape[-1]
+    off_diagonal = 1.0 - np.eye(n_models)
+    wins = wins + prior / 2 * off_diagonal
+    games = wins + np.swapaxes(wins, -1, -2)
+    total_wins = wins.sum(axis=-1)
+    strength = np.ones(wins.shape[:-1])
+    for _ in range(iterations):
+        pair_sums = strength[..., :, None] + strength[..., None, :]
+        updated = total_wins / (games / pair_sums).sum(axis=-1)
+        # Normalize to a geometric mean of 1 (average rating 1000)
+        updated /= np.exp(np.log(updated).mean(axis=-1, keepdims=True))
+        converged = np.max(np.abs(updated - strength)) < 1e-9
+        strength = updated
+        if converged:
+            break
+    return settings.elo_initial_rating + 400 * np.log10(strength)
+
+
+def fit_comparisons(comparisons: Dict, rounds: int, seed: int = 0) -> Dict:
+    """Bradley-Terry ratings and 95% bootstrap intervals for loaded comparisons"""
+    models = comparisons["models"]
+    n_models = len(models)
+    a, b, outcome, battle = comparisons["a"], comparisons["b"], comparisons["outcome"], comparisons["battle"]
+    if n_models < 2 or not len(a):
+        return {"models": {}, "battles": comparisons["battles"], "bootstrap_rounds": 0}
+
+    ratings = bradley_terry(win_matrix(n_models, a, b, outcome, np.ones(len(a))))
+
+    # Poisson bootstrap: each battle is drawn ~Poisson(1) times in every round
+    rng = np.random.default_rng(seed)
+    samples = np.empty((rounds, n_models, n_models))
+    for round_index in range(rounds):
+        weights = rng.poisson(1.0, comparisons["battles"]).astype(np.float64)[battle]
+        samples[round_index] = win_matrix(n_models, a, b, outcome, weights)
+    bootstrap = bradley_terry(samples) if rounds else ratings[None, :]
+    low, high = np.percentile(bootstrap, [2.5, 97.5], axis=0)
+
+    comparisons_per_model = np.bincount(a, minlength=n_models) + np.bincount(b, minlength=n_models)
+    return {
+        "models": {
+            model: {
+                "rating": float(ratings[i]),
+                "ci_low": float(low[i]),
+                "ci_high": float(high[i]),
+                "comparisons": int(comparisons_per_model[i]),
+            }
+            for i, model in enumerate(models)
+        },
+        "battles": comparisons["battles"],
+        "bootstrap_rounds": rounds,
+    }
+
+
+def fit_leaderboard(database_path: str, rounds: int) -> Dict:
+    """Load every battle over a read-only connection and fit; blocking"""
+    start = time.perf_counter()
+    engine = create_engine(f"sqlite:///file:{database_path}?mode=ro&uri=true")
+    try:
+        with engine.connect() as conn:
+            comparisons = load_comparisons(conn)
+    finally:
+        engine.dispose()
+    fit = fit_comparisons(comparisons, rounds)
+    fit["fitted_at"] = datetime.utcnow().isoformat()
+    fit["fit_seconds"] = round(time.perf_counter() - start, 3)
+    return fit
+
+
+class RatingRefitter:
+    """Background task keeping the latest Bradley-Terry fit in `self.fit`"""
+
+    def __init__(self, database_path: str, interval_s: float, rounds: int):
+        self.database_path = database_path
+        self.interval_s = interval_s
+        self.rounds = rounds
+        self.fit: Optional[Dict] = None
+        self.fitted_signature = None
+        self.task: Optional[asyncio.Task] = None
+        self.lock = asyncio.Lock()
+
+    async def signature(self, session) -> int:
+        """
+        The data version: bumped by every write the fit depends on (added,
+        deleted, imported or archived battles and re-decided winners)
+        """
+        return await read_data_version(session)
+
+    async def refit(self, session, force: bool = False) -> bool:
+        """Refit if battles changed since the last fit (or force); returns whether it ran"""
+        async with self.lock:
+            signature = await self.signature(session)
+            # End the read transaction; the fit reads on its own connection
+            await session.rollback()
+            if not force and signature == self.fitted_signature:
+                return False
+            self.fit = await asyncio.to_thread(fit_leaderboard, self.database_path, self.rounds)
+            self.fitted_signature = signature
+            return True
+
+    async def run(self, session_factory):
+        while True:
+            try:
+                async with session_factory() as session:
+                    if await self.refit(session):
+                        print(f"📈 Leaderboard refitted from {self.fit['battles']} battles "
+                              f"in {self.fit['fit_seconds']:.2f}s")
+            except Exception as e:
+                print(f"❌ Leaderboard refit failed: {e}")
+            await asyncio.sleep(self.interval_s)
+
+    def start(self, session_factory):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run(session_factory))
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+refitter = RatingRefitter(settings.database_path, settings.rating_refit_interval_s, settings.rating_bootstrap_rounds)
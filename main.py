@@ -1,22 +1,51 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request, Query, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse, Response as HTTPResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from typing import List, Dict, Optional
-from datetime import datetime
+from sqlalchemy import select
+from typing import List, Dict, Literal, Optional, Tuple
+from datetime import date, datetime, timedelta
+import time
+import asyncio
 from pydantic import BaseModel
 
 import database
-from database import Battle, Response, Rating, init_db
+from database import Battle, Blob, init_db
+from blob_store import blob_store, decode_data_uri
+import persistence
+import model_stats
+import leaderboard
+import rollups
+from judge_stats import judge_stats
+from provider_health import provider_health
+from persistence import persist_battle
+from queries import load_battle, list_battles
+from search import search_battles
+from export import FORMATS as EXPORT_FORMATS, export_chunks, stream_export
+from importer import import_lines, iter_lines
+from archive import archive, monthly_model_stats, ArchiveUnavailable
+from journal import write_behind, make_entry
+from response_cache import response_cache, etag_matches
+from admission import admission, AdmissionRejected
+from idempotency import idempotency, IdempotencyConflict, fingerprint
+from fast_json import FastJSONResponse
+from http_compression import CompressionMiddleware
 from battle_logic import run_battle
 from llm_clients import model_names
+from config import settings
 
 def get_model_display_name(model: str) -> str:
     """Get display name for a model"""
     return model_names.get(model, model)
 
-app = FastAPI(title="LLM Battle Arena")
+
+def get_image_url(battle_id: int, image_hash: Optional[str]) -> Optional[str]:
+    """URL of a battle's screenshot; the content hash makes it safe to cache forever"""
+    if not image_hash:
+        return None
+    return f"/api/battle/{battle_id}/image?v={image_hash[:16]}"
+
+app = FastAPI(title="LLM Battle Arena", default_response_class=FastJSONResponse)
 
 # CORS middleware
 app.add_middleware(
@@ -27,12 +56,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.response_compression:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.response_compression_min_bytes,
+        gzip_level=settings.response_gzip_level,
+        brotli_quality=settings.response_brotli_quality
+    )
+
 
 # Pydantic models
 class BattleRequest(BaseModel):
     prompt: str
     conversation_history: Optional[List[Dict[str, str]]] = None  # List of {role, content} messages
     image_data: Optional[str] = None  # Base64 encoded screenshot (data URI format: "data:image/png;base64,...")
+    priority: Literal["interactive", "batch"] = "interactive"  # "batch" jobs wait behind interactive (ChatTab) battles
 
 
 class BattleResponse(BaseModel):
@@ -51,180 +89,250 @@ class StatsResponse(BaseModel):
 @app.on_event("startup")
 async def startup():
     await init_db()
+    await database.writer.start()
+    # Battles journaled but not committed before a crash (also when write-behind was turned off since)
+    replayed = await write_behind.replay()
+    if replayed:
+        print(f"🔁 Replayed {replayed} write-behind battles from {write_behind.path}")
+    # Bradley-Terry fit for /api/leaderboard, refreshed in the background
+    leaderboard.refitter.start(database.ReadSessionLocal)
+    judge_stats.start()
+    provider_health.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await leaderboard.refitter.stop()
+    await judge_stats.stop()
+    # Before the writer stops: the last checkpoint goes through it
+    await provider_health.stop()
+    await write_behind.drain()
+    await database.writer.stop()
 
 
 @app.post("/api/battle", response_model=Dict)
 async def create_battle(
     request: BattleRequest,
-    db: AsyncSession = Depends(database.get_db)
+    idempotency_key: Optional[str] = Header(None, min_length=1, max_length=255)
 ):
-    """Run a battle and save results"""
+    """
+    Run a battle and save results.
+
+    With an Idempotency-Key header, a retry of the same request waits for
+    the first one while it runs and afterwards gets its stored response
+    (see idempotency.py), instead of starting another battle.
+    """
+    image = None
+    if request.image_data:
+        try:
+            image = decode_data_uri(request.image_data)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    if not idempotency_key:
+        return await run_and_save_battle(request, image)
+    
+    # Replays skip the capacity checks below: they cost no LLM calls
+    request_fingerprint = fingerprint(request.model_dump_json(exclude={"priority"}))
+    try:
+        async with database.ReadSessionLocal() as db:
+            replayed = await idempotency.begin(db, idempotency_key, request_fingerprint)
+    except IdempotencyConflict:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    if replayed is not None:
+        return FastJSONResponse(replayed, headers={"Idempotent-Replayed": "true"})
+    
+    try:
+        payload = await run_and_save_battle(request, image, (idempotency_key, request_fingerprint))
+    except BaseException as e:
+        idempotency.fail(idempotency_key, e)
+        raise
+    # Write-behind: the key is committed with the battle, answer retries from memory until then
+    idempotency.finish(
+        idempotency_key, payload, write_behind.wait_for(payload["id"]) if settings.write_behind else None
+    )
+    return payload
+
+
+async def run_and_save_battle(
+    request: BattleRequest,
+    image: Optional[Tuple[bytes, str]],
+    idempotency_entry: Optional[Tuple[str, str]] = None
+) -> Dict:
+    """Run the battle within the admission limits, save it and return the response payload"""
+    # Refuse before spending LLM calls when the write-behind queue is full
+    if settings.write_behind and not write_behind.has_capacity():
+        raise HTTPException(
+            status_code=503,
+            detail="Too many battles waiting to be saved, try again shortly",
+            headers={"Retry-After": "1"}
+        )
+    
+    # Wait for one of the settings.battle_max_concurrent slots, or refuse fast when the queue is too long
+    try:
+        await admission.acquire(request.priority)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Too many battles running, try again shortly ({e.reason})",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    started = time.monotonic()
+    
     try:
         print(f"🎯 Battle request received - Prompt length: {len(request.prompt)}, Has image: {bool(request.image_data)}, Image size: {len(request.image_data) if request.image_data else 0}")
         # Run the battle with conversation history and image data for context awareness
         results = await run_battle(request.prompt, conversation_history=request.conversation_history, image_data=request.image_data)
         
-        # Save to database
-        battle = Battle(
-            prompt=request.prompt, 
-            image_data=request.image_data,
-            created_at=datetime.utcnow()
-        )
-        db.add(battle)
-        await db.flush()
-        
-        # Create response records
-        response_records = {}
-        for model_name, response_text in results["responses"].items():
-            avg_score = results["average_scores"].get(model_name, 0.0)
-            is_winner = 1 if model_name == results["winner"] else 0
-            
-            response_record = Response(
-                battle_id=battle.id,
-                model_name=model_name,
-                response_text=response_text,
-                average_score=avg_score,
-                is_winner=is_winner
-            )
-            db.add(response_record)
-            await db.flush()
-            response_records[model_name] = response_record
-        
-        # Create rating records
-        for judge_model, ratings in results["parsed_ratings"].items():
-            for response_model, rating_data in ratings.items():
-                # Handle both dict format (with reasoning) and old float format
-                if isinstance(rating_data, dict):
-                    score = rating_data["score"]
-                    reasoning = rating_data.get("reasoning", "")
-                else:
-                    score = rating_data
-                    reasoning = ""
-                
-                rating_record = Rating(
-                    battle_id=battle.id,
-                    response_id=response_records[response_model].id,
-                    judge_model=judge_model,
-                    score=score,
-                    reasoning=reasoning
-                )
-                db.add(rating_record)
-        
-        await db.commit()
-        await db.refresh(battle)
-        
-        # Prepare response
-        response_list = []
-        for model_name, response_text in results["responses"].items():
-            response_list.append({
-                "model": model_name,
-                "model_display": results["model_names"][model_name],
-                "text": response_text,
-                "average_score": results["average_scores"][model_name],
-                "is_winner": model_name == results["winner"],
-                "ratings": {
-                    judge: (
-                        results["parsed_ratings"][judge][model_name] 
-                        if isinstance(results["parsed_ratings"][judge][model_name], dict)
-                        else {"score": results["parsed_ratings"][judge][model_name], "reasoning": ""}
-                    )
-                    for judge in results["parsed_ratings"].keys()
-                }
-            })
-        
-        # Sort by score descending
-        response_list.sort(key=lambda x: x["average_score"], reverse=True)
+        if settings.write_behind:
+            # Journal the battle and answer now; the writer commits it in a later batch
+            battle_id = await write_behind.allocate_id()
+            created_at = datetime.utcnow()
+            image_hash = blob_store.write(image[0]) if image else None
+            payload = battle_result_payload(battle_id, request.prompt, image_hash, created_at, results)
+            await write_behind.append(make_entry(
+                battle_id, request.prompt, results, created_at,
+                (image_hash, image[1], len(image[0])) if image else None,
+                (*idempotency_entry, payload) if idempotency_entry else None
+            ))
+            return payload
         
-        # Get tiebreaker info if available
-        tiebreaker_info = results.get("tiebreaker_info", {})
+        # Save to database through the single writer task
+        async def save_battle(session: AsyncSession):
+            # The screenshot goes to the blob store, the row keeps its hash
+            image_hash = await blob_store.acquire(session, *image) if image else None
+            battle_id, created_at = await persist_battle(session, request.prompt, results, image_hash=image_hash)
+            payload = battle_result_payload(battle_id, request.prompt, image_hash, created_at, results)
+            if idempotency_entry:
+                # Same transaction: a saved battle always has its key
+                await idempotency.save(session, *idempotency_entry, battle_id, payload)
+            return payload
         
-        return {
-            "id": battle.id,
-            "prompt": request.prompt,
-            "image_data": request.image_data,  # Include image data if present
-            "created_at": battle.created_at.isoformat(),
-            "responses": response_list,
-            "winner": results["winner"],
-            "winner_display": results["model_names"][results["winner"]],
-            "tiebreaker_info": tiebreaker_info
-        }
+        return await database.writer.submit(save_battle)
     
     except Exception as e:
-        await db.rollback()
         import traceback
         error_trace = traceback.format_exc()
         print(f"❌ Battle failed with error: {str(e)}")
         print(f"Full traceback:\n{error_trace}")
         raise HTTPException(status_code=500, detail=f"Battle failed: {str(e)}")
+    finally:
+        admission.release(time.monotonic() - started)
+
+
+def battle_result_payload(battle_id: int, prompt: str, image_hash: Optional[str], created_at: datetime, results: Dict) -> Dict:
+    """What POST /api/battle answers for a finished battle"""
+    response_list = []
+    for model_name, response_text in results["responses"].items():
+        response_list.append({
+            "model": model_name,
+            "model_display": results["model_names"][model_name],
+            "text": response_text,
+            "average_score": results["average_scores"][model_name],
+            "is_winner": model_name == results["winner"],
+            "ratings": {
+                judge: (
+                    results["parsed_ratings"][judge][model_name] 
+                    if isinstance(results["parsed_ratings"][judge][model_name], dict)
+                    else {"score": results["parsed_ratings"][judge][model_name], "reasoning": ""}
+                )
+                for judge in results["parsed_ratings"].keys()
+            }
+        })
+    
+    # Sort by score descending
+    response_list.sort(key=lambda x: x["average_score"], reverse=True)
+    
+    # Get tiebreaker info if available
+    tiebreaker_info = results.get("tiebreaker_info", {})
+    
+    return {
+        "id": battle_id,
+        "prompt": prompt,
+        "image_url": get_image_url(battle_id, image_hash),
+        "created_at": created_at.isoformat(),
+        "responses": response_list,
+        "winner": results["winner"],
+        "winner_display": results["model_names"][results["winner"]],
+        "tiebreaker_info": tiebreaker_info,
+        "judge_input": results.get("judge_input", {})
+    }
 
 
 @app.delete("/api/battle/{battle_id}")
-async def delete_battle(
-    battle_id: int,
-    db: AsyncSession = Depends(database.get_db)
-):
+async def delete_battle(battle_id: int):
     """Delete a specific battle and all its associated data"""
+    await write_behind.wait_for(battle_id)
     try:
-        from sqlalchemy import delete
-        # Check if battle exists
-        result = await db.execute(
-            select(Battle).where(Battle.id == battle_id)
+        # Out of the journal first: a replay after a crash must not bring it back
+        await write_behind.forget({battle_id})
+        found, orphaned_hash = await database.writer.submit(
+            lambda session: persistence.delete_battle(session, battle_id)
         )
-        battle = result.scalar_one_or_none()
-        
-        if not battle:
+        if not found:
             raise HTTPException(status_code=404, detail="Battle not found")
-        
-        # Delete ratings first (they reference responses)
-        await db.execute(delete(Rating).where(Rating.battle_id == battle_id))
-        # Delete responses (they reference battles)
-        await db.execute(delete(Response).where(Response.battle_id == battle_id))
-        # Finally delete the battle
-        await db.execute(delete(Battle).where(Battle.id == battle_id))
-        await db.commit()
+        if orphaned_hash:
+            # Re-checked in the writer: a battle saved since may reference the same screenshot
+            await database.writer.submit(
+                lambda session: blob_store.remove_if_unreferenced(session, orphaned_hash)
+            )
         
         return {"message": f"Battle {battle_id} deleted successfully"}
     except HTTPException:
         raise
     except Exception as e:
-        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to delete battle: {str(e)}")
 
 
 @app.get("/api/battle/{battle_id}")
 async def get_battle(
     battle_id: int,
-    db: AsyncSession = Depends(database.get_db)
+    request: Request,
+    format: Literal["full", "compact"] = "full",
+    db: AsyncSession = Depends(database.get_read_db)
 ):
-    """Get a specific battle by ID"""
-    result = await db.execute(
-        select(Battle).where(Battle.id == battle_id)
-    )
-    battle = result.scalar_one_or_none()
+    """
+    Get a specific battle by ID.
+    
+    format=compact drops display names and judge reasoning, returning each
+    response's ratings as {judge: score}. Sent with no-cache: a battle can
+    change under its URL (winner re-scored, or deleted and its id reused),
+    so clients revalidate their copy by ETag on every use.
+    """
+    # A write-behind battle may still be on its way to the database
+    await write_behind.wait_for(battle_id)
+    version = await model_stats.read_data_version(db)
+    key = ("battle", battle_id, format)
+    entry = response_cache.get(key, version)
+    if entry is None:
+        entry = response_cache.put(key, version, await battle_payload(db, battle_id, format))
+    return response_cache.respond(request, entry)
+
+
+async def battle_payload(db: AsyncSession, battle_id: int, format: str) -> Dict:
+    battle = await load_battle(db, battle_id)
     
     if not battle:
         raise HTTPException(status_code=404, detail="Battle not found")
     
-    # Get responses
-    responses_result = await db.execute(
-        select(Response).where(Response.battle_id == battle_id).order_by(Response.average_score.desc())
-    )
-    responses = responses_result.scalars().all()
-    
-    # Get ratings for each response
     response_data = []
-    for response in responses:
-        ratings_result = await db.execute(
-            select(Rating).where(Rating.response_id == response.id)
-        )
-        ratings = ratings_result.scalars().all()
+    for response in battle.responses:
+        if format == "compact":
+            response_data.append({
+                "model": response.model_name,
+                "text": response.response_text,
+                "average_score": response.average_score,
+                "is_winner": bool(response.is_winner),
+                "scores": {r.judge_model: r.score for r in response.ratings}
+            })
+            continue
         
         ratings_dict = {
             r.judge_model: {
                 "score": r.score,
                 "reasoning": r.reasoning or ""
             }
-            for r in ratings
+            for r in response.ratings
         }
         
         response_data.append({
@@ -239,66 +347,195 @@ async def get_battle(
     return {
         "id": battle.id,
         "prompt": battle.prompt,
-        "image_data": battle.image_data,  # Include image data if present
+        "image_url": get_image_url(battle.id, battle.image_hash),
         "created_at": battle.created_at.isoformat(),
         "responses": response_data,
-        "winner": next((r["model"] for r in response_data if r["is_winner"]), None)
+        "winner": next((r["model"] for r in response_data if r["is_winner"]), None),
+        "winner_policy": battle.winner_policy  # None while the winner is stale
     }
 
 
-@app.get("/api/battles")
-async def get_battles(
-    limit: int = 50,
-    db: AsyncSession = Depends(database.get_db)
+@app.get("/api/battle/{battle_id}/image")
+async def get_battle_image(
+    battle_id: int,
+    request: Request,
+    width: Optional[int] = None,
+    db: AsyncSession = Depends(database.get_read_db)
 ):
-    """Get recent battles"""
+    """Serve a battle's screenshot (or a cached thumbnail) as raw bytes"""
+    if width is not None and width not in settings.image_thumbnail_widths:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported thumbnail width {width}. Allowed: {settings.image_thumbnail_widths}"
+        )
+    await write_behind.wait_for(battle_id)
+    
     result = await db.execute(
-        select(Battle).order_by(Battle.created_at.desc()).limit(limit)
+        select(Battle.image_hash, Blob.mime_type)
+        .join(Blob, Blob.hash == Battle.image_hash)
+        .where(Battle.id == battle_id)
     )
-    battles = result.scalars().all()
+    row = result.one_or_none()
+    if not row:
+        raise HTTPException(status_code=404, detail="Image not found")
+    image_hash, mime_type = row
     
-    return [{
-        "id": battle.id,
-        "prompt": battle.prompt[:100] + "..." if len(battle.prompt) > 100 else battle.prompt,
-        "created_at": battle.created_at.isoformat()
-    } for battle in battles]
+    # Blobs are content-addressed, so a matching ETag means the client copy is current;
+    # checked before any image work
+    etag = f'"{image_hash}-w{width}"' if width is not None else f'"{image_hash}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    if etag_matches(request, etag):
+        return HTTPResponse(status_code=304, headers=headers)
+    
+    path = blob_store.path_for(image_hash)
+    if width is not None:
+        # PIL decoding and resizing would block the event loop
+        path, mime_type = await asyncio.to_thread(blob_store.thumbnail, image_hash, width, mime_type)
+    
+    return FileResponse(path, media_type=mime_type, headers=headers)
 
 
-@app.get("/api/stats")
-async def get_stats(db: AsyncSession = Depends(database.get_db)):
-    """Get aggregate statistics"""
-    # Get total battles
-    total_result = await db.execute(select(func.count(Battle.id)))
-    total_battles = total_result.scalar() or 0
-    
-    # Get wins per model
-    wins_result = await db.execute(
-        select(Response.model_name, func.count(Response.id))
-        .where(Response.is_winner == 1)
-        .group_by(Response.model_name)
+@app.get("/api/battles")
+async def get_battles(
+    request: Request,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    model: Optional[str] = None,
+    winner: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    db: AsyncSession = Depends(database.get_read_db)
+):
+    """Get battles newest first, one keyset page at a time (pass next_cursor back as cursor)"""
+    version = await model_stats.read_data_version(db)
+    key = ("battles", limit, cursor, model, winner, since, until)
+    entry = response_cache.get(key, version)
+    if entry is None:
+        try:
+            battles, next_cursor = await list_battles(
+                db, limit=limit, cursor=cursor, model=model, winner=winner, since=since, until=until
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        entry = response_cache.put(key, version, {
+            "battles": [{
+                "id": battle.id,
+                "prompt": battle.prompt_preview,
+                "has_image": bool(battle.has_image),
+                "winner_model": battle.winner_model,
+                "created_at": battle.created_at.isoformat()
+            } for battle in battles],
+            "next_cursor": next_cursor
+        })
+    return response_cache.respond(request, entry)
+
+
+@app.get("/api/export")
+async def export_battles(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    gzip: bool = False,
+    since_id: Optional[int] = Query(None, ge=0),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    include_reasoning: bool = True
+):
+    """
+    Stream battles with their responses and ratings as NDJSON (one battle
+    per line) or CSV (one row per rating), oldest first, in constant memory.
+    since_id exports only battles with a larger id (incremental exports).
+    """
+    # Sessions are opened per chunk inside the stream: a Depends() session would close before it runs
+    chunks = export_chunks(
+        database.ReadSessionLocal, since_id=since_id, since=since, until=until, include_reasoning=include_reasoning
     )
-    wins = {row[0]: row[1] for row in wins_result.all()}
-    
-    # Get average scores per model
-    avg_scores_result = await db.execute(
-        select(Response.model_name, func.avg(Response.average_score))
-        .group_by(Response.model_name)
+    media_type, extension = EXPORT_FORMATS[format]
+    filename = f"battles.{extension}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        stream_export(chunks, format, gzip=gzip, include_reasoning=include_reasoning),
+        media_type="application/gzip" if gzip else media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
     )
-    avg_scores = {row[0]: row[1] or 0.0 for row in avg_scores_result.all()}
+
+
+@app.post("/api/import")
+async def import_battles(request: Request):
+    """
+    Bulk import battles from an NDJSON body in the /api/export format
+    (Content-Encoding: gzip for compressed bodies). Battles already stored
+    are skipped; invalid lines are counted and the first ones reported.
+    """
+    encoding = request.headers.get("content-encoding", "identity")
+    if encoding not in ("identity", "gzip"):
+        raise HTTPException(status_code=415, detail="Content-Encoding must be gzip or identity")
+    try:
+        summary = await import_lines(
+            iter_lines(request.stream(), gzip=encoding == "gzip"), database.writer.submit, settings.import_batch_size
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    print(f"📥 Imported {summary['imported']} battles ({summary['duplicates']} duplicates, {summary['invalid']} invalid)")
+    return summary
+
+
+@app.get("/api/search")
+async def search(
+    q: str = Query(..., min_length=1, max_length=500),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    model: Optional[str] = None,
+    winner: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    db: AsyncSession = Depends(database.get_read_db)
+):
+    """Full-text search over prompts, responses and judge reasoning, best match first"""
+    try:
+        matches = await search_battles(
+            db, q, limit=limit, offset=offset, model=model, winner=winner, since=since, until=until
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    # Get all models
-    all_models = set(wins.keys()) | set(avg_scores.keys())
+    return {
+        "query": q,
+        "results": [{
+            "id": match.id,
+            "prompt": match.prompt_preview,
+            "has_image": bool(match.has_image),
+            "winner_model": match.winner_model,
+            "created_at": match.created_at.isoformat(),
+            "snippet": match.snippet,
+            "rank": match.rank
+        } for match in matches]
+    }
+
+
+@app.get("/api/stats")
+async def get_stats(request: Request, db: AsyncSession = Depends(database.get_read_db)):
+    """Get aggregate statistics from the materialized leaderboard (O(models) rows)"""
+    version = await model_stats.read_data_version(db)
+    entry = response_cache.get(("stats",), version)
+    if entry is None:
+        entry = response_cache.put(("stats",), version, await stats_payload(db))
+    return response_cache.respond(request, entry)
+
+
+async def stats_payload(db: AsyncSession) -> Dict:
+    stats, total_battles = await model_stats.read_model_stats(db)
     
     leaderboard = []
-    for model in all_models:
+    for model, totals in stats.items():
         # Get actual model name from config
         model_display = get_model_display_name(model)
         leaderboard.append({
             "model": model,
             "model_display": model_display,
-            "wins": wins.get(model, 0),
-            "average_score": round(avg_scores.get(model, 0.0), 2),
-            "win_rate": round((wins.get(model, 0) / total_battles * 100) if total_battles > 0 else 0, 2)
+            "wins": totals["wins"],
+            "average_score": round(totals["average_score"], 2),
+            "win_rate": round((totals["wins"] / total_battles * 100) if total_battles > 0 else 0, 2)
         })
     
     # Sort by wins descending, then by average score
@@ -310,21 +547,150 @@ async def get_stats(db: AsyncSession = Depends(database.get_db)):
     }
 
 
+@app.get("/api/leaderboard")
+async def get_leaderboard(db: AsyncSession = Depends(database.get_read_db)):
+    """
+    Elo (updated with every battle) and Bradley-Terry ratings with 95%
+    bootstrap intervals (from the latest background fit, None until the
+    first fit finishes), ranked by Bradley-Terry when available.
+    elo_stale_battles counts deleted battles still in Elo (until
+    rebuild_stats.py replays it).
+    """
+    elo = await leaderboard.read_elo(db)
+    elo_stale = await leaderboard.read_elo_stale(db)
+    fit = leaderboard.refitter.fit
+    fitted = fit["models"] if fit else {}
+    
+    models = []
+    for model in set(elo) | set(fitted):
+        bt = fitted.get(model)
+        models.append({
+            "model": model,
+            "model_display": get_model_display_name(model),
+            "elo": round(elo[model]["rating"], 1) if model in elo else None,
+            "rating": round(bt["rating"], 1) if bt else None,
+            "ci_low": round(bt["ci_low"], 1) if bt else None,
+            "ci_high": round(bt["ci_high"], 1) if bt else None,
+            "comparisons": elo[model]["comparisons"] if model in elo else bt["comparisons"]
+        })
+    models.sort(key=lambda m: (m["rating"] if m["rating"] is not None else float("-inf"), m["elo"] or 0), reverse=True)
+    for rank, entry in enumerate(models, 1):
+        entry["rank"] = rank
+    
+    return {
+        "leaderboard": models,
+        "elo_stale_battles": elo_stale,
+        "fitted_at": fit["fitted_at"] if fit else None,
+        "battles_fitted": fit["battles"] if fit else 0,
+        "bootstrap_rounds": fit["bootstrap_rounds"] if fit else 0
+    }
+
+
+@app.get("/api/stats/judges")
+async def get_judge_stats():
+    """
+    Judge agreement (Krippendorff's alpha, pairwise Kendall tau),
+    self-preference and score calibration per judge, from the background
+    judge_stats cache (None until its first refresh finishes).
+    """
+    summary = judge_stats.summary
+    if summary is None:
+        return {"battles": 0, "judges": {}, "agreement": None, "refreshed_at": None}
+    judges = {
+        judge: {"judge_display": get_model_display_name(judge), **stats}
+        for judge, stats in summary["judges"].items()
+    }
+    return {**summary, "judges": judges}
+
+
+@app.get("/api/providers/health")
+async def get_provider_health(
+    hours: int = Query(24, ge=1, le=24 * settings.provider_health_retention_days),
+    db: AsyncSession = Depends(database.get_read_db)
+):
+    """
+    Per provider and stage (response, rating) over the last `hours`: calls,
+    error and retry rates, and p50/p90/p99 latency of successful calls.
+    """
+    providers = await provider_health.read(db, hours)
+    return {
+        "hours": hours,
+        "providers": [
+            {"provider": name, "provider_display": get_model_display_name(name), "stages": stages}
+            for name, stages in providers.items()
+        ]
+    }
+
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Live server state: battle admission (running, queued, rejections, queue time) and the response cache"""
+    return {
+        "admission": admission.state(),
+        "response_cache": {**response_cache.stats, "entries": len(response_cache.entries)},
+        "write_behind_pending": len(write_behind.pending),
+    }
+
+
+@app.get("/api/stats/monthly")
+async def get_monthly_stats(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    db: AsyncSession = Depends(database.get_read_db)
+):
+    """Per-month model results over all history, archived months included"""
+    try:
+        rows = await monthly_model_stats(db, since=since, until=until)
+    except ArchiveUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    for row in rows:
+        row["model_display"] = get_model_display_name(row["model"])
+        row["average_score"] = round(row["average_score"], 2)
+    return {"months": rows, "archived_before": archive.archived_before()}
+
+
+@app.get("/api/stats/timeseries")
+async def get_timeseries(
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    interval: Literal["day", "week", "month"] = "day",
+    model: Optional[List[str]] = Query(None),
+    db: AsyncSession = Depends(database.get_read_db)
+):
+    """
+    Per-model battles, win rate (percent), score and latency quantiles per
+    day, week or month, from the daily rollups (days x models rows for any range).
+    Defaults to the last 90 days.
+    """
+    until = until or datetime.utcnow().date()
+    since = since or until - timedelta(days=89)
+    if since > until:
+        raise HTTPException(status_code=400, detail="since must not be after until")
+    series = await rollups.read_timeseries(db, since, until, interval, model)
+    return {
+        "since": since.isoformat(),
+        "until": until.isoformat(),
+        "interval": interval,
+        "models": [
+            {"model": name, "model_display": get_model_display_name(name), "points": points}
+            for name, points in sorted(series.items())
+        ]
+    }
+
+
 @app.delete("/api/stats")
-async def clear_stats(db: AsyncSession = Depends(database.get_db)):
+async def clear_stats():
     """Clear all battles and statistics"""
     try:
-        from sqlalchemy import delete
-        # Delete all ratings first (foreign key constraint)
-        await db.execute(delete(Rating))
-        # Delete all responses
-        await db.execute(delete(Response))
-        # Delete all battles
-        await db.execute(delete(Battle))
-        await db.commit()
+        # Journaled battles must not be committed (or replayed) after the delete,
+        # nor reference screenshots blob_store.clear() removes
+        await write_behind.drain()
+        await write_behind.forget()
+        await database.writer.submit(persistence.delete_all_battles)
+        blob_store.clear()
         return {"message": "All stats cleared successfully"}
     except Exception as e:
-        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to clear stats: {str(e)}")
 
 
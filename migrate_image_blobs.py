@@ -0,0 +1,40 @@
+"""
+Migration script to move inline base64 screenshots out of the battles table.
+Images are stored once per SHA-256 digest in the blob store and the battle row
+keeps only the digest in image_hash. The server also runs this migration on
+startup; running it by hand additionally VACUUMs battles.db to reclaim space.
+"""
+import asyncio
+import sqlite3
+from pathlib import Path
+
+from database import init_db
+
+
+def migrate_database():
+    db_path = Path("./battles.db")
+    
+    if not db_path.exists():
+        print("❌ Database file not found at ./battles.db")
+        print("💡 The database will be created automatically when you start the server.")
+        return
+    
+    size_before = db_path.stat().st_size
+    print(f"📦 Found database at {db_path} ({size_before / 1024 / 1024:.2f} MB)")
+    
+    print("🔧 Moving screenshots into the blob store...")
+    asyncio.run(init_db())
+    
+    print("🧹 Reclaiming free pages (VACUUM)...")
+    conn = sqlite3.connect(str(db_path))
+    try:
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    
+    size_after = db_path.stat().st_size
+    print(f"✅ Migration complete. battles.db: {size_before / 1024 / 1024:.2f} MB → {size_after / 1024 / 1024:.2f} MB")
+
+
+if __name__ == "__main__":
+    migrate_database()
@@ -0,0 +1,237 @@
+"""
+Versioned schema migrations.
+
+The schema version of battles.db is kept in SQLite's `PRAGMA user_version`.
+init_db() creates missing tables and then runs every migration newer than
+that version, in order, inside its transaction. Migrations must be
+idempotent: a fresh database gets its tables from create_all() and still runs
+them all once.
+
+To change the schema, add a function below and append it to MIGRATIONS with
+the next version number. Never renumber or remove an existing migration.
+"""
+from typing import Optional
+
+from sqlalchemy import text, select, bindparam
+
+
+async def get_table_columns(conn, table: str) -> list:
+    result = await conn.execute(text(f"PRAGMA table_info({table})"))
+    return [row[1] for row in result.fetchall()]
+
+
+async def create_missing_indexes(conn, tables: list):
+    """
+    Create the indexes declared on the models for `tables` that don't exist yet.
+
+    Indexes on columns a later migration adds are skipped; that migration
+    creates them.
+    """
+    from database import Base
+    from sqlalchemy import inspect
+
+    def create(sync_conn):
+        for table_name in tables:
+            existing = {column["name"] for column in inspect(sync_conn).get_columns(table_name)}
+            for index in Base.metadata.tables[table_name].indexes:
+                if all(column.name in existing for column in index.columns):
+                    index.create(sync_conn, checkfirst=True)
+
+    await conn.run_sync(create)
+
+
+async def add_image_data_column(conn):
+    if 'image_data' not in await get_table_columns(conn, "battles"):
+        await conn.execute(text("ALTER TABLE battles ADD COLUMN image_data TEXT"))
+
+
+async def move_images_to_blob_store(conn):
+    if 'image_hash' not in await get_table_columns(conn, "battles"):
+        await conn.execute(text("ALTER TABLE battles ADD COLUMN image_hash VARCHAR(64) REFERENCES blobs(hash)"))
+
+    from blob_store import migrate_inline_images
+    migrated = await migrate_inline_images(conn)
+    if migrated:
+        print(f"   Moved {migrated} screenshots from battles.image_data into the blob store")
+
+
+async def add_secondary_indexes(conn):
+    # Foreign key lookups, the created_at ordering and per-model winner counts
+    await create_missing_indexes(conn, ["battles", "responses", "ratings"])
+    # Refresh planner statistics so the new indexes are picked up
+    await conn.execute(text("ANALYZE"))
+
+
+async def build_model_stats(conn):
+    # model_stats and counters are created by create_all(); fill them from existing battles
+    from model_stats import rebuild_model_stats
+    await rebuild_model_stats(conn)
+
+
+async def add_battle_listing_columns(conn):
+    columns = await get_table_columns(conn, "battles")
+    for name, ddl in (
+        ("prompt_preview", "VARCHAR(103)"),
+        ("has_image", "INTEGER DEFAULT 0"),
+        ("winner_model", "VARCHAR"),
+    ):
+        if name not in columns:
+            await conn.execute(text(f"ALTER TABLE battles ADD COLUMN {name} {ddl}"))
+
+    # Backfill with the same rules as persistence.make_prompt_preview (length/substr count characters)
+    from database import PROMPT_PREVIEW_LENGTH
+    await conn.execute(text("""
+        UPDATE battles SET
+            prompt_preview = CASE WHEN length(prompt) > :n THEN substr(prompt, 1, :n) || '...' ELSE prompt END,
+            has_image = image_hash IS NOT NULL,
+            winner_model = (
+                SELECT model_name FROM responses
+                WHERE responses.battle_id = battles.id AND responses.is_winner = 1
+                LIMIT 1
+            )
+        WHERE prompt_preview IS NULL
+    """), {"n": PROMPT_PREVIEW_LENGTH})
+    await create_missing_indexes(conn, ["battles", "responses"])
+    await conn.execute(text("ANALYZE"))
+
+
+async def add_search_index(conn):
+    # FTS5 tables and views are not part of the SQLAlchemy metadata, so create_all() skips them
+    from search import create_search_index, rebuild_search_index
+    await create_search_index(conn)
+    await rebuild_search_index(conn)
+
+
+async def compress_text_columns(conn):
+    # The search source view must decompress prompt, response_text and reasoning from now on
+    from search import SOURCE_VIEW, create_search_index
+    await conn.execute(text(f"DROP VIEW IF EXISTS {SOURCE_VIEW}"))
+    await create_search_index(conn)
+
+    from compression import registry, compress_existing_rows
+    await registry.load(conn)
+    await compress_existing_rows(conn)
+
+
+# A battle's winner goes stale (winner_policy = NULL) when its ratings change after it
+# was decided. Inserts only count once a decision exists: persist_battle inserts the
+# ratings of a new battle before recording its decision.
+STALE_WINNER_TRIGGERS = {
+    "ratings_insert_stale_winner": """
+        AFTER INSERT ON ratings
+        WHEN EXISTS (SELECT 1 FROM winner_decisions WHERE battle_id = NEW.battle_id)
+        BEGIN
+            UPDATE battles SET winner_policy = NULL WHERE id = NEW.battle_id AND winner_policy IS NOT NULL;
+        END
+    """,
+    "ratings_update_stale_winner": """
+        AFTER UPDATE OF score, response_id, battle_id ON ratings
+        BEGIN
+            UPDATE battles SET winner_policy = NULL
+            WHERE id IN (OLD.battle_id, NEW.battle_id) AND winner_policy IS NOT NULL;
+        END
+    """,
+    "ratings_delete_stale_winner": """
+        AFTER DELETE ON ratings
+        BEGIN
+            UPDATE battles SET winner_policy = NULL WHERE id = OLD.battle_id AND winner_policy IS NOT NULL;
+        END
+    """,
+}
+
+
+async def add_winner_policies(conn):
+    # Existing winners were picked by an unrecorded version of the logic: leave them stale (NULL)
+    if 'winner_policy' not in await get_table_columns(conn, "battles"):
+        await conn.execute(text("ALTER TABLE battles ADD COLUMN winner_policy VARCHAR"))
+    await create_missing_indexes(conn, ["battles"])
+    for name, body in STALE_WINNER_TRIGGERS.items():
+        await conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {name} {body}"))
+
+
+async def build_elo_ratings(conn):
+    # elo_ratings is created by create_all(); replay existing battles into it
+    from leaderboard import rebuild_elo
+    await rebuild_elo(conn)
+
+
+async def add_daily_rollups(conn):
+    # model_daily_stats is created by create_all(); latencies are only known for new battles
+    if 'latency_s' not in await get_table_columns(conn, "responses"):
+        await conn.execute(text("ALTER TABLE responses ADD COLUMN latency_s FLOAT"))
+    from rollups import rebuild_rollups
+    await rebuild_rollups(conn)
+
+
+async def add_content_hashes(conn, chunk_size: int = 1000):
+    if 'content_hash' not in await get_table_columns(conn, "battles"):
+        await conn.execute(text("ALTER TABLE battles ADD COLUMN content_hash VARCHAR(64)"))
+    await create_missing_indexes(conn, ["battles"])
+
+    from database import Battle, Response
+    from persistence import content_hash
+    battles = Battle.__table__
+    after_id = 0
+    while True:
+        rows = (await conn.execute(
+            select(Battle.id, Battle.prompt, Battle.image_hash)
+            .where(Battle.id > after_id, Battle.content_hash.is_(None))
+            .order_by(Battle.id).limit(chunk_size)
+        )).all()
+        if not rows:
+            break
+        after_id = rows[-1][0]
+        responses = {}
+        for battle_id, model_name, response_text in await conn.execute(
+            select(Response.battle_id, Response.model_name, Response.response_text)
+            .where(Response.battle_id.in_([row[0] for row in rows]))
+        ):
+            responses.setdefault(battle_id, {})[model_name] = response_text
+        await conn.execute(
+            battles.update().where(battles.c.id == bindparam("b_id")).values(content_hash=bindparam("hash")),
+            [{"b_id": battle_id, "hash": content_hash(prompt, image_hash, responses.get(battle_id, {}))}
+             for battle_id, prompt, image_hash in rows]
+        )
+
+
+async def index_idempotency_battles(conn):
+    # idempotency_keys is created by create_all(); tables from before this version lack the index
+    await create_missing_indexes(conn, ["idempotency_keys"])
+
+
+MIGRATIONS = [
+    (1, "Add image_data column to battles", add_image_data_column),
+    (2, "Move screenshots into the blob store (battles.image_hash)", move_images_to_blob_store),
+    (3, "Add secondary indexes on battles, responses and ratings", add_secondary_indexes),
+    (4, "Build the materialized leaderboard (model_stats)", build_model_stats),
+    (5, "Add battle listing columns (prompt_preview, has_image, winner_model)", add_battle_listing_columns),
+    (6, "Add full-text search index (battle_search)", add_search_index),
+    (7, "Compress prompts, responses and judge reasoning", compress_text_columns),
+    (8, "Add versioned winner policies (battles.winner_policy, winner_decisions)", add_winner_policies),
+    (9, "Build Elo ratings (elo_ratings)", build_elo_ratings),
+    (10, "Add response latencies and daily rollups (model_daily_stats)", add_daily_rollups),
+    (11, "Add battle content hashes for import dedupe (battles.content_hash)", add_content_hashes),
+    (12, "Index idempotency keys by battle (idempotency_keys.battle_id)", index_idempotency_battles),
+]
+
+
+async def get_schema_version(conn) -> int:
+    result = await conn.execute(text("PRAGMA user_version"))
+    return result.scalar() or 0
+
+
+async def run_migrations(conn, target: Optional[int] = None) -> int:
+    """Apply pending migrations (up to `target`, default all) and return the resulting schema version"""
+    version = await get_schema_version(conn)
+    for migration_version, description, migrate in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        if target is not None and migration_version > target:
+            break
+        print(f"🔧 Migration {migration_version}: {description}...")
+        await migrate(conn)
+        # PRAGMA does not accept bound parameters; the version is an int from MIGRATIONS
+        await conn.execute(text(f"PRAGMA user_version = {int(migration_version)}"))
+        version = migration_version
+        print(f"✅ Database schema now at version {version}")
+    return version
@@ -0,0 +1,168 @@
+"""
+Materialized leaderboard.
+
+`model_stats` holds per-model totals (responses, wins, score sum and sum of
+squares) and `counters` holds the total number of battles. Both are updated
+in the same transaction that writes or deletes a battle, so /api/stats reads
+O(models) rows no matter how long the history is. rebuild_model_stats()
+recomputes everything from the responses table (see rebuild_stats.py).
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, delete, func, case, insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database import Battle, Response, ModelStats, Counter
+
+TOTAL_BATTLES = "total_battles"
+# Bumped by every change to battles or winners, in the same transaction (see response_cache.py)
+DATA_VERSION = "data_version"
+
+STAT_COLUMNS = ("battles", "wins", "score_count", "score_sum", "score_sumsq")
+
+# (model_name, average_score, is_winner) for one response
+ResponseStats = Tuple[str, Optional[float], int]
+
+
+async def add_to_counter(session, name: str, delta: int):
+    stmt = sqlite_insert(Counter.__table__).values(name=name, value=delta)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["name"],
+        set_={"value": Counter.__table__.c.value + delta}
+    )
+    await session.execute(stmt)
+
+
+async def bump_data_version(session):
+    await add_to_counter(session, DATA_VERSION, 1)
+
+
+async def read_data_version(session) -> int:
+    return (await session.execute(
+        select(Counter.value).where(Counter.name == DATA_VERSION)
+    )).scalar() or 0
+
+
+async def apply_responses(session, responses: Iterable[ResponseStats], sign: int = 1):
+    """
+    Add (sign=1) or remove (sign=-1) one battle's responses from the totals.
+
+    Call with the battle's responses in the same transaction that inserts or
+    deletes them. All models are upserted with a single executemany.
+    """
+    rows = []
+    for model_name, average_score, is_winner in responses:
+        score = average_score or 0.0
+        rows.append({
+            "model_name": model_name,
+            "battles": sign,
+            "wins": sign * (1 if is_winner else 0),
+            "score_count": sign * (1 if average_score is not None else 0),
+            "score_sum": sign * score,
+            "score_sumsq": sign * score * score,
+        })
+    await add_totals(session, rows)
+
+
+async def add_totals(session, rows: List[Dict]):
+    """Upsert {model_name, <STAT_COLUMNS>} rows, adding to existing totals"""
+    if not rows:
+        return
+    table = ModelStats.__table__
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["model_name"],
+        set_={column: table.c[column] + stmt.excluded[column] for column in STAT_COLUMNS}
+    )
+    await session.execute(stmt, rows)
+
+
+async def apply_battle(session, responses: List[ResponseStats], sign: int = 1):
+    await apply_responses(session, responses, sign)
+    await add_to_counter(session, TOTAL_BATTLES, sign)
+
+
+async def apply_battles(session, battles: List[List[ResponseStats]], sign: int = 1):
+    """apply_battle() for many battles: one upsert per model and one counter update"""
+    totals: Dict[str, Dict] = {}
+    for responses in battles:
+        for model_name, average_score, is_winner in responses:
+            row = totals.setdefault(model_name, {"model_name": model_name, **{column: 0 for column in STAT_COLUMNS}})
+            score = average_score or 0.0
+            row["battles"] += sign
+            row["wins"] += sign * (1 if is_winner else 0)
+            row["score_count"] += sign * (1 if average_score is not None else 0)
+            row["score_sum"] += sign * score
+            row["score_sumsq"] += sign * score * score
+    await add_totals(session, list(totals.values()))
+    if battles:
+        await add_to_counter(session, TOTAL_BATTLES, sign * len(battles))
+
+
+async def apply_winner_change(session, old_winner: Optional[str], new_winner: Optional[str]):
+    """Move one win between models after a winner recompute"""
+    if old_winner == new_winner:
+        return
+    table = ModelStats.__table__
+    for model_name, delta in ((old_winner, -1), (new_winner, 1)):
+        if model_name:
+            await session.execute(
+                table.update()
+                .where(table.c.model_name == model_name)
+                .values(wins=table.c.wins + delta)
+            )
+
+
+async def rebuild_model_stats(session):
+    """Recompute model_stats and total_battles from the responses and battles tables (plus pruned archive months)"""
+    await session.execute(delete(ModelStats))
+    score = Response.average_score
+    await session.execute(
+        insert(ModelStats).from_select(
+            ["model_name", *STAT_COLUMNS],
+            select(
+                Response.model_name,
+                func.count(Response.id),
+                func.coalesce(func.sum(case((Response.is_winner == 1, 1), else_=0)), 0),
+                func.count(score),
+                func.coalesce(func.sum(score), 0.0),
+                func.coalesce(func.sum(score * score), 0.0),
+            ).group_by(Response.model_name)
+        )
+    )
+    total = (await session.execute(select(func.count(Battle.id)))).scalar() or 0
+
+    # Battles pruned from the database after archiving still count (see archive.py)
+    from archive import pruned_model_totals
+    archived, archived_battles = pruned_model_totals()
+    await add_totals(session, [{"model_name": model_name, **totals} for model_name, totals in archived.items()])
+    total += archived_battles
+
+    await session.execute(delete(Counter).where(Counter.name == TOTAL_BATTLES))
+    await session.execute(insert(Counter).values(name=TOTAL_BATTLES, value=total))
+
+
+async def reset_model_stats(session):
+    await session.execute(delete(ModelStats))
+    await session.execute(delete(Counter).where(Counter.name == TOTAL_BATTLES))
+
+
+async def read_model_stats(session) -> Tuple[Dict[str, Dict], int]:
+    """Return ({model: totals}, total_battles)"""
+    result = await session.execute(select(ModelStats).where(ModelStats.battles > 0))
+    stats = {
+        row.model_name: {
+            "battles": row.battles,
+            "wins": row.wins,
+            "average_score": row.score_sum / row.score_count if row.score_count else 0.0,
+            "score_stddev": (
+                max(row.score_sumsq / row.score_count - (row.score_sum / row.score_count) ** 2, 0.0) ** 0.5
+                if row.score_count else 0.0
+            ),
+        }
+        for row in result.scalars().all()
+    }
+    total = (await session.execute(
+        select(Counter.value).where(Counter.name == TOTAL_BATTLES)
+    )).scalar() or 0
+    return stats, total
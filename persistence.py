@@ -0,0 +1,211 @@
+"""
+Battle persistence.
+
+persist_battle writes a finished battle (battle row, one response per model, one rating per
+judge/model pair) with three Core INSERT statements instead of ORM unit of
+work: the battle and its responses use INSERT ... RETURNING to get their ids,
+the ratings go in as one executemany. Nothing is loaded back into the session
+identity map, so no refresh is needed afterwards.
+
+Every write and delete also updates the materialized leaderboard
+(model_stats), the daily rollups (rollups.py) and the full-text search
+index in the same transaction; new battles also update the Elo ratings
+(leaderboard.py). Elo is order dependent and is not rewound by a delete:
+the delete is counted as Elo drift until rebuild_stats.py replays it.
+"""
+import json
+import hashlib
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Union
+
+from sqlalchemy import select, insert, delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database import Battle, Response, Rating, Blob, WinnerDecision, IdempotencyKey, PROMPT_PREVIEW_LENGTH
+from blob_store import blob_store
+import model_stats
+import leaderboard
+import rollups
+import search
+
+
+def normalize_rating(rating_data: Union[Dict, float, int]) -> Tuple[float, str]:
+    """Return (score, reasoning) for both the dict format and the old float format"""
+    if isinstance(rating_data, dict):
+        return rating_data["score"], rating_data.get("reasoning", "") or ""
+    return float(rating_data), ""
+
+
+def make_prompt_preview(prompt: str) -> str:
+    """Prompt as shown in the battle list"""
+    if len(prompt) > PROMPT_PREVIEW_LENGTH:
+        return prompt[:PROMPT_PREVIEW_LENGTH] + "..."
+    return prompt
+
+
+def content_hash(prompt: str, image_hash: Optional[str], responses: Dict[str, str]) -> str:
+    """SHA-256 identifying a battle by its prompt, screenshot and answers (bulk imports skip known ones)"""
+    content = json.dumps([prompt, image_hash, sorted(responses.items())], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+async def persist_battle(
+    session,
+    prompt: str,
+    results: Dict,
+    image_hash: Optional[str] = None,
+    created_at: Optional[datetime] = None,
+    battle_id: Optional[int] = None
+) -> Tuple[int, datetime]:
+    """
+    Insert a battle with its responses and ratings in the caller's transaction.
+
+    `results` is the dict returned by run_battle (responses, average_scores,
+    winner, parsed_ratings, and winner_policy/tiebreaker_info and
+    timing_info when known; without a policy the winner is stored as stale). `battle_id` is set when the id was reserved in
+    advance (write-behind, see journal.py); otherwise SQLite assigns one.
+    Returns the battle id and its created_at.
+    """
+    created_at = created_at or datetime.utcnow()
+
+    battle_id = (await session.execute(
+        insert(Battle.__table__)
+        .values(
+            **({"id": battle_id} if battle_id is not None else {}),
+            prompt=prompt,
+            image_hash=image_hash,
+            created_at=created_at,
+            prompt_preview=make_prompt_preview(prompt),
+            has_image=1 if image_hash else 0,
+            winner_model=results["winner"] if results["winner"] in results["responses"] else None,
+            winner_policy=results.get("winner_policy"),
+            content_hash=content_hash(prompt, image_hash, results["responses"])
+        )
+        .returning(Battle.__table__.c.id)
+    )).scalar_one()
+
+    latencies = (results.get("timing_info") or {}).get("response_timings", {})
+    response_rows = [
+        {
+            "battle_id": battle_id,
+            "model_name": model_name,
+            "response_text": response_text,
+            "average_score": results["average_scores"].get(model_name, 0.0),
+            "is_winner": 1 if model_name == results["winner"] else 0,
+            "latency_s": latencies.get(model_name)
+        }
+        for model_name, response_text in results["responses"].items()
+    ]
+    response_ids = {}
+    if response_rows:
+        response_table = Response.__table__
+        returned = await session.execute(
+            insert(response_table).returning(response_table.c.id, response_table.c.model_name),
+            response_rows
+        )
+        response_ids = {model_name: response_id for response_id, model_name in returned.all()}
+
+    rating_rows = []
+    for judge_model, ratings in results["parsed_ratings"].items():
+        for response_model, rating_data in ratings.items():
+            if response_model not in response_ids:
+                continue
+            score, reasoning = normalize_rating(rating_data)
+            rating_rows.append({
+                "battle_id": battle_id,
+                "response_id": response_ids[response_model],
+                "judge_model": judge_model,
+                "score": score,
+                "reasoning": reasoning
+            })
+    if rating_rows:
+        await session.execute(insert(Rating.__table__), rating_rows)
+    if results.get("winner_policy"):
+        # After the ratings: rating inserts into an already decided battle mark its winner stale
+        await record_decisions(session, results["winner_policy"], [(
+            battle_id, results["winner"], (results.get("tiebreaker_info") or {}).get("method")
+        )])
+
+    response_stats = [(row["model_name"], row["average_score"], row["is_winner"]) for row in response_rows]
+    await model_stats.apply_battle(session, response_stats)
+    await leaderboard.apply_elo(session, response_stats)
+    await rollups.apply_battle(session, rollups.day_of(created_at), [
+        (*stats, row["latency_s"]) for stats, row in zip(response_stats, response_rows)
+    ])
+    await search.index_battle(session, battle_id)
+    await model_stats.bump_data_version(session)
+
+    return battle_id, created_at
+
+
+async def record_decisions(session, policy: str, decisions: List[Tuple[int, Optional[str], Optional[str]]]):
+    """Store (battle_id, winner_model, method) decisions of a policy, replacing its earlier ones"""
+    if not decisions:
+        return
+    table = WinnerDecision.__table__
+    decided_at = datetime.utcnow()
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["battle_id", "policy"],
+        set_={column: stmt.excluded[column] for column in ("winner_model", "method", "decided_at")}
+    )
+    await session.execute(stmt, [
+        {"battle_id": battle_id, "policy": policy, "winner_model": winner, "method": method, "decided_at": decided_at}
+        for battle_id, winner, method in decisions
+    ])
+
+
+async def delete_battle(session, battle_id: int) -> Tuple[bool, Optional[str]]:
+    """
+    Delete a battle, its responses and ratings in the caller's transaction.
+
+    Returns (found, orphaned_image_hash). When the battle held the last
+    reference to its screenshot, remove that blob file after committing.
+    """
+    battle = (await session.execute(
+        select(Battle.image_hash, Battle.created_at).where(Battle.id == battle_id)
+    )).one_or_none()
+    if battle is None:
+        return False, None
+    image_hash, created_at = battle
+
+    responses = (await session.execute(
+        select(Response.model_name, Response.average_score, Response.is_winner, Response.latency_s)
+        .where(Response.battle_id == battle_id)
+    )).all()
+
+    # The search index reads the battle's text to remove it, so unindex before deleting
+    await search.unindex_battle(session, battle_id)
+
+    # Delete ratings first (they reference responses), then responses, then the battle
+    await session.execute(delete(Rating).where(Rating.battle_id == battle_id))
+    await session.execute(delete(WinnerDecision).where(WinnerDecision.battle_id == battle_id))
+    # A retry with the battle's idempotency key must not replay a battle that is gone
+    await session.execute(delete(IdempotencyKey).where(IdempotencyKey.battle_id == battle_id))
+    await session.execute(delete(Response).where(Response.battle_id == battle_id))
+    await session.execute(delete(Battle).where(Battle.id == battle_id))
+    await model_stats.apply_battle(session, [tuple(row[:3]) for row in responses], sign=-1)
+    await leaderboard.mark_elo_stale(session)
+    if created_at is not None:
+        await rollups.apply_battle(session, rollups.day_of(created_at), [tuple(row) for row in responses], sign=-1)
+
+    await model_stats.bump_data_version(session)
+
+    # Drop the screenshot reference; the file goes once no battle uses it
+    orphaned = await blob_store.release(session, image_hash)
+    return True, image_hash if orphaned else None
+
+
+async def delete_all_battles(session):
+    """Delete every battle, response, rating, winner decision, idempotency key, screenshot reference, leaderboard total, Elo rating, rollup and search entry"""
+    await session.execute(delete(Rating))
+    await session.execute(delete(WinnerDecision))
+    await session.execute(delete(IdempotencyKey))
+    await session.execute(delete(Response))
+    await session.execute(delete(Battle))
+    await session.execute(delete(Blob))
+    await model_stats.reset_model_stats(session)
+    await leaderboard.reset_elo(session)
+    await rollups.reset_rollups(session)
+    await search.clear_search_index(session)
+    await model_stats.bump_data_version(session)
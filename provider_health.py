@@ -0,0 +1,230 @@
+"""
+Provider health: latency quantiles, error and retry rates per provider
+and battle stage ("response" or "rating").
+
+run_battle records every API call (its duration including retries, how
+many attempts it took and whether it finally failed) into hourly buckets
+kept in memory. Latencies of successful calls go into a DDSketch
+(sketches.py). A background task checkpoints the buckets recorded since
+the last checkpoint into `provider_health` every
+settings.provider_health_checkpoint_s, merging them with the rows already
+stored, and drops rows older than settings.provider_health_retention_days.
+
+/api/providers/health merges the stored hours of a window with what is not
+checkpointed yet. Each checkpoint also bumps a counter in the same
+transaction, and the read gets that counter in the same SELECT as the
+rows, so a batch that committed before the read is not counted twice and
+neither side waits for the other. The last hours also stay in memory, so
+latency_quantile() can answer without the database (e.g. to pick timeouts
+or when to hedge).
+"""
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, delete, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+import database
+from config import settings
+from database import ProviderHealthStats, Counter
+from model_stats import add_to_counter
+from sketches import DDSketch
+
+MEMORY_HOURS = 24  # Hours kept in memory for latency_quantile()
+CHECKPOINTS = "provider_health_checkpoints"  # Counter bumped by every checkpoint
+
+# (hour, provider, stage)
+HealthKey = Tuple[str, str, str]
+
+
+def hour_of(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%dT%H")
+
+
+class StageHealth:
+    """Calls, errors, retries and a latency sketch for one provider and stage"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.latency = DDSketch()
+
+    def record(self, duration: float, attempts: int, failed: bool):
+        self.calls += 1
+        self.retries += 1 if attempts > 1 else 0
+        if failed:
+            self.errors += 1
+        else:
+            self.latency.add(duration)
+
+    def merge(self, other: "StageHealth"):
+        self.calls += other.calls
+        self.errors += other.errors
+        self.retries += other.retries
+        self.latency.merge(other.latency)
+
+    def summary(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "error_rate": self.errors / self.calls if self.calls else 0.0,
+            "retry_rate": self.retries / self.calls if self.calls else 0.0,
+            "latency": self.latency.summary() if self.latency.count else None,
+        }
+
+
+class HealthBatch:
+    """Buckets checkpointed together"""
+
+    def __init__(self):
+        self.buckets: Dict[HealthKey, StageHealth] = {}
+        self.checkpoint: Optional[int] = None  # CHECKPOINTS value set by the transaction saving it
+
+
+class ProviderHealth:
+    def __init__(self, writer, checkpoint_s: float, retention_days: int):
+        self.writer = writer
+        self.checkpoint_s = checkpoint_s
+        self.retention_days = retention_days
+        self.recent: Dict[HealthKey, StageHealth] = {}
+        self.pending = HealthBatch()  # Not checkpointed yet
+        self.flushing: List[HealthBatch] = []  # Being checkpointed
+        self.task: Optional[asyncio.Task] = None
+
+    def record(self, provider: str, stage: str, duration: float, attempts: int = 1, failed: bool = False):
+        key = (hour_of(datetime.utcnow()), provider, stage)
+        for buckets in (self.recent, self.pending.buckets):
+            buckets.setdefault(key, StageHealth()).record(duration, attempts, failed)
+
+    def latency_quantile(self, provider: str, stage: str, q: float, hours: int = 1) -> Optional[float]:
+        """Latency quantile of successful calls over the last `hours` (at most MEMORY_HOURS), from memory"""
+        since = hour_of(datetime.utcnow() - timedelta(hours=hours - 1))
+        merged = DDSketch()
+        for (hour, key_provider, key_stage), health in self.recent.items():
+            if hour >= since and key_provider == provider and key_stage == stage:
+                merged.merge(health.latency)
+        return merged.quantile(q)
+
+    async def checkpoint(self):
+        """Merge the buckets recorded since the last checkpoint into provider_health"""
+        if not self.pending.buckets:
+            return
+        # No await before the submit: records from here on go to the new batch
+        batch, self.pending = self.pending, HealthBatch()
+        self.flushing.append(batch)
+        flushing = batch.buckets
+        cutoff = hour_of(datetime.utcnow() - timedelta(days=self.retention_days))
+
+        async def save_health(session):
+            table = ProviderHealthStats.__table__
+            stored = {
+                (hour, provider, stage): sketch
+                for hour, provider, stage, sketch in (await session.execute(
+                    select(table.c.hour, table.c.provider, table.c.stage, table.c.latency_sketch)
+                    .where(tuple_(table.c.hour, table.c.provider, table.c.stage).in_(list(flushing)))
+                )).all()
+            }
+            rows = []
+            for key, health in flushing.items():
+                sketch = DDSketch.from_bytes(stored.get(key))
+                sketch.merge(health.latency)
+                hour, provider, stage = key
+                rows.append({
+                    "hour": hour, "provider": provider, "stage": stage,
+                    "calls": health.calls, "errors": health.errors, "retries": health.retries,
+                    "latency_sketch": sketch.to_bytes() if sketch.count else None,
+                })
+            stmt = sqlite_insert(table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["hour", "provider", "stage"],
+                set_={
+                    **{column: table.c[column] + stmt.excluded[column] for column in ("calls", "errors", "retries")},
+                    "latency_sketch": stmt.excluded.latency_sketch,
+                }
+            )
+            await session.execute(stmt, rows)
+            await session.execute(delete(table).where(table.c.hour < cutoff))
+            await add_to_counter(session, CHECKPOINTS, 1)
+            batch.checkpoint = (await session.execute(
+                select(Counter.value).where(Counter.name == CHECKPOINTS)
+            )).scalar()
+
+        try:
+            await self.writer.submit(save_health)
+        except Exception:
+            # Keep the counts for the next checkpoint
+            batch.checkpoint = None
+            for key, health in flushing.items():
+                self.pending.buckets.setdefault(key, StageHealth()).merge(health)
+            raise
+        finally:
+            self.flushing.remove(batch)
+        oldest = hour_of(datetime.utcnow() - timedelta(hours=MEMORY_HOURS))
+        self.recent = {key: health for key, health in self.recent.items() if key[0] >= oldest}
+
+    async def read(self, session, hours: int) -> Dict[str, Dict[str, Dict]]:
+        """{provider: {stage: summary}} over the last `hours`, stored and not yet checkpointed"""
+        since = hour_of(datetime.utcnow() - timedelta(hours=hours - 1))
+        table = ProviderHealthStats.__table__
+        # Snapshot memory before the SELECT, so a batch committing during the read
+        # is in one or the other; the SELECT tells which batches it already includes
+        unsaved = [(batch, list(batch.buckets.items())) for batch in (*self.flushing, self.pending)]
+        checkpoint = select(Counter.value).where(Counter.name == CHECKPOINTS).scalar_subquery()
+        rows = (await session.execute(
+            select(table, checkpoint.label("checkpoint")).where(table.c.hour >= since)
+        )).mappings().all()
+        # No rows: nothing checkpointed in the window, so every batch counts
+        stored_checkpoint = (rows[0]["checkpoint"] or 0) if rows else 0
+        totals: Dict[Tuple[str, str], StageHealth] = {}
+        for row in rows:
+            health = totals.setdefault((row["provider"], row["stage"]), StageHealth())
+            health.calls += row["calls"]
+            health.errors += row["errors"]
+            health.retries += row["retries"]
+            if row["latency_sketch"]:
+                health.latency.merge(DDSketch.from_bytes(row["latency_sketch"]))
+        for batch, buckets in unsaved:
+            if batch.checkpoint is not None and batch.checkpoint <= stored_checkpoint:
+                continue  # Committed before the SELECT: already in rows
+            for (hour, provider, stage), health in buckets:
+                if hour >= since:
+                    totals.setdefault((provider, stage), StageHealth()).merge(health)
+
+        providers: Dict[str, Dict[str, Dict]] = {}
+        for (provider, stage), health in sorted(totals.items()):
+            providers.setdefault(provider, {})[stage] = health.summary()
+        return providers
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_s)
+            try:
+                await self.checkpoint()
+            except Exception as e:
+                print(f"❌ Provider health checkpoint failed: {e}")
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Stop the checkpoint task and write what is left"""
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        try:
+            await self.checkpoint()
+        except Exception as e:
+            print(f"❌ Provider health checkpoint failed: {e}")
+
+
+provider_health = ProviderHealth(
+    database.writer, settings.provider_health_checkpoint_s, settings.provider_health_retention_days
+)
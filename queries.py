@@ -0,0 +1,111 @@
+"""
+Read paths for the API.
+
+Each function issues a fixed number of queries regardless of how many
+responses or judges a battle has.
+"""
+import base64
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select, tuple_, exists
+from sqlalchemy.orm import joinedload, selectinload
+
+from database import Battle, Response
+
+# Columns returned by list_battles; none of them is the prompt or the screenshot
+BATTLE_LIST_COLUMNS = (
+    Battle.id,
+    Battle.prompt_preview,
+    Battle.has_image,
+    Battle.winner_model,
+    Battle.created_at,
+)
+
+
+async def load_battle(session, battle_id: int) -> Optional[Battle]:
+    """
+    Load a battle with its responses and their ratings in two queries.
+
+    Responses are joined onto the battle row (a handful per battle), ratings
+    are fetched with one `IN (...)` query over the loaded responses. Responses
+    come back sorted by average score, highest first.
+    """
+    result = await session.execute(
+        select(Battle)
+        .where(Battle.id == battle_id)
+        .options(
+            joinedload(Battle.responses).selectinload(Response.ratings)
+        )
+    )
+    battle = result.unique().scalar_one_or_none()
+    if battle is None:
+        return None
+
+    # Same ordering as ORDER BY average_score DESC (NULLs last)
+    battle.responses.sort(
+        key=lambda r: (r.average_score is not None, r.average_score or 0.0),
+        reverse=True
+    )
+    return battle
+
+
+def encode_cursor(created_at: datetime, battle_id: int) -> str:
+    """Opaque cursor for the position after (created_at, id)"""
+    raw = f"{created_at.isoformat()}|{battle_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, battle_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(battle_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def battle_list_query(
+    limit: int,
+    cursor: Optional[str] = None,
+    model: Optional[str] = None,
+    winner: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+):
+    """
+    SELECT for one page of the battle list, newest first.
+
+    Keyset pagination on (created_at, id): each page is an index range scan
+    starting right after the previous page, so page 10,000 costs the same as
+    page 1. `winner` uses ix_battles_winner_model_created_at, `since`/`until`
+    bound the created_at range and `model` (battles the model took part in)
+    probes ix_responses_battle_id_model_name per candidate battle.
+    """
+    query = select(*BATTLE_LIST_COLUMNS)
+    if cursor:
+        created_at, battle_id = decode_cursor(cursor)
+        query = query.where(tuple_(Battle.created_at, Battle.id) < tuple_(created_at, battle_id))
+    if winner:
+        query = query.where(Battle.winner_model == winner)
+    if since:
+        query = query.where(Battle.created_at >= since)
+    if until:
+        query = query.where(Battle.created_at < until)
+    if model:
+        query = query.where(exists().where(
+            Response.battle_id == Battle.id, Response.model_name == model
+        ))
+    return query.order_by(Battle.created_at.desc(), Battle.id.desc()).limit(limit)
+
+
+async def list_battles(session, limit: int = 50, **filters) -> Tuple[List, Optional[str]]:
+    """One page of battles (see battle_list_query) and the cursor for the next page"""
+    # Fetch one extra row to know whether there is a next page
+    rows = (await session.execute(battle_list_query(limit + 1, **filters))).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
@@ -0,0 +1,39 @@
+"""
+Rebuild the materialized leaderboard (model_stats table and total battle count),
+the Elo ratings and the daily rollups from the battles and responses tables.
+
+They are maintained incrementally by every battle write and delete; run this
+after editing the database by hand, if the totals ever drift, or to backfill
+the daily rollups (model_daily_stats) of existing battles.
+"""
+import asyncio
+from database import init_db, AsyncSessionLocal
+from model_stats import rebuild_model_stats, read_model_stats
+from leaderboard import rebuild_elo, read_elo
+from rollups import rebuild_rollups
+from llm_clients import model_names
+
+
+async def rebuild():
+    await init_db()
+    
+    async with AsyncSessionLocal() as db:
+        await rebuild_model_stats(db)
+        # Elo is order dependent: replaying also drops deleted battles and applies re-scored winners
+        await rebuild_elo(db)
+        rollup_rows = await rebuild_rollups(db)
+        await db.commit()
+        
+        stats, total_battles = await read_model_stats(db)
+        elo = await read_elo(db)
+    
+    print(f"✅ Leaderboard rebuilt from {total_battles} battles ({rollup_rows} daily rollup rows)")
+    for model, totals in sorted(stats.items(), key=lambda item: item[1]["wins"], reverse=True):
+        print(f"   {model_names.get(model, model)}: {totals['wins']} wins, "
+              f"average score {totals['average_score']:.2f} over {totals['battles']} battles, "
+              f"Elo {elo.get(model, {}).get('rating', 0):.0f}")
+
+
+if __name__ == "__main__":
+    print("Rebuilding leaderboard...\n")
+    asyncio.run(rebuild())
@@ -0,0 +1,292 @@
+"""
+Bulk winner recompute.
+
+Streams battles in id order, chunk_size battles at a time. For each chunk
+it reads the responses and the ratings (joined to their response's model)
+with one query each, rebuilds parsed_ratings with dict lookups and re-runs
+a winner policy (winner_policies.py). Only battles whose winner or policy
+changed are written, with executemany UPDATEs per chunk, and the
+leaderboard's and the daily rollups' win counts are moved by the same
+amounts. Each chunk is its
+own transaction.
+
+- stale_only: only battles not decided by the policy (another policy
+  version, or winner_policy reset to NULL because their ratings changed).
+- shadow: record the policy's decisions in winner_decisions for A/B
+  comparison without touching the live winners.
+
+With workers > 0 the main process only walks the battle ids and writes;
+each chunk's responses and ratings are read (over a read-only connection
+per worker process) and resolved in a process pool, and only the changes
+come back.
+"""
+import asyncio
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import create_engine, select, bindparam, case, or_
+
+from database import Battle, Response, Rating
+from model_stats import add_totals, bump_data_version, STAT_COLUMNS
+from rollups import move_wins
+from persistence import record_decisions
+from winner_policies import WinnerPolicy, get_policy, current_policy
+
+# (battle_id, winner_model, winner_policy) as stored in battles
+BattleKey = Tuple[int, Optional[str], Optional[str]]
+
+
+class BattleRows(NamedTuple):
+    """What the winner logic needs from one battle"""
+    battle_id: int
+    winner_model: Optional[str]
+    winner_policy: Optional[str]
+    responses: List[Tuple[str, Optional[float], int]]  # (model_name, average_score, is_winner)
+    ratings: List[Tuple[str, str, float]]  # (judge_model, model_name, score)
+
+
+class WinnerChange(NamedTuple):
+    battle_id: int
+    old_winners: Tuple[str, ...]  # Models whose response currently has is_winner = 1
+    new_winner: str
+    method: str  # Tiebreaker level that decided, "average_score" without a tie
+
+
+def resolve_battle(battle: BattleRows, policy: WinnerPolicy, verbose: bool = False) -> Tuple[Optional[str], Dict]:
+    """(winner, tiebreaker_info), or (None, {}) for a battle without responses or ratings"""
+    if not battle.responses or not battle.ratings:
+        return None, {}
+    average_scores = {model: score or 0.0 for model, score, _ in battle.responses}
+    parsed_ratings: Dict[str, Dict[str, Dict]] = {}
+    for judge_model, model_name, score in battle.ratings:
+        # Reasoning is not read: the winner only depends on the scores
+        parsed_ratings.setdefault(judge_model, {})[model_name] = {"score": score}
+    return policy.decide(average_scores, parsed_ratings, list(average_scores), verbose=verbose)
+
+
+def resolve_chunk(battles: List[BattleRows], policy_key: str, shadow: bool = False) -> Dict:
+    """
+    Resolve a chunk; module level so it can run in a worker process.
+
+    "changes" are the battles whose live winner differs from the policy's,
+    "decisions" the (battle_id, winner, method) rows to record: every
+    battle in shadow mode, otherwise those changed or not yet decided by
+    this policy.
+    """
+    policy = get_policy(policy_key)
+    changes = []
+    decisions = []
+    ties = skipped = 0
+    for battle in battles:
+        winner, info = resolve_battle(battle, policy)
+        if winner is None:
+            skipped += 1
+            continue
+        if info.get("tie_occurred"):
+            ties += 1
+        old_winners = tuple(model for model, _, is_winner in battle.responses if is_winner == 1)
+        changed = old_winners != (winner,) or battle.winner_model != winner
+        if changed:
+            changes.append(WinnerChange(battle.battle_id, old_winners, winner, info["method"]))
+        if shadow or changed or battle.winner_policy != policy_key:
+            decisions.append((battle.battle_id, winner, info["method"]))
+    return {
+        "battles": len(battles), "skipped": skipped, "ties": ties,
+        "changes": changes, "decisions": decisions
+    }
+
+
+def load_battle_rows(conn, battles: List[BattleKey]) -> List[BattleRows]:
+    """Responses and ratings for stored battle rows (sync Session or Connection)"""
+    if not battles:
+        return []
+    battle_ids = [battle[0] for battle in battles]
+    responses: Dict[int, list] = {}
+    ratings: Dict[int, list] = {}
+    result = conn.execute(
+        select(Response.battle_id, Response.model_name, Response.average_score, Response.is_winner)
+        .where(Response.battle_id.in_(battle_ids))
+        .order_by(Response.battle_id)
+    )
+    for battle_id, model_name, average_score, is_winner in result:
+        responses.setdefault(battle_id, []).append((model_name, average_score, is_winner))
+    result = conn.execute(
+        select(Rating.battle_id, Rating.judge_model, Response.model_name, Rating.score)
+        .join(Response, Response.id == Rating.response_id)
+        .where(Rating.battle_id.in_(battle_ids))
+        .order_by(Rating.battle_id)
+    )
+    for battle_id, judge_model, model_name, score in result:
+        ratings.setdefault(battle_id, []).append((judge_model, model_name, score))
+    return [
+        BattleRows(battle_id, winner_model, winner_policy,
+                   responses.get(battle_id, []), ratings.get(battle_id, []))
+        for battle_id, winner_model, winner_policy in battles
+    ]
+
+
+async def load_battles(session, battles: List[BattleKey]) -> List[BattleRows]:
+    return await session.run_sync(load_battle_rows, battles)
+
+
+_worker_engine = None
+
+
+def resolve_in_worker(database_path: str, battles: List[BattleKey], policy_key: str, shadow: bool) -> Dict:
+    """Read and resolve one chunk in a worker process, over its own read-only connection"""
+    global _worker_engine
+    if _worker_engine is None:
+        _worker_engine = create_engine(f"sqlite:///file:{database_path}?mode=ro&uri=true")
+    with _worker_engine.connect() as conn:
+        return resolve_chunk(load_battle_rows(conn, battles), policy_key, shadow)
+
+
+BATTLE_KEY_COLUMNS = (Battle.id, Battle.winner_model, Battle.winner_policy)
+
+
+async def read_chunk_ids(session, after_id: int, chunk_size: int) -> List[BattleKey]:
+    result = await session.execute(
+        select(*BATTLE_KEY_COLUMNS)
+        .where(Battle.id > after_id)
+        .order_by(Battle.id)
+        .limit(chunk_size)
+    )
+    return [tuple(row) for row in result]
+
+
+async def stale_battle_ids(session, policy_key: str) -> List[int]:
+    """Ids of battles whose winner was not picked by this policy, from ix_battles_winner_policy"""
+    result = await session.execute(
+        select(Battle.id)
+        .where(or_(
+            # "< or >" rather than "!=" so each term is an index range
+            Battle.winner_policy.is_(None), Battle.winner_policy < policy_key, Battle.winner_policy > policy_key
+        ))
+    )
+    # Sorted here: ORDER BY id would make SQLite walk the whole table in id order instead
+    return sorted(result.scalars())
+
+
+async def read_battle_keys(session, battle_ids: List[int]) -> List[BattleKey]:
+    result = await session.execute(
+        select(*BATTLE_KEY_COLUMNS).where(Battle.id.in_(battle_ids)).order_by(Battle.id)
+    )
+    return [tuple(row) for row in result]
+
+
+async def apply_changes(session, result: Dict, policy_key: str, shadow: bool = False):
+    """
+    Record a chunk's decisions; unless shadow, also write the new winners
+    (one executemany per table) and move the wins in model_stats and the
+    daily rollups.
+    """
+    await record_decisions(session, policy_key, result["decisions"])
+    if shadow or not result["decisions"]:
+        return
+    await bump_data_version(session)
+    battles = Battle.__table__
+    responses = Response.__table__
+    await session.execute(
+        battles.update()
+        .where(battles.c.id == bindparam("b_id"))
+        .values(winner_model=bindparam("new_winner"), winner_policy=policy_key),
+        [{"b_id": battle_id, "new_winner": winner} for battle_id, winner, _ in result["decisions"]]
+    )
+    changes = result["changes"]
+    if not changes:
+        return
+    await session.execute(
+        responses.update()
+        .where(responses.c.battle_id == bindparam("b_id"))
+        .values(is_winner=case((responses.c.model_name == bindparam("new_winner"), 1), else_=0)),
+        [{"b_id": change.battle_id, "new_winner": change.new_winner} for change in changes]
+    )
+
+    wins: Dict[str, int] = {}
+    battle_wins = []
+    for change in changes:
+        for model_name in change.old_winners:
+            wins[model_name] = wins.get(model_name, 0) - 1
+            battle_wins.append((change.battle_id, model_name, -1))
+        wins[change.new_winner] = wins.get(change.new_winner, 0) + 1
+        battle_wins.append((change.battle_id, change.new_winner, 1))
+    await move_wins(session, battle_wins)
+    await add_totals(session, [
+        {"model_name": model_name, **{column: 0 for column in STAT_COLUMNS}, "wins": delta}
+        for model_name, delta in wins.items() if delta
+    ])
+
+
+async def recompute_winners(
+    session,
+    policy: Optional[str] = None,
+    stale_only: bool = False,
+    shadow: bool = False,
+    chunk_size: int = 2000,
+    workers: int = 0,
+    dry_run: bool = False,
+    on_chunk: Optional[Callable[[Dict], None]] = None
+) -> Dict:
+    """
+    Recompute battle winners with `policy` (default: the live policy);
+    returns totals (battles, skipped, ties, changed, decided).
+
+    With dry_run nothing is written. on_chunk is called with each chunk's
+    resolve_chunk() result, in battle order.
+    """
+    policy_key = get_policy(policy).key if policy else current_policy().key
+    if stale_only and shadow:
+        raise ValueError("stale_only re-scores the live winners; shadow runs cover every battle")
+    totals = {"battles": 0, "skipped": 0, "ties": 0, "changed": 0, "decided": 0}
+
+    async def finish(result: Dict):
+        if not dry_run:
+            await apply_changes(session, result, policy_key, shadow)
+            await session.commit()
+        for key in ("battles", "skipped", "ties"):
+            totals[key] += result[key]
+        totals["changed"] += len(result["changes"])
+        totals["decided"] += len(result["decisions"])
+        if on_chunk:
+            on_chunk(result)
+
+    stale_ids = await stale_battle_ids(session, policy_key) if stale_only else None
+
+    async def next_chunk(position: int, after_id: int) -> List[BattleKey]:
+        if stale_ids is None:
+            return await read_chunk_ids(session, after_id, chunk_size)
+        return await read_battle_keys(session, stale_ids[position:position + chunk_size])
+
+    pool = None
+    if workers > 0:
+        # spawn: the parent has database threads running, which fork does not copy safely
+        pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+        database_path = session.get_bind().url.database
+    try:
+        loop = asyncio.get_running_loop()
+        in_flight = deque()
+        position = after_id = 0
+        while True:
+            battles = await next_chunk(position, after_id)
+            if not battles:
+                break
+            position += chunk_size
+            after_id = battles[-1][0]
+            if pool is None:
+                result = resolve_chunk(await load_battles(session, battles), policy_key, shadow)
+                # End the read transaction before writing
+                await session.commit()
+                await finish(result)
+                continue
+            await session.commit()
+            in_flight.append(loop.run_in_executor(pool, resolve_in_worker, database_path, battles, policy_key, shadow))
+            if len(in_flight) >= workers * 2:
+                await finish(await in_flight.popleft())
+        while in_flight:
+            await finish(await in_flight.popleft())
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    return totals
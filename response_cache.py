@@ -0,0 +1,97 @@
+"""
+In-process cache of serialized GET responses with strong ETags.
+
+Entries hold the JSON bytes of a response and the data version they were
+built at: the `data_version` counter, bumped in the same transaction as
+every battle write, delete, winner recompute and archive prune
+(model_stats.bump_data_version), so changes from other processes (CLI
+scripts) and write-behind commits are seen too. A request reads the
+version (model_stats.read_data_version, one primary key lookup) before
+anything else, so an entry is never older than its version, and gets the
+cached bytes back while the version has not moved.
+
+ETags are a hash of the bytes, so a client's copy still gets a
+304 Not Modified after the version moved as long as its response did not
+change (e.g. an old battle after a new one was saved).
+
+Entries also keep their gzip/brotli encodings (http_compression.py), made
+on first request, so a cache hit is not compressed again.
+"""
+import hashlib
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, NamedTuple, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from config import settings
+from fast_json import dumps
+from http_compression import choose_encoding, compress
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match names etag (weak comparison, as for GET)"""
+    if_none_match = request.headers.get("if-none-match", "")
+    client_etags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in client_etags or "*" in client_etags
+
+
+class CachedResponse(NamedTuple):
+    version: int
+    body: bytes
+    etag: str
+    encoded: Dict[str, bytes]  # Compressed bodies by Content-Encoding, filled by respond()
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "not_modified": 0}
+
+    def get(self, key: Hashable, version: int) -> Optional[CachedResponse]:
+        entry = self.entries.get(key)
+        if entry is None or entry.version != version:
+            self.stats["misses"] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry
+
+    def put(self, key: Hashable, version: int, payload: Any) -> CachedResponse:
+        # Same bytes the app's FastJSONResponse would send for the payload
+        body = dumps(payload)
+        entry = CachedResponse(version, body, f'"{hashlib.sha256(body).hexdigest()[:32]}"', {})
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        self.entries.clear()
+
+    def respond(self, request: Request, entry: CachedResponse, cache_control: str = "no-cache") -> Response:
+        """The cached bytes (compressed when the client accepts it), or 304 when If-None-Match already has them"""
+        encoding = None
+        if settings.response_compression and len(entry.body) >= settings.response_compression_min_bytes:
+            encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+        headers = {"ETag": entry.etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        if encoding is not None:
+            # Like CompressionMiddleware: other bytes, so a weak ETag
+            headers["ETag"] = f"W/{entry.etag}"
+        if etag_matches(request, entry.etag):
+            self.stats["not_modified"] += 1
+            return Response(status_code=304, headers=headers)
+        if encoding is None:
+            return Response(entry.body, media_type="application/json", headers=headers)
+        body = entry.encoded.get(encoding)
+        if body is None:
+            body = entry.encoded[encoding] = compress(
+                entry.body, encoding, settings.response_gzip_level, settings.response_brotli_quality
+            )
+        headers["Content-Encoding"] = encoding
+        return Response(body, media_type="application/json", headers=headers)
+
+
+response_cache = ResponseCache(settings.response_cache_entries)
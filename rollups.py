@@ -0,0 +1,216 @@
+"""
+Per-model daily rollups for trends (/api/stats/timeseries).
+
+`model_daily_stats` holds, per UTC day and model: battles, wins, score
+count/sum/sum of squares and a DDSketch of response latencies
+(sketches.py). Rows are updated in the same transaction that writes or
+deletes a battle, and winner recomputes move wins between the days of the
+battles they change, so a date range costs days x models rows no matter
+how many battles it covers. Weeks and months are merged from their days.
+
+Battles pruned into the archive keep their rollups. rebuild_rollups()
+(rebuild_stats.py) recomputes the days that still have battles.
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, delete, func, bindparam, insert, case, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database import Battle, Response, ModelDailyStats
+from sketches import DDSketch
+
+# (model_name, average_score, is_winner, latency_s) for one response
+RollupResponse = Tuple[str, Optional[float], int, Optional[float]]
+
+COUNT_COLUMNS = ("battles", "wins", "score_count", "score_sum", "score_sumsq")
+
+INTERVALS = ("day", "week", "month")
+
+
+def day_of(created_at: datetime) -> str:
+    return created_at.strftime("%Y-%m-%d")
+
+
+async def apply_battle(session, day: str, responses: List[RollupResponse], sign: int = 1):
+    """Add (sign=1) or remove (sign=-1) one battle's responses from its day's rows"""
+    await apply_battles(session, [(day, responses)], sign)
+
+
+async def apply_battles(session, battles: List[Tuple[str, List[RollupResponse]]], sign: int = 1):
+    """apply_battle() for (day, responses) of many battles, with one read and one upsert"""
+    totals: Dict[Tuple[str, str], Dict] = {}
+    for day, responses in battles:
+        for model_name, average_score, is_winner, latency in responses:
+            row = totals.get((day, model_name))
+            if row is None:
+                row = totals[day, model_name] = {column: 0 for column in COUNT_COLUMNS}
+                row["latencies"] = []
+            score = average_score or 0.0
+            row["battles"] += sign
+            row["wins"] += sign * (1 if is_winner else 0)
+            row["score_count"] += sign * (1 if average_score is not None else 0)
+            row["score_sum"] += sign * score
+            row["score_sumsq"] += sign * score * score
+            if latency is not None:
+                row["latencies"].append(latency)
+    if not totals:
+        return
+    table = ModelDailyStats.__table__
+    # Sketches can't be merged in SQL: read the current ones (primary key lookups)
+    existing = {
+        (day, model_name): sketch
+        for day, model_name, sketch in (await session.execute(
+            select(table.c.day, table.c.model_name, table.c.latency_sketch)
+            .where(tuple_(table.c.day, table.c.model_name).in_(list(totals)))
+        )).all()
+    }
+
+    rows = []
+    for (day, model_name), row in totals.items():
+        latencies = row.pop("latencies")
+        sketch = DDSketch.from_bytes(existing.get((day, model_name)))
+        if latencies:
+            change = DDSketch(sketch.relative_accuracy)
+            change.add_many(latencies)
+            sketch.merge(change, sign)
+        rows.append({
+            "day": day, "model_name": model_name, **row,
+            "latency_sketch": sketch.to_bytes() if sketch.count else None,
+        })
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["day", "model_name"],
+        set_={
+            **{column: table.c[column] + stmt.excluded[column] for column in COUNT_COLUMNS},
+            "latency_sketch": stmt.excluded.latency_sketch,
+        }
+    )
+    await session.execute(stmt, rows)
+
+
+async def move_wins(session, changes: List[Tuple[int, str, int]]):
+    """Apply (battle_id, model_name, wins delta) to the rows of each battle's day"""
+    if not changes:
+        return
+    table = ModelDailyStats.__table__
+    battle_day = select(func.date(Battle.created_at)).where(Battle.id == bindparam("b_id")).scalar_subquery()
+    await session.execute(
+        table.update()
+        .where(table.c.day == battle_day, table.c.model_name == bindparam("m_name"))
+        .values(wins=table.c.wins + bindparam("delta")),
+        [{"b_id": battle_id, "m_name": model_name, "delta": delta} for battle_id, model_name, delta in changes]
+    )
+
+
+async def rebuild_rollups(session) -> int:
+    """
+    Recompute every day from its first remaining battle on from the battles
+    and responses tables; earlier (pruned) days are kept. Returns the number
+    of rows written.
+    """
+    first = (await session.execute(select(func.min(Battle.created_at)))).scalar()
+    if first is None:
+        return 0
+    first_day = day_of(first) if isinstance(first, datetime) else str(first)[:10]
+    table = ModelDailyStats.__table__
+    await session.execute(delete(table).where(table.c.day >= first_day))
+
+    day = func.date(Battle.created_at)
+    score = Response.average_score
+    await session.execute(
+        insert(table).from_select(
+            ["day", "model_name", *COUNT_COLUMNS],
+            select(
+                day,
+                Response.model_name,
+                func.count(Response.id),
+                func.coalesce(func.sum(case((Response.is_winner == 1, 1), else_=0)), 0),
+                func.count(score),
+                func.coalesce(func.sum(score), 0.0),
+                func.coalesce(func.sum(score * score), 0.0),
+            )
+            .join(Battle, Battle.id == Response.battle_id)
+            .group_by(day, Response.model_name)
+        )
+    )
+
+    sketches: Dict[Tuple[str, str], DDSketch] = {}
+    result = await session.stream(
+        select(day, Response.model_name, Response.latency_s)
+        .join(Battle, Battle.id == Response.battle_id)
+        .where(Response.latency_s.is_not(None))
+    )
+    async for partition in result.partitions(10000):
+        latencies: Dict[Tuple[str, str], List[float]] = {}
+        for row_day, model_name, latency in partition:
+            latencies.setdefault((row_day, model_name), []).append(latency)
+        for key, values in latencies.items():
+            sketches.setdefault(key, DDSketch()).add_many(values)
+    if sketches:
+        await session.execute(
+            table.update()
+            .where(table.c.day == bindparam("d"), table.c.model_name == bindparam("m_name"))
+            .values(latency_sketch=bindparam("sketch")),
+            [{"d": d, "m_name": m, "sketch": sketch.to_bytes()} for (d, m), sketch in sketches.items()]
+        )
+    return (await session.execute(
+        select(func.count()).select_from(table).where(table.c.day >= first_day)
+    )).scalar()
+
+
+async def reset_rollups(session):
+    await session.execute(delete(ModelDailyStats))
+
+
+def period_start(day: date, interval: str) -> date:
+    if interval == "week":
+        return day - timedelta(days=day.weekday())  # ISO weeks start on Monday
+    if interval == "month":
+        return day.replace(day=1)
+    return day
+
+
+async def read_timeseries(
+    session,
+    since: date,
+    until: date,
+    interval: str = "day",
+    models: Optional[List[str]] = None
+) -> Dict[str, List[Dict]]:
+    """Per-model points (one per day, week or month with battles) between since and until, inclusive"""
+    if interval not in INTERVALS:
+        raise ValueError(f"interval must be one of {', '.join(INTERVALS)}")
+    table = ModelDailyStats.__table__
+    query = select(table).where(table.c.day >= since.isoformat(), table.c.day <= until.isoformat())
+    if models:
+        query = query.where(table.c.model_name.in_(models))
+    result = await session.execute(query.order_by(table.c.day))
+
+    periods: Dict[Tuple[str, date], Dict] = {}
+    for row in result.mappings():
+        start = period_start(date.fromisoformat(row["day"]), interval)
+        point = periods.get((row["model_name"], start))
+        if point is None:
+            point = periods[row["model_name"], start] = {column: 0 for column in COUNT_COLUMNS}
+            point["latency"] = DDSketch()
+        for column in COUNT_COLUMNS:
+            point[column] += row[column]
+        if row["latency_sketch"]:
+            point["latency"].merge(DDSketch.from_bytes(row["latency_sketch"]))
+
+    series: Dict[str, List[Dict]] = {}
+    for (model_name, start), point in sorted(periods.items()):
+        count = point["score_count"]
+        mean = point["score_sum"] / count if count else None
+        series.setdefault(model_name, []).append({
+            "period": start.isoformat(),
+            "battles": point["battles"],
+            "wins": point["wins"],
+            # A percentage, like win_rate in /api/stats
+            "win_rate": round(point["wins"] / point["battles"] * 100, 2) if point["battles"] else 0.0,
+            "average_score": mean,
+            "score_stddev": max(point["score_sumsq"] / count - mean ** 2, 0.0) ** 0.5 if count else None,
+            "latency": point["latency"].summary() if point["latency"].count else None,
+        })
+    return series
@@ -0,0 +1,179 @@
+"""
+Full-text search over battles (SQLite FTS5).
+
+`battle_search` is an external-content FTS5 table with one row per battle
+(rowid = battle id) and three columns: the prompt, every response and every
+judge's reasoning. Its content is read through the `battle_search_source`
+view, so the text itself is stored only once, in the battles, responses and
+ratings tables (compressed; the view decompresses it, see compression.py).
+
+External-content tables are not updated automatically: persistence calls
+index_battle() after inserting a battle and unindex_battle() before deleting
+one, in the same transaction. rebuild_search_index() recreates the index
+from the view (migration 6 does this for existing databases).
+"""
+import re
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import text, bindparam, DateTime
+
+SEARCH_TABLE = "battle_search"
+SOURCE_VIEW = "battle_search_source"
+
+# Prompt matches count most, judge reasoning least
+COLUMN_WEIGHTS = (3.0, 1.0, 0.5)
+
+SNIPPET_TOKENS = 16
+
+SCHEMA = [
+    f"""
+    CREATE VIEW IF NOT EXISTS {SOURCE_VIEW} AS
+    SELECT
+        battles.id AS id,
+        text_decompress(battles.prompt) AS prompt,
+        (SELECT group_concat(text_decompress(response_text), char(10)) FROM responses
+         WHERE responses.battle_id = battles.id) AS responses,
+        (SELECT group_concat(text_decompress(reasoning), char(10)) FROM ratings
+         WHERE ratings.battle_id = battles.id) AS reasoning
+    FROM battles
+    """,
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        prompt, responses, reasoning,
+        content='{SOURCE_VIEW}', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )
+    """,
+]
+
+
+async def create_search_index(conn):
+    for statement in SCHEMA:
+        await conn.execute(text(statement))
+
+
+async def rebuild_search_index(session):
+    """Re-read every battle through the source view"""
+    await session.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')"))
+
+
+async def index_battle(session, battle_id: int):
+    """Add a battle to the index; call after its responses and ratings are inserted"""
+    await session.execute(text(f"""
+        INSERT INTO {SEARCH_TABLE}(rowid, prompt, responses, reasoning)
+        SELECT id, prompt, responses, reasoning FROM {SOURCE_VIEW} WHERE id = :id
+    """), {"id": battle_id})
+
+
+async def index_battles(session, battle_ids: List[int]):
+    await session.execute(text(f"""
+        INSERT INTO {SEARCH_TABLE}(rowid, prompt, responses, reasoning)
+        SELECT id, prompt, responses, reasoning FROM {SOURCE_VIEW} WHERE id IN :ids
+    """).bindparams(bindparam("ids", expanding=True)), {"ids": list(battle_ids)})
+
+
+async def unindex_battle(session, battle_id: int):
+    """Remove a battle from the index; call before its rows are deleted"""
+    await unindex_battles(session, [battle_id])
+
+
+async def unindex_battles(session, battle_ids: List[int]):
+    # FTS5 needs the indexed values to remove their tokens
+    await session.execute(text(f"""
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, prompt, responses, reasoning)
+        SELECT 'delete', id, prompt, responses, reasoning FROM {SOURCE_VIEW} WHERE id IN :ids
+    """).bindparams(bindparam("ids", expanding=True)), {"ids": list(battle_ids)})
+
+
+async def clear_search_index(session):
+    await session.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('delete-all')"))
+
+
+def build_match_query(query: str) -> str:
+    """
+    Turn user input into an FTS5 query: every word must match, a trailing *
+    makes it a prefix match. Words are quoted so FTS5 operators and
+    punctuation in the input are searched for literally instead of parsed.
+    """
+    terms = []
+    for word in query.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*")
+        if not re.search(r"\w", word):
+            continue
+        terms.append('"' + word.replace('"', '""') + '"' + ("*" if prefix else ""))
+    if not terms:
+        raise ValueError("Search query must contain at least one word")
+    return " ".join(terms)
+
+
+async def search_battles(
+    session,
+    query: str,
+    limit: int = 20,
+    offset: int = 0,
+    model: Optional[str] = None,
+    winner: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+) -> List:
+    """
+    Battles matching `query`, best match first (bm25), with a snippet of the
+    best-matching column (matches wrapped in **). Filters are the same as
+    queries.list_battles. Raises ValueError for an empty query.
+    """
+    filters = []
+    params = {
+        "match": build_match_query(query),
+        "limit": limit,
+        "offset": offset,
+        "tokens": SNIPPET_TOKENS,
+    }
+    if winner:
+        filters.append("battles.winner_model = :winner")
+        params["winner"] = winner
+    if since:
+        filters.append("battles.created_at >= :since")
+        params["since"] = since
+    if until:
+        filters.append("battles.created_at < :until")
+        params["until"] = until
+    if model:
+        filters.append(
+            "EXISTS (SELECT 1 FROM responses WHERE responses.battle_id = battles.id"
+            " AND responses.model_name = :model)"
+        )
+        params["model"] = model
+
+    weights = ", ".join(str(weight) for weight in COLUMN_WEIGHTS)
+    where = "".join(f" AND {condition}" for condition in filters)
+    # Rank first, then build snippets for the returned page only: snippet() re-reads
+    # each battle's text, so computing it for every match would dominate the query
+    statement = text(f"""
+        WITH page AS (
+            SELECT {SEARCH_TABLE}.rowid AS id, bm25({SEARCH_TABLE}, {weights}) AS rank
+            FROM {SEARCH_TABLE}
+            JOIN battles ON battles.id = {SEARCH_TABLE}.rowid
+            WHERE {SEARCH_TABLE} MATCH :match{where}
+            ORDER BY rank
+            LIMIT :limit OFFSET :offset
+        )
+        SELECT
+            battles.id, battles.prompt_preview, battles.has_image,
+            battles.winner_model, battles.created_at,
+            snippet({SEARCH_TABLE}, -1, '**', '**', '...', :tokens) AS snippet,
+            page.rank
+        FROM page
+        CROSS JOIN {SEARCH_TABLE}
+        CROSS JOIN battles
+        WHERE {SEARCH_TABLE} MATCH :match
+            AND {SEARCH_TABLE}.rowid = page.id
+            AND battles.id = page.id
+        ORDER BY page.rank
+    """).columns(created_at=DateTime)
+    # Bind dates the way SQLAlchemy stores them so they compare correctly as text
+    statement = statement.bindparams(*[
+        bindparam(name, type_=DateTime) for name in ("since", "until") if name in params
+    ])
+    return (await session.execute(statement, params)).all()
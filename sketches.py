@@ -0,0 +1,127 @@
+"""
+DDSketch: mergeable quantile sketch with relative-error guarantees.
+
+Positive values go into logarithmic buckets (bucket i holds values in
+(gamma^(i-1), gamma^i] with gamma = (1 + a) / (1 - a)), so every quantile
+is within relative accuracy `a` of a true sample value. Sketches merge (and
+unmerge, for deleted data) by adding bucket counts, which is what the
+per-day rollups need: a week or a month is the merge of its days.
+
+Serialized as a small binary blob: a header (accuracy, zero count, count,
+sum, min, max) followed by (bucket, count) int32 pairs.
+"""
+import math
+import struct
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+DEFAULT_ACCURACY = 0.01
+MIN_VALUE = 1e-9  # Smaller values (and 0) are counted in the zero bucket
+
+HEADER = struct.Struct("<dqqddd")
+
+
+class DDSketch:
+    def __init__(self, relative_accuracy: float = DEFAULT_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def key(self, value: float) -> int:
+        return math.ceil(math.log(value) / self.log_gamma)
+
+    def add(self, value: float, count: int = 1):
+        if value < MIN_VALUE:
+            self.zero_count += count
+        else:
+            key = self.key(value)
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.count += count
+        self.sum += value * count
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def add_many(self, values: Iterable[float]):
+        values = np.asarray(list(values) if not isinstance(values, np.ndarray) else values, dtype=np.float64)
+        if not len(values):
+            return
+        positive = values[values >= MIN_VALUE]
+        keys, counts = np.unique(np.ceil(np.log(positive) / self.log_gamma).astype(np.int64), return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.zero_count += len(values) - len(positive)
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def merge(self, other: "DDSketch", sign: int = 1):
+        """Add (sign=1) or remove (sign=-1) another sketch with the same accuracy"""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Sketches with different accuracies can't be merged")
+        for key, count in other.bins.items():
+            total = self.bins.get(key, 0) + sign * count
+            if total > 0:
+                self.bins[key] = total
+            else:
+                self.bins.pop(key, None)
+        self.zero_count = max(self.zero_count + sign * other.zero_count, 0)
+        self.count = max(self.count + sign * other.count, 0)
+        self.sum += sign * other.sum
+        if sign > 0:
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+        elif not self.count:
+            self.sum, self.min, self.max = 0.0, math.inf, -math.inf
+        # After a removal min/max may be stale; quantile() clamps with the buckets instead
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                # Midpoint of the bucket in relative terms
+                value = 2 * self.gamma ** key / (1 + self.gamma)
+                return min(max(value, self.min), self.max) if self.min <= self.max else value
+        return self.max
+
+    def mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+    def to_bytes(self) -> bytes:
+        keys = np.fromiter(self.bins.keys(), dtype="<i4", count=len(self.bins))
+        counts = np.fromiter(self.bins.values(), dtype="<i4", count=len(self.bins))
+        pairs = np.empty(len(keys) * 2, dtype="<i4")
+        pairs[0::2], pairs[1::2] = keys, counts
+        return HEADER.pack(self.relative_accuracy, self.zero_count, self.count,
+                           self.sum, self.min, self.max) + pairs.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: Optional[bytes]) -> "DDSketch":
+        if not data:
+            return cls()
+        accuracy, zero_count, count, total, low, high = HEADER.unpack_from(data)
+        sketch = cls(accuracy)
+        pairs = np.frombuffer(data, dtype="<i4", offset=HEADER.size)
+        sketch.bins = dict(zip(pairs[0::2].tolist(), pairs[1::2].tolist()))
+        sketch.zero_count, sketch.count, sketch.sum, sketch.min, sketch.max = zero_count, count, total, low, high
+        return sketch
+
+    def summary(self, quantiles=(0.5, 0.9, 0.99)) -> Dict:
+        return {
+            "count": self.count,
+            "mean": self.mean(),
+            **{f"p{round(q * 100):g}": self.quantile(q) for q in quantiles},
+        }
@@ -0,0 +1,226 @@
+"""
+SQLite storage profile.
+
+Builds the engines used by database.py:
+- a write engine whose connections get WAL journaling and tuned pragmas on connect
+- a read-only engine with its own connection pool for the GET endpoints
+- a DatabaseWriter task that serializes all writes and batches their commits
+
+With WAL, readers never block the writer and vice versa, and funnelling writes
+through one task removes "database is locked" errors between API requests.
+"""
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+
+from config import settings
+from compression import install_sql_functions
+
+
+def get_pragmas(read_only: bool = False) -> List[str]:
+    """PRAGMA statements applied to every new connection of the tuned profile"""
+    pragmas = [
+        f"PRAGMA busy_timeout = {settings.sqlite_busy_timeout_ms}",
+        f"PRAGMA cache_size = -{settings.sqlite_cache_size_kb}",  # Negative = size in KiB
+        f"PRAGMA mmap_size = {settings.sqlite_mmap_size}",
+        "PRAGMA temp_store = MEMORY",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only = ON")
+    else:
+        # journal_mode is persistent in the database file; synchronous=NORMAL is durable under WAL
+        pragmas.append(f"PRAGMA journal_mode = {settings.sqlite_journal_mode}")
+        pragmas.append(f"PRAGMA synchronous = {settings.sqlite_synchronous}")
+    return pragmas
+
+
+def install_pragmas(engine: AsyncEngine, pragmas: List[str]):
+    @event.listens_for(engine.sync_engine, "connect")
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def install_functions(engine: AsyncEngine):
+    """SQL functions every connection needs, whatever the profile (see compression.py)"""
+    @event.listens_for(engine.sync_engine, "connect")
+    def register_functions(dbapi_connection, connection_record):
+        install_sql_functions(dbapi_connection)
+
+
+def create_write_engine(path: str, profile: Optional[str] = None) -> AsyncEngine:
+    """
+    Engine for writes, migrations and scripts. The tuned profile keeps its
+    connections pooled (aiosqlite defaults to a new connection per session) so
+    the pragmas and page cache survive between transactions.
+    """
+    profile = profile or settings.sqlite_profile
+    if profile != "tuned":
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}", echo=False)
+        install_functions(engine)
+        return engine
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{path}",
+        echo=False,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=1,
+        max_overflow=4,
+    )
+    install_pragmas(engine, get_pragmas())
+    install_functions(engine)
+    return engine
+
+
+def create_read_engine(path: str, profile: Optional[str] = None) -> AsyncEngine:
+    """
+    Engine for GET endpoints. The tuned profile opens the file read-only
+    (mode=ro) with a dedicated pool; the default profile is a plain engine.
+    """
+    profile = profile or settings.sqlite_profile
+    if profile != "tuned":
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}", echo=False)
+        install_functions(engine)
+        return engine
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///file:{path}?mode=ro&uri=true",
+        echo=False,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=settings.sqlite_read_pool_size,
+        max_overflow=settings.sqlite_read_pool_size,
+    )
+    install_pragmas(engine, get_pragmas(read_only=True))
+    install_functions(engine)
+    return engine
+
+
+WriteJob = Callable[[AsyncSession], Awaitable[Any]]
+
+
+class DatabaseWriter:
+    """
+    Single writer task.
+
+    Jobs are async callables taking a session. The task collects up to
+    batch_size jobs (waiting at most batch_window_ms after the first one),
+    runs them in one transaction and commits once. If a job raises, the batch
+    is rolled back and its jobs are retried one transaction each so a single
+    failing job cannot take the others down. Jobs must therefore be safe to
+    run again after a rollback.
+
+    When the task is not running (scripts, one-off tools), submit() runs the
+    job directly in its own transaction.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        batch_size: int = 64,
+        batch_window_ms: float = 5.0,
+        max_queue: int = 1000
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.batch_window = batch_window_ms / 1000
+        self.max_queue = max_queue
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        self.stats = {"jobs": 0, "batches": 0, "retried_jobs": 0}
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Finish queued jobs, then stop the task"""
+        if not self.running:
+            return
+        await self.queue.join()
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+    async def submit(self, job: WriteJob) -> Any:
+        """Run a write job and return its result once it has been committed"""
+        if not self.running:
+            return await self._run_single(job)
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((job, future))
+        return await future
+
+    async def _run_single(self, job: WriteJob) -> Any:
+        async with self.session_factory() as session:
+            try:
+                result = await job(session)
+                await session.commit()
+                return result
+            except BaseException:
+                await session.rollback()
+                raise
+
+    async def _collect_batch(self) -> list:
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect_batch()
+            try:
+                await self._run_batch(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _run_batch(self, batch: list):
+        pending = [(job, future) for job, future in batch if not future.cancelled()]
+        if not pending:
+            return
+        self.stats["batches"] += 1
+        self.stats["jobs"] += len(pending)
+
+        results = []
+        try:
+            async with self.session_factory() as session:
+                for job, _ in pending:
+                    results.append(await job(session))
+                await session.commit()
+        except Exception:
+            # Retry each job on its own so only the failing ones report errors
+            self.stats["retried_jobs"] += len(pending)
+            for job, future in pending:
+                try:
+                    result = await self._run_single(job)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+            return
+
+        for (_, future), result in zip(pending, results):
+            if not future.done():
+                future.set_result(result)
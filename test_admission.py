@@ -0,0 +1,82 @@
+"""
+Checks for the battle admission controller (admission.py): the concurrency
+limit, priority order, and each way a request is turned away.
+
+Run with pytest, or directly: python test_admission.py
+"""
+import asyncio
+
+from admission import AdmissionController, AdmissionRejected
+
+
+async def hold(controller: AdmissionController, priority: str, order: list, name: str, release: asyncio.Event):
+    async with controller.admit(priority):
+        order.append(name)
+        await release.wait()
+
+
+def test_limit_and_priority_order():
+    async def run():
+        controller = AdmissionController(max_concurrent=2, max_queue=10, queue_timeout_s=5)
+        order, release = [], asyncio.Event()
+        tasks = [asyncio.create_task(hold(controller, "batch", order, f"first{i}", release)) for i in range(2)]
+        await asyncio.sleep(0)
+        assert controller.running == 2
+        tasks.append(asyncio.create_task(hold(controller, "batch", order, "batch", release)))
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(hold(controller, "interactive", order, "interactive", release)))
+        await asyncio.sleep(0)
+        assert controller.state()["queued"] == {"interactive": 1, "batch": 1}
+
+        release.set()
+        await asyncio.gather(*tasks)
+        assert order == ["first0", "first1", "interactive", "batch"]
+        assert controller.running == 0 and controller.queued() == 0
+        assert controller.counters["batch"]["admitted"] == 3
+
+    asyncio.run(run())
+
+
+def test_rejections():
+    async def run():
+        controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout_s=0.05)
+        await controller.acquire()
+
+        # Waits the whole SLO, then gets turned away
+        try:
+            await controller.acquire()
+            assert False, "should time out"
+        except AdmissionRejected as e:
+            assert e.reason == "timed_out" and e.retry_after >= 1
+        assert controller.queued() == 0
+
+        # Queue full: refused without waiting
+        waiter = asyncio.create_task(controller.acquire("batch"))
+        await asyncio.sleep(0)
+        try:
+            await controller.acquire()
+            assert False, "queue should be full"
+        except AdmissionRejected as e:
+            assert e.reason == "queue_full"
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert controller.queued() == 0 and controller.running == 1
+
+        # Battles take far longer than the SLO: refused up front
+        controller.release(duration=10.0)
+        await controller.acquire()
+        try:
+            await controller.acquire()
+            assert False, "expected wait is over the SLO"
+        except AdmissionRejected as e:
+            assert e.reason == "over_slo" and e.retry_after == 10
+        controller.release()
+        assert controller.running == 0
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_limit_and_priority_order()
+    test_rejections()
+    print("✅ Admission checks OK")
@@ -0,0 +1,64 @@
+"""
+Round-trip test for the compressed text columns (compression.py).
+
+Run with pytest, or directly: python test_compression.py
+"""
+import random
+
+from compression import (
+    CompressedText, DictionaryRegistry, compress_text, decompress_text, registry, train_dictionary
+)
+
+WORDS = "the model response explains function returns value because score judge code".split()
+
+
+def sample_texts(count: int):
+    rng = random.Random(7)
+    return [
+        "## Answer\n" + " ".join(rng.choices(WORDS, k=rng.randint(20, 200))) + "\n```python\nreturn x\n```"
+        for _ in range(count)
+    ]
+
+
+def test_round_trip_with_and_without_dictionary():
+    texts = sample_texts(200) + ["short", "", "ünïcödé " * 40]
+    column = "test_column"
+    plain = [compress_text(value, column) for value in texts]
+
+    # An id far above anything a real database will use
+    registry.add(60000, column, train_dictionary(texts))
+    try:
+        with_dictionary = [compress_text(value, column) for value in texts]
+        for original, stored_plain, stored_dict in zip(texts, plain, with_dictionary):
+            assert decompress_text(stored_plain) == original
+            assert decompress_text(stored_dict) == original
+    finally:
+        registry.dictionaries.pop(60000)
+        registry.current.pop(column)
+
+    # Short values stay TEXT; the trained dictionary beats plain deflate on short prose
+    assert compress_text("short", column) == "short"
+    assert sum(map(len, with_dictionary[:200])) < sum(map(len, plain[:200]))
+
+
+def test_column_type_passes_through_text_and_null():
+    column_type = CompressedText("test_column")
+    assert column_type.process_bind_param(None, None) is None
+    assert column_type.process_result_value(None, None) is None
+    assert column_type.process_result_value("legacy plain text", None) == "legacy plain text"
+
+
+def test_unknown_dictionary_is_an_error():
+    stored = DictionaryRegistry()
+    try:
+        stored.get(59999)
+    except ValueError:
+        return
+    raise AssertionError("expected ValueError for an unknown dictionary id")
+
+
+if __name__ == "__main__":
+    test_round_trip_with_and_without_dictionary()
+    test_column_type_passes_through_text_and_null()
+    test_unknown_dictionary_is_an_error()
+    print("✅ Compression round trip OK")
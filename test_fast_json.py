@@ -0,0 +1,71 @@
+"""
+Checks for the response encoder (fast_json.py): numpy values and other
+non-JSON types encode the same with orjson and with the stdlib fallback,
+including the real /api/stats/judges payload.
+
+Run with pytest, or directly: python test_fast_json.py
+"""
+import json
+import asyncio
+from datetime import datetime
+
+import numpy as np
+
+import fast_json
+from fast_json import FastJSONResponse, dumps
+from judge_stats import JudgeStats, judge_stats
+from test_judge_stats import sample_ratings
+
+
+def each_encoder(check):
+    """Run check() with orjson (when installed), then with the stdlib fallback"""
+    saved = fast_json.orjson
+    try:
+        for module in ([saved] if saved is not None else []) + [None]:
+            fast_json.orjson = module
+            check()
+    finally:
+        fast_json.orjson = saved
+
+
+def test_numpy_and_other_values():
+    content = {
+        "float": np.float64(1.5), "int": np.int64(3), "small": np.float32(0.25), "flag": np.bool_(True),
+        "array": np.arange(3), "when": datetime(2024, 5, 1, 12, 0), "tags": {"x"}, 7: "int key",
+    }
+    expected = {
+        "float": 1.5, "int": 3, "small": 0.25, "flag": True,
+        "array": [0, 1, 2], "when": "2024-05-01T12:00:00", "tags": ["x"], "7": "int key",
+    }
+
+    def check():
+        assert json.loads(dumps(content)) == expected
+
+    each_encoder(check)
+
+
+def test_judge_stats_endpoint():
+    import main
+
+    stats = JudgeStats()
+    stats.add_ratings(*zip(*sample_ratings(50)))
+    saved = judge_stats.summary
+    judge_stats.summary = stats.summary()
+    try:
+        payload = asyncio.run(main.get_judge_stats())
+    finally:
+        judge_stats.summary = saved
+
+    def check():
+        decoded = json.loads(FastJSONResponse(payload).body)
+        assert set(decoded["judges"]) == {"a", "b", "c", "d"}
+        assert isinstance(decoded["judges"]["a"]["mean_score"], float)
+        assert isinstance(decoded["agreement"]["mean_kendall_tau"], float)
+
+    each_encoder(check)
+
+
+if __name__ == "__main__":
+    test_numpy_and_other_values()
+    test_judge_stats_endpoint()
+    print("✅ JSON encoding checks OK")
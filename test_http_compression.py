@@ -0,0 +1,90 @@
+"""
+Checks for the response compression middleware (http_compression.py):
+Accept-Encoding negotiation, the size threshold, streaming bodies and
+responses that must pass through untouched.
+
+Run with pytest, or directly: python test_http_compression.py
+"""
+import gzip
+
+from fastapi import FastAPI
+from fastapi.responses import Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+from http_compression import CompressionMiddleware, choose_encoding, brotli
+
+BIG = {"text": "the judge explains the answer " * 200}
+
+
+def make_client() -> TestClient:
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+    @app.get("/big")
+    async def big():
+        return BIG
+
+    @app.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @app.get("/stream")
+    async def stream():
+        async def lines():
+            for i in range(100):
+                yield f'{{"line": {i}, "text": "{"x" * 50}"}}\n'.encode()
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    @app.get("/gzipped")
+    async def gzipped():
+        return Response(gzip.compress(b"a" * 2000), media_type="application/gzip")
+
+    @app.get("/tagged")
+    async def tagged():
+        return Response(b"x" * 2000, media_type="text/plain", headers={"ETag": '"abc"'})
+
+    return TestClient(app)
+
+
+def test_negotiation():
+    best = "br" if brotli is not None else "gzip"
+    assert choose_encoding("gzip, deflate, br") == best
+    assert choose_encoding("gzip;q=0.5, br;q=0") == "gzip"
+    assert choose_encoding("gzip;q=0") is None
+    assert choose_encoding("identity") is None
+    assert choose_encoding("*") == best
+    assert choose_encoding("") is None
+
+
+def test_compresses_large_and_streaming_responses():
+    client = make_client()
+    response = client.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert int(response.headers["content-length"]) < len(response.content)
+    assert response.json() == BIG
+
+    response = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert response.text.count("\n") == 100
+
+    response = client.get("/tagged", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["etag"] == 'W/"abc"'
+
+
+def test_passes_through():
+    client = make_client()
+    assert "content-encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    assert "content-encoding" not in client.get("/big", headers={"Accept-Encoding": "identity"}).headers
+
+    response = client.get("/gzipped", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert gzip.decompress(response.content) == b"a" * 2000
+
+
+if __name__ == "__main__":
+    test_negotiation()
+    test_compresses_large_and_streaming_responses()
+    test_passes_through()
+    print("✅ Response compression checks OK")
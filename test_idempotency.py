@@ -0,0 +1,114 @@
+"""
+Checks for battle idempotency keys (idempotency.py): retries attach to a
+running request, replay a finished one, and a failed or expired key runs
+again.
+
+Run with pytest, or directly: python test_idempotency.py
+"""
+import asyncio
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from database import Base
+from idempotency import IdempotencyStore, IdempotencyConflict
+
+RESPONSE = {"id": 7, "winner": "anthropic", "responses": [{"model": "anthropic", "text": "héllo"}]}
+
+
+async def make_sessions():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    return engine, async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+def test_attach_and_replay():
+    async def run():
+        engine, sessions = await make_sessions()
+        store = IdempotencyStore(ttl_s=60)
+        async with sessions() as session:
+            assert await store.begin(session, "k", "f1") is None
+
+            # A retry while the first request runs waits for its result
+            retry = asyncio.create_task(store.begin(session, "k", "f1"))
+            await asyncio.sleep(0)
+            assert not retry.done()
+            try:
+                await store.begin(session, "k", "f2")
+                assert False, "a different request must not reuse the key"
+            except IdempotencyConflict:
+                pass
+
+            await store.save(session, "k", "f1", 7, RESPONSE)
+            await session.commit()
+            store.finish("k", RESPONSE)
+            assert await retry == RESPONSE
+
+            # Later retries read the stored response
+            assert await store.begin(session, "k", "f1") == RESPONSE
+            try:
+                await store.begin(session, "k", "f2")
+                assert False, "a different request must not reuse the key"
+            except IdempotencyConflict:
+                pass
+            assert not store.in_flight
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_failure_and_expiry():
+    async def run():
+        engine, sessions = await make_sessions()
+        store = IdempotencyStore(ttl_s=60)
+        async with sessions() as session:
+            assert await store.begin(session, "k", "f") is None
+            retry = asyncio.create_task(store.begin(session, "k", "f"))
+            await asyncio.sleep(0)
+            store.fail("k", RuntimeError("provider down"))
+            try:
+                await retry
+                assert False, "the retry gets the first request's error"
+            except RuntimeError:
+                pass
+            # Nothing was stored: the next retry runs the battle
+            assert await store.begin(session, "k", "f") is None
+            store.fail("k", RuntimeError("again"))
+
+            expired = IdempotencyStore(ttl_s=-1)
+            await expired.save(session, "old", "f", 1, RESPONSE)
+            await session.commit()
+            assert await store.begin(session, "old", "f") is None
+            # Saving a new key drops expired rows and replaces the old one
+            await store.save(session, "old", "f", 2, {**RESPONSE, "id": 2})
+            await session.commit()
+            store.finish("old", RESPONSE)
+            assert (await store.begin(session, "old", "f"))["id"] == 2
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_write_behind_key_stays_in_memory_until_saved():
+    async def run():
+        engine, sessions = await make_sessions()
+        store = IdempotencyStore(ttl_s=60)
+        committed = asyncio.Event()
+        async with sessions() as session:
+            assert await store.begin(session, "k", "f") is None
+            store.finish("k", RESPONSE, committed.wait())
+            # Not in the table yet: the retry is answered from memory
+            assert await store.begin(session, "k", "f") == RESPONSE
+            committed.set()
+            await asyncio.gather(*store.saving)
+            assert not store.in_flight and not store.saving
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_attach_and_replay()
+    test_failure_and_expiry()
+    test_write_behind_key_stays_in_memory_until_saved()
+    print("✅ Idempotency checks OK")
@@ -0,0 +1,176 @@
+"""
+Checks for the write-behind journal (journal.py): replay after a crash,
+a torn last line, segment files deleted once committed, and deleted
+battles that must not come back on replay.
+
+The database is replaced by a dict: make_job is swapped for a job that
+stores the entry, so only the journal's own bookkeeping is exercised.
+
+Run with pytest, or directly: python test_journal.py
+"""
+import asyncio
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import journal
+from blob_store import blob_store
+from journal import WriteBehindJournal, make_entry
+
+
+class FakeDatabase:
+    """Stands in for the writer and the battles table"""
+
+    def __init__(self):
+        self.battles = {}
+        self.failing = set()  # Battle ids whose commit raises
+        self.open = asyncio.Event()  # Commits wait for it, so tests decide when they run
+
+    async def submit(self, job):
+        await self.open.wait()
+        return await job(None)
+
+    def make_job(self, entry):
+        async def save(session):
+            if entry["id"] in self.failing:
+                raise RuntimeError("disk I/O error")
+            if entry["id"] in self.battles:
+                return False
+            self.battles[entry["id"]] = entry
+            return True
+        return save
+
+
+def entry(battle_id: int, image=None):
+    results = {"responses": {"a": "answer"}, "average_scores": {"a": 7.0}, "winner": "a", "parsed_ratings": {}}
+    return make_entry(battle_id, f"prompt {battle_id}", results, datetime(2024, 1, 1), image)
+
+
+def run(check):
+    """Run check(path, database) in a temporary directory with make_job swapped out"""
+    saved = journal.make_job
+    database = FakeDatabase()
+    journal.make_job = database.make_job
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            asyncio.run(check(Path(directory) / "battles.journal", database))
+    finally:
+        journal.make_job = saved
+
+
+async def append_all(wal: WriteBehindJournal, battle_ids):
+    """Journal the battles, then let their commits run"""
+    wal.writer.open.clear()
+    for battle_id in battle_ids:
+        await wal.append(entry(battle_id))
+    wal.writer.open.set()
+    await asyncio.gather(*list(wal.tasks))
+
+
+def test_segments_deleted_once_committed():
+    async def check(path, database):
+        wal = WriteBehindJournal(str(path), database, fsync=False, segment_size=3)
+        await append_all(wal, range(1, 8))
+        assert sorted(database.battles) == list(range(1, 8))
+        assert wal.segment_files() == [] and not wal.outstanding
+
+        # A failed commit keeps its segment (only that one) for the next replay
+        database.failing = {9}
+        await append_all(wal, range(8, 15))
+        (_, kept), = wal.segment_files()
+        assert [e["id"] for e in wal.read_entries(kept)] == [8, 9, 10]
+        assert wal.stats["failed"] == 1
+
+    run(check)
+
+
+def test_replay_with_torn_last_line():
+    async def check(path, database):
+        wal = WriteBehindJournal(str(path), database, fsync=False, segment_size=10)
+        database.failing = {1, 2, 3}
+        await append_all(wal, [1, 2, 3])
+        # Crash while appending battle 4
+        (_, segment), = wal.segment_files()
+        with open(segment, "a", encoding="utf-8") as f:
+            f.write('{"id": 4, "prompt": "pro')
+        # An unsegmented journal left by an older version is replayed too
+        path.write_text(f'{journal.json.dumps(entry(5))}\n', encoding="utf-8")
+
+        database.failing = set()
+        database.open.set()
+        restarted = WriteBehindJournal(str(path), database, fsync=False)
+        assert await restarted.replay() == 4
+        assert sorted(database.battles) == [1, 2, 3, 5]
+        assert restarted.segment_files() == [] and not path.exists()
+        assert await restarted.replay() == 0
+
+    run(check)
+
+
+def test_deleted_battles_are_not_replayed():
+    async def check(path, database):
+        wal = WriteBehindJournal(str(path), database, fsync=False, segment_size=10)
+        database.failing = {3}
+        await append_all(wal, [1, 2, 3, 4])
+        # Battles 1, 2 and 4 are committed but stay on disk with 3; the API deletes 2
+        await wal.forget({2})
+        del database.battles[2]
+
+        database.failing = set()
+        restarted = WriteBehindJournal(str(path), database, fsync=False)
+        assert await restarted.replay() == 1
+        assert sorted(database.battles) == [1, 3, 4]
+
+        # Clearing everything drops the whole journal
+        database.failing = {5}
+        await append_all(restarted, [5, 6])
+        await restarted.forget()
+        assert restarted.segment_files() == [] and not restarted.failed_segments
+        database.battles.clear()
+        database.failing = set()
+        assert await WriteBehindJournal(str(path), database, fsync=False).replay() == 0
+
+    run(check)
+
+
+def test_screenshots_held_until_committed():
+    async def check(path, database):
+        wal = WriteBehindJournal(str(path), database, fsync=False)
+        database.failing = {2}
+        database.open.clear()
+        for battle_id in (1, 2):
+            await wal.append(entry(battle_id, ("f" * 64, "image/png", 3)))
+        # Journaled, not committed: a delete of another battle must keep the file
+        assert blob_store.held["f" * 64] == 2
+        database.open.set()
+        await asyncio.gather(*list(wal.tasks))
+        # Battle 2 failed and waits for the next replay
+        assert blob_store.held["f" * 64] == 1
+
+        # A new process holds the replayed battles' screenshots until each commit
+        blob_store.held.clear()
+        database.failing = set()
+        held_at_commit = []
+
+        def make_job(entry):
+            held_at_commit.append(blob_store.held["f" * 64])
+            return database.make_job(entry)
+
+        journal.make_job = make_job
+        restarted = WriteBehindJournal(str(path), database, fsync=False)
+        assert await restarted.replay() == 1
+        # Battle 1 is replayed too (a no-op: it is already in the database)
+        assert held_at_commit == [2, 1] and "f" * 64 not in blob_store.held
+
+    try:
+        run(check)
+    finally:
+        blob_store.held.pop("f" * 64, None)
+
+
+if __name__ == "__main__":
+    test_segments_deleted_once_committed()
+    test_replay_with_torn_last_line()
+    test_deleted_battles_are_not_replayed()
+    test_screenshots_held_until_committed()
+    print("✅ Write-behind journal checks OK")
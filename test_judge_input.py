@@ -0,0 +1,82 @@
+"""
+Checks for judge input compaction (judge_input.py): answers within budget
+pass through, longer ones are cut to the budget with their head, tail and
+an outline of the omitted middle, every contestant gets the same budget,
+and empty or whitespace-only answers stay empty.
+
+Run with pytest, or directly: python test_judge_input.py
+"""
+from judge_input import compact_response, build_judge_digest, estimate_tokens
+
+MAX_TOKENS = 200
+
+
+def long_answer(sections: int = 60) -> str:
+    parts = ["Intro: the short answer is yes."]
+    for i in range(sections):
+        parts.append(f"## Step {i}\n" + f"Step {i} explains one more detail of the solution. " * 4)
+        if i % 10 == 0:
+            parts.append(f"```python\nprint({i})\n```")
+    parts.append("Conclusion: it works.")
+    return "\n".join(parts)
+
+
+def test_under_budget_unchanged():
+    text = "A short answer.\n\n```python\nprint(1)\n```"
+    assert compact_response(text, MAX_TOKENS) is text
+    # Exactly at the budget still fits
+    exact = "x" * (MAX_TOKENS * 4)
+    assert compact_response(exact, MAX_TOKENS) is exact
+    # max_tokens <= 0 turns compaction off
+    assert compact_response(long_answer(), 0) == long_answer()
+
+
+def test_over_budget_cut_with_head_tail_and_outline():
+    text = long_answer()
+    assert estimate_tokens(text) > MAX_TOKENS * 5
+    compacted = compact_response(text, MAX_TOKENS)
+    assert estimate_tokens(compacted) <= MAX_TOKENS
+    assert compacted.startswith("Intro: the short answer is yes.")
+    assert compacted.endswith("Conclusion: it works.")
+    assert "tokens omitted for judging. Outline of the omitted section:" in compacted
+    assert "- ...\n...]" in compacted  # The outline was cut to its share of the budget
+    assert "code block (python, 1 lines)" in compacted
+
+    # Every budget holds, marker and outline included
+    for max_tokens in range(40, 1000, 37):
+        assert estimate_tokens(compact_response(text, max_tokens)) <= max_tokens, max_tokens
+
+
+def test_contestants_share_the_budget():
+    text = long_answer()
+    responses = {"verbose": text, "also-verbose": text + "\nP.S. one more thing.", "brief": "Yes."}
+    digest, stats = build_judge_digest(responses, MAX_TOKENS, num_judges=3)
+    assert set(digest) == set(responses)
+    assert digest["brief"] == "Yes."
+    for model in ("verbose", "also-verbose"):
+        assert estimate_tokens(digest[model]) <= MAX_TOKENS
+    assert digest["also-verbose"].endswith("P.S. one more thing.")
+    assert stats["truncated_models"] == ["verbose", "also-verbose"]
+    assert stats["judge_tokens"] == sum(estimate_tokens(t) for t in digest.values())
+    assert stats["tokens_saved"] == 3 * (stats["original_tokens"] - stats["judge_tokens"])
+
+
+def test_empty_and_whitespace_answers():
+    for text in ("", " ", "\n\n", " \t\n" * 3):
+        assert compact_response(text, MAX_TOKENS) == text
+    # Over budget with nothing to keep: no marker for omitted blank space
+    assert compact_response(" " * 5000, MAX_TOKENS) == ""
+    assert compact_response("\n" * 5000, MAX_TOKENS) == ""
+
+    digest, stats = build_judge_digest({"a": "", "b": "   ", "c": "\n" * 5000}, MAX_TOKENS, num_judges=2)
+    assert digest == {"a": "", "b": "   ", "c": ""}
+    assert stats["truncated_models"] == ["c"]
+    assert stats["judge_tokens"] == 1
+
+
+if __name__ == "__main__":
+    test_under_budget_unchanged()
+    test_over_budget_cut_with_head_tail_and_outline()
+    test_contestants_share_the_budget()
+    test_empty_and_whitespace_answers()
+    print("✅ Judge input checks OK")
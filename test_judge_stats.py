@@ -0,0 +1,167 @@
+"""
+Checks for the judge analytics (judge_stats.py): the vectorized statistics
+match straightforward per-battle loops, folding battles in incrementally
+gives the same result as one pass, and a planted self-preference shows up.
+
+Run with pytest, or directly: python test_judge_stats.py
+"""
+import json
+import math
+import random
+import asyncio
+from itertools import combinations
+
+from sqlalchemy import create_engine, insert
+
+from database import Base, Battle, Response, Rating
+from judge_stats import JudgeStats, fold_battles, judge_stats
+
+PROVIDERS = ["a", "b", "c", "d"]
+QUALITY = {"a": 8.0, "b": 7.0, "c": 6.0, "d": 5.0}
+BIAS = {"a": 1.5, "b": 0.0, "c": 0.0, "d": 0.0}  # Extra points judge "a" gives its own answers
+
+
+def sample_ratings(count: int, seed: int = 7):
+    """(battle_id, judge, model, score) rows; some judges sit battles out"""
+    rng = random.Random(seed)
+    rows = []
+    for battle_id in range(1, count + 1):
+        judges = [j for j in PROVIDERS if rng.random() > 0.2]
+        for judge in judges:
+            for model in PROVIDERS:
+                score = QUALITY[model] + rng.gauss(0, 1.2) + (BIAS[judge] if judge == model else 0.0)
+                rows.append((battle_id, judge, model, round(min(max(score, 0), 10))))
+    return rows
+
+
+def reference_tau(x, y):
+    """Kendall tau-b of two equal-length score lists"""
+    concordance = norm_x = norm_y = 0
+    for i, j in combinations(range(len(x)), 2):
+        sx, sy = (x[i] > x[j]) - (x[i] < x[j]), (y[i] > y[j]) - (y[i] < y[j])
+        concordance += sx * sy
+        norm_x += sx * sx
+        norm_y += sy * sy
+    return concordance / math.sqrt(norm_x * norm_y) if norm_x and norm_y else None
+
+
+def reference_alpha(units):
+    """Krippendorff's alpha, interval metric, from the coincidence definition"""
+    units = [u for u in units if len(u) >= 2]
+    values = [v for u in units for v in u]
+    n = len(values)
+    observed = sum(
+        sum((a - b) ** 2 for i, a in enumerate(u) for j, b in enumerate(u) if i != j) / (len(u) - 1)
+        for u in units
+    ) / n
+    expected = sum((a - b) ** 2 for i, a in enumerate(values) for j, b in enumerate(values) if i != j) / (n * (n - 1))
+    return 1 - observed / expected
+
+
+def by_battle(rows):
+    battles = {}
+    for battle_id, judge, model, score in rows:
+        battles.setdefault(battle_id, {}).setdefault(judge, {})[model] = score
+    return battles
+
+
+def test_matches_reference_loops():
+    rows = sample_ratings(120)
+    stats = JudgeStats()
+    stats.add_ratings(*zip(*rows))
+    summary = stats.summary()
+
+    battles = by_battle(rows)
+    for a, b in combinations(PROVIDERS, 2):
+        taus = []
+        for scores in battles.values():
+            if a in scores and b in scores:
+                tau = reference_tau([scores[a][m] for m in PROVIDERS], [scores[b][m] for m in PROVIDERS])
+                if tau is not None:
+                    taus.append(tau)
+        pair = summary["agreement"]["judge_pairs"][f"{a}|{b}"]
+        assert pair["battles"] == len(taus)
+        assert abs(pair["kendall_tau"] - sum(taus) / len(taus)) < 1e-9
+
+    units = [[scores[j][m] for j in scores] for scores in battles.values() for m in PROVIDERS]
+    assert abs(summary["agreement"]["krippendorff_alpha"] - reference_alpha(units)) < 1e-9
+
+    for judge in PROVIDERS:
+        scores = [s for _, j, _, s in rows if j == judge]
+        assert summary["judges"][judge]["ratings"] == len(scores)
+        assert abs(summary["judges"][judge]["mean_score"] - sum(scores) / len(scores)) < 1e-9
+
+
+def insert_battles(conn, rows, battle_ids):
+    for battle_id in battle_ids:
+        conn.execute(insert(Battle.__table__).values(id=battle_id, prompt="p"))
+        response_ids = {}
+        for model in PROVIDERS:
+            response_ids[model] = conn.execute(
+                insert(Response.__table__).values(battle_id=battle_id, model_name=model, response_text="r")
+            ).inserted_primary_key[0]
+        ratings = [
+            {"battle_id": b, "response_id": response_ids[m], "judge_model": j, "score": s, "reasoning": ""}
+            for b, j, m, s in rows if b == battle_id
+        ]
+        if ratings:
+            conn.execute(insert(Rating.__table__), ratings)
+
+
+def test_self_preference_and_incremental_refresh():
+    rows = sample_ratings(600)
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    incremental = JudgeStats()
+    # Battles arrive between two refreshes; battle 600 has no ratings at all
+    with engine.begin() as conn:
+        insert_battles(conn, rows, range(1, 251))
+    with engine.connect() as conn:
+        fold_battles(incremental, conn, incremental.max_battle_id)
+    with engine.begin() as conn:
+        insert_battles(conn, [row for row in rows if row[0] != 600], range(251, 601))
+    with engine.connect() as conn:
+        fold_battles(incremental, conn, incremental.max_battle_id, chunk_size=64)
+        whole = JudgeStats()
+        fold_battles(whole, conn, 0)
+
+    expected, actual = whole.summary(), incremental.summary()
+    assert expected["battles"] == actual["battles"] == 600
+    assert expected["rated_battles"] == actual["rated_battles"] < 600
+    assert abs(expected["agreement"]["krippendorff_alpha"] - actual["agreement"]["krippendorff_alpha"]) < 1e-9
+    for judge in PROVIDERS:
+        assert abs(expected["judges"][judge]["self_preference"] - actual["judges"][judge]["self_preference"]) < 1e-9
+
+    judges = expected["judges"]
+    assert 1.0 < judges["a"]["self_preference"] < 2.0
+    for judge in ("b", "c", "d"):
+        assert abs(judges[judge]["self_preference"]) < 0.4, judge
+
+
+def test_endpoint_payload_is_plain_json():
+    import main
+
+    stats = JudgeStats()
+    stats.add_ratings(*zip(*sample_ratings(80)))
+    saved = judge_stats.summary
+    judge_stats.summary = stats.summary()
+    try:
+        payload = asyncio.run(main.get_judge_stats())
+    finally:
+        judge_stats.summary = saved
+
+    def check(value):
+        assert value is None or type(value) in (str, int, float, bool, dict, list), type(value)
+        for item in value.values() if isinstance(value, dict) else value if isinstance(value, list) else ():
+            check(item)
+
+    check(payload)
+    # The stdlib encoder, without any conversion hook, accepts it as is
+    assert json.loads(json.dumps(payload, allow_nan=False))["judges"].keys() == set(PROVIDERS)
+
+
+if __name__ == "__main__":
+    test_matches_reference_loops()
+    test_self_preference_and_incremental_refresh()
+    test_endpoint_payload_is_plain_json()
+    print("✅ Judge statistics checks OK")
@@ -0,0 +1,126 @@
+"""
+Checks for the statistical leaderboard (leaderboard.py): the vectorized
+comparison loader agrees with pairwise_outcomes, Bradley-Terry recovers
+known strengths inside its bootstrap intervals, and the background refit
+runs again after battles are re-scored.
+
+Run with pytest, or directly: python test_leaderboard.py
+"""
+import random
+import asyncio
+
+import numpy as np
+from sqlalchemy import create_engine, insert
+
+from database import Base, Battle, Response
+from leaderboard import pairwise_outcomes, load_comparisons, fit_comparisons, RatingRefitter
+
+TRUE_RATINGS = {"a": 1150.0, "b": 1050.0, "c": 950.0, "d": 850.0}
+
+
+def sample_battles(count: int, seed: int = 3):
+    """Battles of the four models; a response's score is its strength plus noise"""
+    rng = random.Random(seed)
+    battles = []
+    for _ in range(count):
+        scores = {m: r / 100 + rng.gauss(0, 1.5) for m, r in TRUE_RATINGS.items()}
+        # Round so some pairs tie
+        scores = {m: round(s, 1) for m, s in scores.items()}
+        winner = max(sorted(scores), key=scores.get)
+        battles.append([(m, s, 1 if m == winner else 0) for m, s in scores.items()])
+    return battles
+
+
+def test_loader_matches_pairwise_outcomes():
+    battles = sample_battles(300)
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for battle_id, responses in enumerate(battles, 1):
+            conn.execute(insert(Battle.__table__).values(id=battle_id, prompt="p"))
+            conn.execute(insert(Response.__table__), [
+                {"battle_id": battle_id, "model_name": m, "response_text": "r", "average_score": s, "is_winner": w}
+                for m, s, w in responses
+            ])
+    with engine.connect() as conn:
+        loaded = load_comparisons(conn)
+
+    expected = {}
+    for responses in battles:
+        for model_a, model_b, outcome in pairwise_outcomes(responses):
+            key = tuple(sorted((model_a, model_b)))
+            expected[key] = expected.get(key, 0.0) + (outcome if key[0] == model_a else 1 - outcome)
+    actual = {}
+    for a, b, outcome in zip(loaded["a"], loaded["b"], loaded["outcome"]):
+        model_a, model_b = loaded["models"][a], loaded["models"][b]
+        key = tuple(sorted((model_a, model_b)))
+        actual[key] = actual.get(key, 0.0) + (outcome if key[0] == model_a else 1 - outcome)
+    assert loaded["battles"] == len(battles)
+    assert expected.keys() == actual.keys()
+    for key in expected:
+        assert abs(expected[key] - actual[key]) < 1e-9, key
+
+
+def test_bradley_terry_recovers_strengths():
+    rng = np.random.default_rng(5)
+    models = list(TRUE_RATINGS)
+    ratings = np.array([TRUE_RATINGS[m] for m in models])
+    battles = 3000
+    a, b, battle = [], [], []
+    for i in range(len(models)):
+        for j in range(i + 1, len(models)):
+            a.append(np.full(battles, i))
+            b.append(np.full(battles, j))
+            battle.append(np.arange(battles))
+    a, b, battle = np.concatenate(a), np.concatenate(b), np.concatenate(battle)
+    p_a = 1 / (1 + 10 ** ((ratings[b] - ratings[a]) / 400))
+    outcome = (rng.random(len(a)) < p_a).astype(float)
+
+    fit = fit_comparisons(
+        {"models": models, "a": a, "b": b, "outcome": outcome, "battle": battle, "battles": battles},
+        rounds=100
+    )
+    fitted = fit["models"]
+    # The fit is centred on 1000 like TRUE_RATINGS
+    for model, true_rating in TRUE_RATINGS.items():
+        assert fitted[model]["ci_low"] <= fitted[model]["rating"] <= fitted[model]["ci_high"]
+        assert fitted[model]["ci_low"] - 10 <= true_rating <= fitted[model]["ci_high"] + 10, model
+    assert [m for m, _ in sorted(fitted.items(), key=lambda item: -item[1]["rating"])] == models
+
+
+def test_refit_after_rescoring():
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+    import persistence
+    from recompute import recompute_winners
+    from storage import create_write_engine
+    from benchmarks.common import create_schema, make_results, temp_database_path
+
+    async def run():
+        path = temp_database_path("refit")
+        engine = create_write_engine(path)
+        await create_schema(engine)
+        sessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        async with sessions() as session:
+            for _ in range(20):
+                results = make_results(20)
+                await persistence.persist_battle(session, results["prompt"], results)
+            await session.commit()
+
+        refitter = RatingRefitter(path, interval_s=60, rounds=10)
+        async with sessions() as session:
+            assert await refitter.refit(session)
+            assert not await refitter.refit(session)
+            # Same battles, same ids: only the winners are decided again
+            await recompute_winners(session, policy="average/v1")
+            assert await refitter.refit(session)
+            assert not await refitter.refit(session)
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_loader_matches_pairwise_outcomes()
+    test_bradley_terry_recovers_strengths()
+    test_refit_after_rescoring()
+    print("✅ Leaderboard checks OK")
@@ -0,0 +1,95 @@
+"""
+Checks for provider health (provider_health.py): reads running while a
+checkpoint commits count every call exactly once, and a failed checkpoint
+keeps its counts for the next one.
+
+Run with pytest, or directly: python test_provider_health.py
+"""
+import asyncio
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from provider_health import ProviderHealth
+from storage import DatabaseWriter, create_write_engine, create_read_engine
+from benchmarks.common import create_schema, temp_database_path
+
+
+async def make_health(name: str):
+    path = temp_database_path(name)
+    write_engine = create_write_engine(path)
+    await create_schema(write_engine)
+    read_engine = create_read_engine(path)
+    writer = DatabaseWriter(async_sessionmaker(write_engine, class_=AsyncSession, expire_on_commit=False))
+    await writer.start()
+    reads = async_sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+    return ProviderHealth(writer, checkpoint_s=60, retention_days=7), reads, (writer, write_engine, read_engine)
+
+
+async def close(writer, write_engine, read_engine):
+    await writer.stop()
+    await write_engine.dispose()
+    await read_engine.dispose()
+
+
+async def calls(health: ProviderHealth, reads) -> int:
+    async with reads() as session:
+        providers = await health.read(session, hours=1)
+    return providers.get("p", {}).get("response", {}).get("calls", 0)
+
+
+def test_reads_during_checkpoints_count_once():
+    async def run():
+        health, reads, resources = await make_health("health-reads")
+        recorded = 0
+        for _ in range(5):
+            for _ in range(10):
+                health.record("p", "response", 1.5)
+                recorded += 1
+            # Reads start before, during and after the commit; none waits for the writer
+            checkpoint = asyncio.create_task(health.checkpoint())
+            counts = []
+            while not checkpoint.done():
+                counts.append(await calls(health, reads))
+                await asyncio.sleep(0)
+            await checkpoint
+            counts.append(await calls(health, reads))
+            assert set(counts) == {recorded}, counts
+        assert not health.flushing and not health.pending.buckets
+        await close(*resources)
+
+    asyncio.run(run())
+
+
+def test_failed_checkpoint_keeps_counts():
+    async def run():
+        health, reads, resources = await make_health("health-failure")
+        writer = resources[0]
+        health.record("p", "response", 2.0)
+        health.record("p", "response", 9.0, attempts=3, failed=True)
+
+        async def failing(job):
+            raise RuntimeError("database is locked")
+
+        health.writer = type("FailingWriter", (), {"submit": staticmethod(failing)})()
+        try:
+            await health.checkpoint()
+            assert False, "the checkpoint error is raised"
+        except RuntimeError:
+            pass
+        assert await calls(health, reads) == 2
+
+        health.writer = writer
+        health.record("p", "response", 3.0)
+        await health.checkpoint()
+        async with reads() as session:
+            summary = (await health.read(session, hours=1))["p"]["response"]
+        assert (summary["calls"], summary["errors"], summary["retries"]) == (3, 1, 1)
+        await close(*resources)
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_reads_during_checkpoints_count_once()
+    test_failed_checkpoint_keeps_counts()
+    print("✅ Provider health checks OK")
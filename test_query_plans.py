@@ -0,0 +1,124 @@
+"""
+Query-plan regression test for the hot API and maintenance queries.
+Builds an empty database from the models, runs EXPLAIN QUERY PLAN on each
+query and fails if SQLite would read battles, responses or ratings with a
+full table scan instead of an index.
+
+Run with pytest, or directly: python test_query_plans.py
+"""
+import re
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import create_engine, select, delete, func, or_, tuple_
+from sqlalchemy.orm import joinedload
+
+from database import Base, Battle, Response, Rating, Blob, WinnerDecision
+from queries import battle_list_query, encode_cursor
+
+HOT_TABLES = {"battles", "responses", "ratings"}
+
+CURSOR = encode_cursor(datetime(2025, 1, 1), 1000)
+
+# "SCAN <table>" or "SCAN <alias>_N LEFT-JOIN" etc.; SQLAlchemy aliases tables as <table>_N
+PLAN_TABLE_RE = re.compile(r"^(SCAN|SEARCH) (\w+?)(?:_\d+)?\b")
+
+
+def full_scan_table(line: str):
+    """Table read by a plan line if it reads it without a real index, else None"""
+    match = PLAN_TABLE_RE.match(line)
+    if not match:
+        return None
+    # A SCAN without USING reads every row; an AUTOMATIC index is built by scanning the table
+    if (match.group(1) == "SCAN" and " USING " not in line) or "AUTOMATIC" in line:
+        return match.group(2)
+    return None
+
+
+def hot_queries():
+    """(name, statement) for the queries behind the endpoints and scripts"""
+    return [
+        ("get_battles: first page", battle_list_query(51)),
+        ("get_battles: next page", battle_list_query(51, cursor=CURSOR)),
+        ("get_battles: by winner", battle_list_query(51, cursor=CURSOR, winner="openai")),
+        ("get_battles: by model", battle_list_query(51, cursor=CURSOR, model="openai")),
+        ("get_battles: date range", battle_list_query(51, since=datetime(2025, 1, 1), until=datetime(2025, 2, 1))),
+        ("get_battle: battle + responses", select(Battle).where(Battle.id == 1)
+            .options(joinedload(Battle.responses))),
+        ("get_battle: ratings", select(Rating).where(Rating.response_id.in_([1, 2, 3, 4]))),
+        ("get_battle_image", select(Battle.image_hash, Blob.mime_type)
+            .join(Blob, Blob.hash == Battle.image_hash).where(Battle.id == 1)),
+        ("rebuild_stats: wins per model", select(Response.model_name, func.count(Response.id))
+            .where(Response.is_winner == 1).group_by(Response.model_name)),
+        ("rebuild_stats: average per model", select(Response.model_name, func.avg(Response.average_score))
+            .group_by(Response.model_name)),
+        ("delete_battle: response totals", select(Response.model_name, Response.average_score, Response.is_winner)
+            .where(Response.battle_id == 1)),
+        ("delete_battle: ratings", delete(Rating).where(Rating.battle_id == 1)),
+        ("delete_battle: responses", delete(Response).where(Response.battle_id == 1)),
+        ("delete_battle: battle", delete(Battle).where(Battle.id == 1)),
+        ("recompute: battle chunk", select(Battle.id, Battle.winner_model)
+            .where(Battle.id > 1000).order_by(Battle.id).limit(2000)),
+        ("recompute: stale battles", select(Battle.id)
+            .where(or_(Battle.winner_policy.is_(None), Battle.winner_policy < "tiebreaker/v1",
+                       Battle.winner_policy > "tiebreaker/v1"))),
+        ("recompute: decisions of battle", delete(WinnerDecision).where(WinnerDecision.battle_id == 1)),
+        ("recompute: chunk responses", select(Response.battle_id, Response.model_name, Response.average_score,
+            Response.is_winner).where(Response.battle_id.in_([1, 2, 3])).order_by(Response.battle_id)),
+        ("recompute: chunk ratings", select(Rating.battle_id, Rating.judge_model, Response.model_name, Rating.score)
+            .join(Response, Response.id == Rating.response_id)
+            .where(Rating.battle_id.in_([1, 2, 3])).order_by(Rating.battle_id)),
+        ("export: battle chunk by id", select(Battle.id, Battle.prompt)
+            .where(Battle.id > 1000).order_by(Battle.id).limit(500)),
+        ("export: battle chunk by date", select(Battle.id, Battle.prompt)
+            .where(tuple_(Battle.created_at, Battle.id) > tuple_(datetime(2025, 1, 1), 1000),
+                   Battle.created_at >= datetime(2025, 1, 1), Battle.created_at < datetime(2025, 2, 1))
+            .order_by(Battle.created_at, Battle.id).limit(500)),
+        ("export: chunk ratings", select(Rating.response_id, Rating.judge_model, Rating.score)
+            .where(Rating.battle_id.in_([1, 2, 3])).order_by(Rating.battle_id, Rating.id)),
+        ("import: stored content hashes", select(Battle.content_hash)
+            .where(Battle.content_hash.in_(["a" * 64, "b" * 64]))),
+    ]
+
+
+def explain(conn, statement) -> list:
+    sql = str(statement.compile(conn.engine, compile_kwargs={"literal_binds": True}))
+    rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    return [row[-1] for row in rows]
+
+
+def find_full_scans():
+    """Return {query name: [plan lines]} for every hot query with a full scan"""
+    path = Path(tempfile.mkdtemp(prefix="query-plans-")) / "plans.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+
+    failures = {}
+    with engine.connect() as conn:
+        for name, statement in hot_queries():
+            plan = explain(conn, statement)
+            scans = [line for line in plan if full_scan_table(line) in HOT_TABLES]
+            if scans:
+                failures[name] = plan
+    engine.dispose()
+    return failures
+
+
+def test_hot_queries_use_indexes():
+    failures = find_full_scans()
+    assert not failures, "Full table scans in hot queries:\n" + "\n".join(
+        f"  {name}: {plan}" for name, plan in failures.items()
+    )
+
+
+if __name__ == "__main__":
+    failures = find_full_scans()
+    for name, _ in hot_queries():
+        status = "❌ FULL SCAN" if name in failures else "✅"
+        print(f"{status} {name}")
+        if name in failures:
+            for line in failures[name]:
+                print(f"     {line}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,134 @@
+"""
+Checks for the serialized response cache (response_cache.py): invalidation
+by data version, 304s on If-None-Match, weak ETags for compressed bodies
+and LRU eviction.
+
+Run with pytest, or directly: python test_response_cache.py
+"""
+import gzip
+import json
+import asyncio
+
+from fastapi import Request
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+import model_stats
+from database import Base
+from response_cache import ResponseCache
+
+BATTLE = {"id": 1, "prompt": "p", "responses": [{"model": "a", "text": "the judge explains the answer " * 100}]}
+
+
+def make_request(**headers) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/api/battle/1",
+        "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()],
+    })
+
+
+def test_hit_then_miss_after_data_version_bump():
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        sessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        cache = ResponseCache(max_entries=8)
+        async with sessions() as session:
+            version = await model_stats.read_data_version(session)
+            assert cache.get(("battle", 1), version) is None
+            cache.put(("battle", 1), version, BATTLE)
+            assert json.loads(cache.get(("battle", 1), version).body) == BATTLE
+
+            # A battle write bumps the version in its own transaction
+            await model_stats.bump_data_version(session)
+            await session.commit()
+            assert await model_stats.read_data_version(session) == version + 1
+            assert cache.get(("battle", 1), version + 1) is None
+        assert cache.stats["hits"] == 1 and cache.stats["misses"] == 2
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_not_modified_and_weak_etags():
+    cache = ResponseCache(max_entries=8)
+    entry = cache.put(("battle", 1), 1, BATTLE)
+
+    response = cache.respond(make_request(), entry)
+    assert response.status_code == 200 and response.headers["etag"] == entry.etag
+    assert json.loads(response.body) == BATTLE
+
+    assert cache.respond(make_request(if_none_match=entry.etag), entry).status_code == 304
+    assert cache.respond(make_request(if_none_match=f'"other", W/{entry.etag}'), entry).status_code == 304
+    assert cache.respond(make_request(if_none_match='"other"'), entry).status_code == 200
+
+    # Compressed bytes differ from the identity body: weak ETag, and it still validates
+    response = cache.respond(make_request(accept_encoding="gzip"), entry)
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == f"W/{entry.etag}"
+    assert gzip.decompress(response.body) == entry.body
+    assert entry.encoded["gzip"] == response.body
+    response = cache.respond(make_request(accept_encoding="gzip", if_none_match=f"W/{entry.etag}"), entry)
+    assert response.status_code == 304 and response.headers["etag"] == f"W/{entry.etag}"
+    assert cache.stats["not_modified"] == 3
+
+
+def test_lru_eviction():
+    cache = ResponseCache(max_entries=2)
+    for battle_id in (1, 2):
+        cache.put(("battle", battle_id), 1, {"id": battle_id})
+    assert cache.get(("battle", 1), 1) is not None  # Now the most recently used
+    cache.put(("battle", 3), 1, {"id": 3})
+    assert list(cache.entries) == [("battle", 1), ("battle", 3)]
+    assert cache.get(("battle", 2), 1) is None
+
+
+def test_battle_revalidated_after_id_reuse():
+    import main
+    import persistence
+    from storage import create_write_engine
+    from benchmarks.common import create_schema, make_results, temp_database_path
+
+    async def run():
+        engine = create_write_engine(temp_database_path("battle-cache"))
+        await create_schema(engine)
+        sessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+        async def save(results):
+            async with sessions() as session:
+                battle_id, _ = await persistence.persist_battle(session, results["prompt"], results)
+                await session.commit()
+                return battle_id
+
+        async def get(battle_id, **headers):
+            async with sessions() as session:
+                return await main.get_battle(battle_id, make_request(**headers), "full", session)
+
+        await save(make_results(20))
+        battle_id = await save(make_results(20))
+        first = await get(battle_id)
+        assert first.headers["cache-control"] == "no-cache"
+        assert (await get(battle_id, if_none_match=first.headers["etag"])).status_code == 304
+
+        # Delete it and save another battle: SQLite hands out the same id again
+        async with sessions() as session:
+            assert (await persistence.delete_battle(session, battle_id))[0]
+            await session.commit()
+        assert await save(make_results(20)) == battle_id
+        second = await get(battle_id, if_none_match=first.headers["etag"])
+        assert second.status_code == 200 and second.headers["cache-control"] == "no-cache"
+        assert second.headers["etag"] != first.headers["etag"]
+        assert json.loads(second.body)["prompt"] != json.loads(first.body)["prompt"]
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_hit_then_miss_after_data_version_bump()
+    test_not_modified_and_weak_etags()
+    test_lru_eviction()
+    test_battle_revalidated_after_id_reuse()
+    print("✅ Response cache checks OK")
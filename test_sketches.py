@@ -0,0 +1,52 @@
+"""
+Checks for the DDSketch used by the daily rollups (sketches.py): quantiles
+stay within the relative accuracy, and merging, unmerging and serializing
+sketches loses nothing.
+
+Run with pytest, or directly: python test_sketches.py
+"""
+import numpy as np
+
+from sketches import DDSketch
+
+
+def latencies(count: int, seed: int):
+    rng = np.random.default_rng(seed)
+    return rng.lognormal(mean=1.0, sigma=0.8, size=count)
+
+
+def test_quantiles_within_relative_accuracy():
+    values = latencies(20000, 1)
+    sketch = DDSketch(0.01)
+    sketch.add_many(values)
+    ordered = np.sort(values)
+    for q in (0.01, 0.25, 0.5, 0.9, 0.99, 0.999):
+        exact = ordered[int(q * (len(values) - 1))]
+        assert abs(sketch.quantile(q) - exact) <= 0.01 * exact + 1e-12, q
+    assert sketch.count == len(values)
+    assert abs(sketch.mean() - values.mean()) < 1e-9
+
+
+def test_merge_unmerge_and_bytes():
+    first, second = latencies(500, 2), latencies(700, 3)
+    a, b, both = DDSketch(), DDSketch(), DDSketch()
+    a.add_many(first)
+    for value in second:
+        b.add(value)
+    both.add_many(np.concatenate([first, second]))
+
+    merged = DDSketch.from_bytes(a.to_bytes())
+    merged.merge(DDSketch.from_bytes(b.to_bytes()))
+    assert merged.bins == both.bins and merged.count == both.count
+    assert merged.quantile(0.9) == both.quantile(0.9)
+
+    merged.merge(b, sign=-1)
+    assert merged.bins == a.bins and merged.count == a.count
+    merged.merge(a, sign=-1)
+    assert merged.count == 0 and merged.quantile(0.5) is None
+
+
+if __name__ == "__main__":
+    test_quantiles_within_relative_accuracy()
+    test_merge_unmerge_and_bytes()
+    print("✅ Sketch checks OK")
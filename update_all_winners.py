@@ -1,234 +1,155 @@
 """
-Update all battle winners in the database using the new tiebreaker logic.
-This will recalculate winners for all battles and update the is_winner field.
+Update battle winners in the database using a winner policy (winner_policies.py).
+
+Recalculates the winner of every battle (or of one battle) with the live
+policy (settings.winner_policy, or --policy) and updates is_winner,
+battles.winner_model/winner_policy and the leaderboard's win counts. The
+bulk run streams battles in chunks through recompute.py and only writes
+the battles whose winner or policy changed. Every decision is also kept
+per policy in winner_decisions.
+
+Usage:
+    python update_all_winners.py [--stale] [--dry-run] [--chunk-size 2000] [--workers N]
+    python update_all_winners.py --shadow --policy average/v1
+    python update_all_winners.py --compare tiebreaker/v1 average/v1
+    python update_all_winners.py --list-policies
+    python update_all_winners.py <battle_id>
 """
+import time
 import asyncio
-from sqlalchemy import select, update
-from database import Battle, Response, Rating, init_db, AsyncSessionLocal
-from battle_logic import determine_winner
+import argparse
+from sqlalchemy import select
+from database import Battle, init_db, AsyncSessionLocal
+from recompute import (
+    BATTLE_KEY_COLUMNS, load_battles, resolve_battle, resolve_chunk, apply_changes, recompute_winners
+)
+from winner_policies import POLICIES, get_policy, current_policy, compare_policies
 from llm_clients import model_names
 
 
-async def update_all_battles():
-    """Update winners for all battles using new tiebreaker logic"""
-    
-    # Initialize database
+def print_changes(result):
+    for change in result["changes"]:
+        old = ", ".join(model_names.get(m, m) for m in change.old_winners) or "None"
+        new = model_names.get(change.new_winner, change.new_winner)
+        print(f"  Battle {change.battle_id}: {old} → {new} ({change.method})")
+
+
+async def update_all_battles(policy: str, stale_only: bool = False, shadow: bool = False,
+                             chunk_size: int = 2000, workers: int = 0, dry_run: bool = False):
+    """Recompute winners (all battles, or only stale ones), writing only what changed"""
+
     await init_db()
-    
+
+    start = time.perf_counter()
     async with AsyncSessionLocal() as db:
-        # Get all battles
-        battles_result = await db.execute(
-            select(Battle).order_by(Battle.id)
+        totals = await recompute_winners(
+            db, policy=policy, stale_only=stale_only, shadow=shadow, chunk_size=chunk_size,
+            workers=workers, dry_run=dry_run, on_chunk=print_changes
         )
-        battles = battles_result.scalars().all()
-        
-        print(f"📊 Found {len(battles)} battles to process\n")
-        
-        updated_count = 0
-        tie_count = 0
-        
-        for battle in battles:
-            print(f"Processing Battle {battle.id}...")
-            
-            # Get all responses for this battle
-            responses_result = await db.execute(
-                select(Response).where(Response.battle_id == battle.id)
-            )
-            responses = responses_result.scalars().all()
-            
-            if not responses:
-                print(f"  ⚠️  No responses found, skipping\n")
-                continue
-            
-            # Get all ratings for this battle
-            ratings_result = await db.execute(
-                select(Rating).where(Rating.battle_id == battle.id)
-            )
-            ratings = ratings_result.scalars().all()
-            
-            if not ratings:
-                print(f"  ⚠️  No ratings found, skipping\n")
-                continue
-            
-            # Build average_scores dict
-            average_scores = {}
-            for response in responses:
-                average_scores[response.model_name] = response.average_score or 0.0
-            
-            # Build parsed_ratings structure
-            parsed_ratings = {}
-            all_models = list(average_scores.keys())
-            
-            # Group ratings by judge
-            for rating in ratings:
-                judge_model = rating.judge_model
-                response_model = None
-                
-                # Find which model this rating belongs to
-                for resp in responses:
-                    if resp.id == rating.response_id:
-                        response_model = resp.model_name
-                        break
-                
-                if not response_model:
-                    continue
-                
-                if judge_model not in parsed_ratings:
-                    parsed_ratings[judge_model] = {}
-                
-                parsed_ratings[judge_model][response_model] = {
-                    "score": rating.score,
-                    "reasoning": rating.reasoning or ""
-                }
-            
-            # Determine new winner using tiebreaker logic
-            # Suppress verbose tiebreaker output during batch processing
-            import sys
-            from io import StringIO
-            old_stdout = sys.stdout
-            sys.stdout = StringIO()  # Suppress print output
-            
-            new_winner, tiebreaker_info = determine_winner(
-                average_scores, parsed_ratings, all_models
-            )
-            
-            sys.stdout = old_stdout  # Restore stdout
-            
-            # Get old winner
-            old_winner = next((r.model_name for r in responses if r.is_winner == 1), None)
-            
-            # Update all responses to set is_winner correctly
-            for response in responses:
-                new_is_winner = 1 if response.model_name == new_winner else 0
-                
-                if response.is_winner != new_is_winner:
-                    response.is_winner = new_is_winner
-                    updated_count += 1
-            
-            # Show results
-            if tiebreaker_info.get('tie_occurred'):
-                tie_count += 1
-                method = tiebreaker_info.get('method', 'unknown')
-                print(f"  ⚔️  Tie detected and resolved via: {method}")
-            
-            if old_winner != new_winner:
-                print(f"  ⚠️  Winner changed: {model_names.get(old_winner, old_winner)} → {model_names.get(new_winner, new_winner)}")
-            else:
-                print(f"  ✅ Winner unchanged: {model_names.get(new_winner, new_winner)}")
-            
-            print()
-        
-        # Commit all changes
-        await db.commit()
-        
-        print(f"{'='*60}")
-        print(f"✅ Update complete!")
-        print(f"   Total battles processed: {len(battles)}")
-        print(f"   Battles with ties: {tie_count}")
-        print(f"   Winner records updated: {updated_count}")
-        print(f"{'='*60}")
-
-
-async def update_single_battle(battle_id: int):
+    elapsed = time.perf_counter() - start
+
+    changed = "differing from the live winner" if shadow else "that would change" if dry_run else "changed"
+    print(f"{'='*60}")
+    print(f"✅ {'Dry run' if dry_run else 'Update'} with {policy} complete in {elapsed:.1f}s!")
+    print(f"   {'Stale battles' if stale_only else 'Total battles'} processed: {totals['battles']}")
+    print(f"   Skipped (no responses or ratings): {totals['skipped']}")
+    print(f"   Battles with ties: {totals['ties']}")
+    print(f"   Winners {changed}: {totals['changed']}")
+    print(f"   Decisions {'to record' if dry_run else 'recorded'}: {totals['decided']}")
+    print(f"{'='*60}")
+
+
+async def update_single_battle(battle_id: int, policy: str):
     """Update winner for a single battle"""
-    
+
     await init_db()
-    
+
     async with AsyncSessionLocal() as db:
-        # Get the battle
         result = await db.execute(
-            select(Battle).where(Battle.id == battle_id)
+            select(*BATTLE_KEY_COLUMNS).where(Battle.id == battle_id)
         )
-        battle = result.scalar_one_or_none()
-        
-        if not battle:
+        row = result.first()
+
+        if not row:
             print(f"❌ Battle {battle_id} not found!")
             return
-        
-        print(f"📊 Updating Battle {battle_id}\n")
-        
-        # Get all responses
-        responses_result = await db.execute(
-            select(Response).where(Response.battle_id == battle_id)
-        )
-        responses = responses_result.scalars().all()
-        
-        # Get all ratings
-        ratings_result = await db.execute(
-            select(Rating).where(Rating.battle_id == battle_id)
-        )
-        ratings = ratings_result.scalars().all()
-        
-        # Build average_scores dict
-        average_scores = {}
-        for response in responses:
-            average_scores[response.model_name] = response.average_score or 0.0
-        
-        # Build parsed_ratings structure
-        parsed_ratings = {}
-        all_models = list(average_scores.keys())
-        
-        for rating in ratings:
-            judge_model = rating.judge_model
-            response_model = None
-            
-            for resp in responses:
-                if resp.id == rating.response_id:
-                    response_model = resp.model_name
-                    break
-            
-            if not response_model:
-                continue
-            
-            if judge_model not in parsed_ratings:
-                parsed_ratings[judge_model] = {}
-            
-            parsed_ratings[judge_model][response_model] = {
-                "score": rating.score,
-                "reasoning": rating.reasoning or ""
-            }
-        
-        # Determine new winner
-        new_winner, tiebreaker_info = determine_winner(
-            average_scores, parsed_ratings, all_models
-        )
-        
-        # Get old winner
-        old_winner = next((r.model_name for r in responses if r.is_winner == 1), None)
-        
-        # Update all responses
-        updated = False
-        for response in responses:
-            new_is_winner = 1 if response.model_name == new_winner else 0
-            
-            if response.is_winner != new_is_winner:
-                response.is_winner = new_is_winner
-                updated = True
-        
-        # Commit changes
-        if updated:
+
+        print(f"📊 Updating Battle {battle_id} with {policy}\n")
+
+        battle = (await load_battles(db, [tuple(row)]))[0]
+        new_winner, tiebreaker_info = resolve_battle(battle, get_policy(policy), verbose=True)
+        if new_winner is None:
+            print(f"⚠️  No responses or ratings found, nothing to update")
+            return
+
+        old_winner = next((model for model, _, is_winner in battle.responses if is_winner == 1), None)
+        result = resolve_chunk([battle], policy)
+
+        # Commit changes (and move the win in the materialized leaderboard)
+        if result["decisions"]:
+            await apply_changes(db, result, policy)
             await db.commit()
+        if result["changes"]:
             print(f"✅ Winner updated in database!")
         else:
             print(f"ℹ️  Winner already correct, no update needed")
-        
+
         print(f"\nResults:")
-        print(f"  Old winner: {model_names.get(old_winner, 'None') if old_winner else 'None'}")
+        print(f"  Old winner: {model_names.get(old_winner, 'None') if old_winner else 'None'}"
+              f" (picked by {battle.winner_policy or 'unknown policy'})")
         print(f"  New winner: {model_names.get(new_winner, new_winner)}")
         if tiebreaker_info.get('tie_occurred'):
             print(f"  Tiebreaker method: {tiebreaker_info.get('method', 'unknown')}")
 
 
+async def compare(policy_a: str, policy_b: str):
+    await init_db()
+
+    async with AsyncSessionLocal() as db:
+        comparison = await compare_policies(db, policy_a, policy_b)
+
+    if not comparison["battles"]:
+        print(f"ℹ️  No battle has decisions from both {policy_a} and {policy_b} "
+              f"(record them with --shadow --policy <key>)")
+        return
+    print(f"📊 {policy_a} vs {policy_b} over {comparison['battles']} battles")
+    print(f"   Same winner: {comparison['same_winner']} ({comparison['agreement']:.1%})")
+    wins_a, wins_b = comparison["wins"][policy_a], comparison["wins"][policy_b]
+    for model in sorted(set(wins_a) | set(wins_b), key=lambda m: -wins_a.get(m, 0)):
+        print(f"   {model_names.get(model, model)}: {wins_a.get(model, 0)} → {wins_b.get(model, 0)} wins")
+
+
 if __name__ == "__main__":
-    import sys
-    
-    if len(sys.argv) > 1:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("battle_id", type=int, nargs="?", help="Only update this battle")
+    parser.add_argument("--policy", help="Winner policy key (default: settings.winner_policy)")
+    parser.add_argument("--stale", action="store_true",
+                        help="Only battles not decided by the policy, or whose ratings changed since")
+    parser.add_argument("--shadow", action="store_true",
+                        help="Record the policy's decisions for comparison without changing winners")
+    parser.add_argument("--compare", nargs=2, metavar=("POLICY_A", "POLICY_B"),
+                        help="Compare the winners two policies picked")
+    parser.add_argument("--list-policies", action="store_true")
+    parser.add_argument("--dry-run", action="store_true", help="Print the winners that would change without writing")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="Battles read and written per transaction")
+    parser.add_argument("--workers", type=int, default=0, help="Resolve chunks in this many processes (0: in-process)")
+    args = parser.parse_args()
+
+    policy = get_policy(args.policy).key if args.policy else current_policy().key
+
+    if args.list_policies:
+        for key, known in POLICIES.items():
+            print(f"{'*' if key == current_policy().key else ' '} {key}: {known.description}")
+    elif args.compare:
+        asyncio.run(compare(*args.compare))
+    elif args.battle_id is not None:
         # Update specific battle
-        battle_id = int(sys.argv[1])
-        print(f"Updating winner for Battle {battle_id}...\n")
-        asyncio.run(update_single_battle(battle_id))
+        print(f"Updating winner for Battle {args.battle_id}...\n")
+        asyncio.run(update_single_battle(args.battle_id, policy))
     else:
+        if args.stale and args.shadow:
+            parser.error("--stale and --shadow cannot be combined")
         # Update all battles
-        print("Updating winners for all battles...\n")
-        asyncio.run(update_all_battles())
-
+        print(f"{'Checking' if args.dry_run else 'Updating'} winners for "
+              f"{'stale' if args.stale else 'all'} battles...\n")
+        asyncio.run(update_all_battles(policy, args.stale, args.shadow, args.chunk_size, args.workers, args.dry_run))
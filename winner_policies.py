@@ -0,0 +1,116 @@
+"""
+Named, versioned winner policies.
+
+A policy turns a battle's average scores and judge ratings into a winner.
+Its key ("tiebreaker/v1") is stored in battles.winner_policy next to the
+winner it picked, and every decision is also kept in winner_decisions, so
+winners picked by an older policy stay available for comparison after the
+live policy (settings.winner_policy) changes.
+
+When the logic behind a policy changes, register it again with the next
+version and point settings.winner_policy at the new key; battles decided
+by any other key are then stale and `python update_all_winners.py --stale`
+re-scores only those. Battles whose ratings were inserted, changed or
+deleted after their winner was picked are stale too: triggers on the
+ratings table reset their winner_policy to NULL (see migrations.py).
+"""
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+from sqlalchemy import select, func
+from sqlalchemy.orm import aliased
+
+from config import settings
+from database import WinnerDecision
+from battle_logic import determine_winner
+
+# (average_scores, parsed_ratings, all_models, verbose) -> (winner, tiebreaker_info)
+DecideFunction = Callable[..., Tuple[str, Dict]]
+
+
+class WinnerPolicy(NamedTuple):
+    name: str
+    version: int
+    description: str
+    decide: DecideFunction
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}/v{self.version}"
+
+
+def highest_average(
+    average_scores: Dict[str, float],
+    parsed_ratings: Dict[str, Dict[str, Dict]],
+    all_models: List[str],
+    verbose: bool = True
+) -> Tuple[str, Dict]:
+    """Highest average score; exact ties go to the alphabetically first model"""
+    max_avg_score = max(average_scores.values())
+    tied_models = sorted(model for model, score in average_scores.items() if abs(score - max_avg_score) < 0.001)
+    tiebreaker_info = {
+        "method": "average_score" if len(tied_models) == 1 else "alphabetical_fallback",
+        "tie_occurred": len(tied_models) > 1,
+        "tied_models": tied_models if len(tied_models) > 1 else [],
+        "tiebreaker_levels_used": ["average_score"] if len(tied_models) > 1 else []
+    }
+    return tied_models[0], tiebreaker_info
+
+
+POLICIES: Dict[str, WinnerPolicy] = {
+    policy.key: policy for policy in [
+        WinnerPolicy(
+            "tiebreaker", 1,
+            "Average score, then max score, lowest variance, head-to-head, alphabetical",
+            determine_winner
+        ),
+        WinnerPolicy("average", 1, "Average score only, alphabetical on ties", highest_average),
+    ]
+}
+
+
+def get_policy(key: str) -> WinnerPolicy:
+    try:
+        return POLICIES[key]
+    except KeyError:
+        raise ValueError(f"Unknown winner policy {key!r} (known: {', '.join(POLICIES)})") from None
+
+
+def current_policy() -> WinnerPolicy:
+    return get_policy(settings.winner_policy)
+
+
+async def compare_policies(session, policy_a: str, policy_b: str) -> Dict:
+    """
+    Compare the winners two policies picked for the battles both decided.
+
+    Returns the number of battles compared, how many got the same winner,
+    and per-model wins under each policy.
+    """
+    a = aliased(WinnerDecision)
+    b = aliased(WinnerDecision)
+    pairs = (
+        select(a.winner_model.label("winner_a"), b.winner_model.label("winner_b"))
+        .join(b, (b.battle_id == a.battle_id) & (b.policy == policy_b))
+        .where(a.policy == policy_a)
+        .subquery()
+    )
+    rows = (await session.execute(
+        select(pairs.c.winner_a, pairs.c.winner_b, func.count())
+        .group_by(pairs.c.winner_a, pairs.c.winner_b)
+    )).all()
+
+    battles = same = 0
+    wins_a: Dict[str, int] = {}
+    wins_b: Dict[str, int] = {}
+    for winner_a, winner_b, count in rows:
+        battles += count
+        if winner_a == winner_b:
+            same += count
+        wins_a[winner_a] = wins_a.get(winner_a, 0) + count
+        wins_b[winner_b] = wins_b.get(winner_b, 0) + count
+    return {
+        "battles": battles,
+        "same_winner": same,
+        "agreement": same / battles if battles else 0.0,
+        "wins": {policy_a: wins_a, policy_b: wins_b},
+    }